@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import psutil
+from fake_procfs import build_fake_procfs, build_fake_sysfs, write_mount_table
+from metrics import MetricsCollector
+from procfs import ProcfsProcessCollector, PsutilProcessCollector
+
+# Runs the MetricsCollector methods against generated /proc, /sys and
+# mount tables and saves time per call and memory use as JSON, so
+# collector changes can be compared across commits:
+#
+#   python bench_collectors.py --output before.json
+#   ...change a collector...
+#   python bench_collectors.py --output after.json --compare before.json
+
+# Process collector backends get_high_freq_data is run with.
+# Each one is built from the fake proc root; add new backends here.
+BACKENDS = {
+    "procfs": lambda proc_root: ProcfsProcessCollector(proc_root=proc_root),
+    "psutil": lambda proc_root: PsutilProcessCollector(),
+}
+
+# Collector method -> the fixture size its cost scales with
+COLLECTORS = {
+    "get_static_data": "mounts",
+    "get_low_freq_data": "mounts",
+    "get_high_freq_data": "pids",
+}
+
+def parse_counts(text):
+    return sorted(int(v) for v in text.split(",") if v.strip())
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(fn, rounds):
+    """
+    Warms up once and times 'rounds' calls, then makes one more call
+    under tracemalloc for its memory use. tracemalloc only sees blocks
+    that are still alive, so 'retained_*' is what a call keeps around
+    and 'peak_kb' is the most it held at once.
+    """
+    fn()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    # Leave out tracemalloc's own bookkeeping
+    growth = [s for s in after.compare_to(before, "filename")
+              if "tracemalloc" not in s.traceback[0].filename]
+    return {
+        "mean_ms": round(sum(times) / len(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+        "peak_kb": round((peak - baseline) / 1024, 1),
+        "retained_kb": round(sum(s.size_diff for s in growth) / 1024, 1),
+        "retained_blocks": sum(s.count_diff for s in growth),
+    }
+
+def report_line(result):
+    return (f"{result['collector']:<20} {result['backend'] or '-':<7} "
+            f"pids={result['pids']:<6} mounts={result['mounts']:<4} "
+            f"{result['mean_ms']:10.2f} ms  peak {result['peak_kb']:9.1f} KB  "
+            f"retained {result['retained_blocks']:6d} blocks")
+
+def run_suite(args):
+    results = []
+    base_mounts = args.mounts[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc_root = os.path.join(tmp, "proc")
+        mount_dir = os.path.join(tmp, "mnt")
+        build_fake_sysfs(os.path.join(tmp, "sys"))
+        psutil.PROCFS_PATH = proc_root
+
+        # MetricsCollector creates its .agent_id file in the working directory
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            print(f"Building fake procfs with {args.pids[0]} pids...")
+            build_fake_procfs(proc_root, args.pids[0])
+            write_mount_table(proc_root, mount_dir, base_mounts)
+            collector = MetricsCollector()
+
+            def record(name, backend, pids, mounts):
+                result = {"collector": name, "backend": backend, "pids": pids, "mounts": mounts}
+                result.update(measure(getattr(collector, name), args.rounds))
+                results.append(result)
+                print(report_line(result))
+
+            # Mount-bound collectors, with the smallest process table
+            for mounts in args.mounts:
+                write_mount_table(proc_root, mount_dir, mounts)
+                collector.mount_table.invalidate() # A regular file never signals a change
+                for name, scales_with in COLLECTORS.items():
+                    if scales_with == "mounts":
+                        record(name, None, args.pids[0], mounts)
+
+            # Process-bound collectors, once per backend
+            write_mount_table(proc_root, mount_dir, base_mounts)
+            collector.mount_table.invalidate()
+            for pids in args.pids:
+                if pids != args.pids[0]:
+                    print(f"Building fake procfs with {pids} pids...")
+                    build_fake_procfs(proc_root, pids)
+                for backend in args.backends:
+                    collector.process_collector = BACKENDS[backend](proc_root)
+                    for name, scales_with in COLLECTORS.items():
+                        if scales_with == "pids":
+                            record(name, backend, pids, base_mounts)
+        finally:
+            os.chdir(cwd)
+            psutil.PROCFS_PATH = "/proc"
+
+    return results
+
+def compare(results, baseline_path):
+    """Prints how each result changed relative to a saved run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["collector"], r["backend"], r["pids"], r["mounts"])
+    old = {key(r): r for r in baseline["results"]}
+
+    print(f"--- Compared with {baseline_path} (commit {baseline.get('commit')}) ---")
+    for result in results:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        ratio = result["mean_ms"] / before["mean_ms"] if before["mean_ms"] else float("inf")
+        print(f"{result['collector']:<20} {result['backend'] or '-':<7} "
+              f"pids={result['pids']:<6} mounts={result['mounts']:<4} "
+              f"{before['mean_ms']:9.2f} -> {result['mean_ms']:9.2f} ms ({ratio:4.2f}x)  "
+              f"peak {before['peak_kb']:.1f} -> {result['peak_kb']:.1f} KB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MetricsCollector on fake procfs/sysfs fixtures.")
+    parser.add_argument("--pids", type=parse_counts, default=parse_counts("100,1000,5000,20000"),
+                        help="Comma-separated process counts")
+    parser.add_argument("--mounts", type=parse_counts, default=parse_counts("1,10,50,200"),
+                        help="Comma-separated mount counts")
+    parser.add_argument("--backends", type=lambda s: s.split(","), default=list(BACKENDS),
+                        help=f"Process collector backends ({', '.join(BACKENDS)})")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--output", default="bench_collectors.json")
+    parser.add_argument("--compare", help="A previous --output file to compare against")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "psutil": psutil.__version__,
+        "platform": platform.platform(),
+        "rounds": args.rounds,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(results)} result(s) to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+import psutil
+from fake_procfs import build_fake_procfs, advance_fake_procfs
+from procfs import ProcfsProcessCollector, PsutilProcessCollector
+
+# Compares the /proc process collector with the psutil one (and with the
+# original process_iter + sorted() approach) on a synthetic procfs tree.
+
+def legacy_top_5():
+    """The original get_high_freq_data process loop, kept for comparison."""
+    processes = []
+    for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
+        try:
+            proc.info['cpu_percent'] = proc.cpu_percent(interval=None)
+            processes.append(proc.info)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+    return sorted(processes, key=lambda p: p['cpu_percent'], reverse=True)[:5]
+
+def time_call(fn, root, pids, rounds):
+    """Warm up once, then time 'rounds' calls with counters advancing in between."""
+    fn()
+    total = 0.0
+    for step in range(1, rounds + 1):
+        advance_fake_procfs(root, pids, step)
+        start = time.perf_counter()
+        fn()
+        total += time.perf_counter() - start
+    return total / rounds * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark process collectors on a fake procfs.")
+    parser.add_argument("--pids", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Building fake procfs with {args.pids} pids in {root}...")
+        build_fake_procfs(root, args.pids)
+        psutil.PROCFS_PATH = root
+
+        procfs = ProcfsProcessCollector(proc_root=root)
+        procfs_no_io = ProcfsProcessCollector(proc_root=root, collect_io=False)
+        fallback = PsutilProcessCollector()
+
+        results = {
+            "legacy (process_iter + sorted)": time_call(legacy_top_5, root, args.pids, args.rounds),
+            "psutil backend (heap top-N)": time_call(fallback.collect, root, args.pids, args.rounds),
+            "procfs backend": time_call(procfs.collect, root, args.pids, args.rounds),
+            "procfs backend (no io)": time_call(procfs_no_io.collect, root, args.pids, args.rounds),
+        }
+
+    baseline = results["legacy (process_iter + sorted)"]
+    print(f"--- Process collection, {args.pids} pids, mean of {args.rounds} rounds ---")
+    for name, ms in results.items():
+        print(f"{name:<34} {ms:9.1f} ms  ({baseline / ms:4.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import random
+import time
+import uuid
+from codec import encode, decode, msgpack, zstandard
+
+# --- Representative Payloads ---
+# Synthetic but shaped like what MetricsCollector produces, so the
+# numbers don't depend on the machine the benchmark runs on.
+
+AGENT_ID = str(uuid.uuid4())
+
+def static_item():
+    return {"type": "static", "timestamp": time.time(), "payload": {
+        "agent_id": AGENT_ID,
+        "hostname": "build-host-042",
+        "os": "Linux-6.8.0-45-generic-x86_64-with-glibc2.39",
+        "cpu_cores_physical": 32,
+        "cpu_cores_logical": 64,
+        "ram_total_gb": 251.54,
+        "partitions": [
+            {"device": f"/dev/nvme0n1p{i}", "mountpoint": m, "fstype": "ext4"}
+            for i, m in enumerate(["/", "/boot", "/home", "/var", "/scratch"], start=1)
+        ]
+    }}
+
+def high_freq_item(cores=64):
+    return {"type": "high_freq", "timestamp": time.time(), "payload": {
+        "agent_id": AGENT_ID,
+        "cpu_percent_overall": round(random.uniform(0, 100), 1),
+        "cpu_percent_per_core": [round(random.uniform(0, 100), 1) for _ in range(cores)],
+        "ram_percent_used": round(random.uniform(0, 100), 1),
+        "swap_percent_used": round(random.uniform(0, 10), 1),
+        "network_io": {"bytes_sent_per_sec": random.randint(0, 10**8),
+                       "bytes_recv_per_sec": random.randint(0, 10**8)},
+        "disk_io": {"read_bytes_per_sec": random.randint(0, 10**9),
+                    "write_bytes_per_sec": random.randint(0, 10**9)},
+        "top_5_processes": [
+            {"pid": random.randint(1, 4 * 10**6), "name": random.choice(["cc1plus", "ld", "python3", "java"]),
+             "username": "builder", "cpu_percent": round(random.uniform(0, 800), 1),
+             "memory_percent": random.uniform(0, 5)}
+            for _ in range(5)
+        ]
+    }}
+
+def low_freq_item(mounts=5):
+    return {"type": "low_freq", "timestamp": time.time(), "payload": {
+        "agent_id": AGENT_ID,
+        "boot_time_timestamp": time.time() - 86400,
+        "logged_in_users": ["alice", "bob"],
+        "disk_usage": [
+            {"mountpoint": f"/mnt/vol{i}", "percent_used": round(random.uniform(0, 100), 1),
+             "total_gb": 931.51, "used_gb": round(random.uniform(0, 931), 2)}
+            for i in range(mounts)
+        ]
+    }}
+
+# --- Benchmark ---
+
+def combinations():
+    formats = ["json"] + (["msgpack"] if msgpack else [])
+    compressions = ["identity", "gzip"] + (["zstd"] if zstandard else [])
+    return [(f, c) for f in formats for c in compressions]
+
+def cpu_per_call(fn, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Size and CPU cost of each wire format per payload type.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100, help="Items in the 'batch' row")
+    args = parser.parse_args()
+
+    payloads = {
+        "static": [static_item()],
+        "high_freq": [high_freq_item()],
+        "low_freq": [low_freq_item()],
+        f"batch x{args.batch}": [high_freq_item() for _ in range(args.batch)],
+    }
+
+    print(f"{'payload':<12} {'format':<18} {'bytes':>9} {'ratio':>7} {'encode us':>10} {'decode us':>10}")
+    for name, obj in payloads.items():
+        baseline = len(encode(obj)[0])
+        iterations = max(1, args.iterations // len(obj))
+        for fmt, compression in combinations():
+            body, _ = encode(obj, fmt, compression)
+            assert decode(body, fmt, compression) == obj
+            enc = cpu_per_call(lambda: encode(obj, fmt, compression), iterations)
+            dec = cpu_per_call(lambda: decode(body, fmt, compression), iterations)
+            print(f"{name:<12} {fmt + '/' + compression:<18} {len(body):>9} "
+                  f"{len(body) / baseline:>7.2f} {enc:>10.1f} {dec:>10.1f}")
+        print()
+
+if __name__ == "__main__":
+    main()
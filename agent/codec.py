@@ -0,0 +1,70 @@
+import gzip
+import json
+
+# msgpack and zstandard are optional. Without them the agent
+# quietly falls back to JSON and gzip.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+def resolve_wire_format(fmt, compression):
+    """
+    Returns the (format, compression) pair that can actually be used,
+    downgrading anything whose library isn't installed.
+    """
+    if fmt == "msgpack" and msgpack is None:
+        print("msgpack is not installed. Falling back to JSON.")
+        fmt = "json"
+    if fmt not in CONTENT_TYPES:
+        fmt = "json"
+
+    if compression == "zstd" and zstandard is None:
+        print("zstandard is not installed. Falling back to gzip.")
+        compression = "gzip"
+    if compression not in ("zstd", "gzip", "identity"):
+        compression = "identity"
+
+    return fmt, compression
+
+def encode(obj, fmt="json", compression="identity"):
+    """
+    Serializes and compresses an object for the wire.
+    Returns (body, headers).
+    """
+    if fmt == "msgpack":
+        body = msgpack.packb(obj, use_bin_type=True)
+    else:
+        body = json.dumps(obj, separators=(",", ":")).encode()
+
+    headers = {"Content-Type": CONTENT_TYPES[fmt]}
+
+    if compression == "zstd":
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    elif compression == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+
+    return body, headers
+
+def decode(body, fmt="json", compression="identity"):
+    """The reverse of encode(); used by the benchmark to check round trips."""
+    if compression == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression == "gzip":
+        body = gzip.decompress(body)
+
+    if fmt == "msgpack":
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
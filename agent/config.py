@@ -8,10 +8,72 @@ load_dotenv()
 SERVER_URL = os.getenv("SERVER_URL")
 API_KEY = os.getenv("API_KEY")
 
+# Batches go to '<SERVER_URL>/batch' unless set explicitly
+BATCH_SERVER_URL = os.getenv("BATCH_SERVER_URL") or (
+    f"{SERVER_URL.rstrip('/')}/batch" if SERVER_URL else None
+)
+
+# --- Sender Batching ---
+# Send up to this many queued items in one request...
+SEND_BATCH_SIZE = int(os.getenv("SEND_BATCH_SIZE", 100))
+# ...or whatever has been queued within this many milliseconds
+SEND_BATCH_LINGER_MS = int(os.getenv("SEND_BATCH_LINGER_MS", 500))
+# Batch size used to drain a backlog once the server is reachable again
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", 500))
+
+# --- Send Back-off ---
+# After a failed send, wait SEND_BACKOFF_INITIAL seconds, doubling with
+# every further failure up to SEND_BACKOFF_MAX. A Retry-After from the
+# server (e.g. with a 429) is used instead. Each wait is stretched by a
+# random 0-SEND_BACKOFF_JITTER fraction so agents don't retry in lockstep.
+SEND_BACKOFF_INITIAL = float(os.getenv("SEND_BACKOFF_INITIAL", 2))
+SEND_BACKOFF_MAX = float(os.getenv("SEND_BACKOFF_MAX", 120))
+SEND_BACKOFF_JITTER = float(os.getenv("SEND_BACKOFF_JITTER", 0.5))
+
+# --- Wire Format ---
+# "msgpack" or "json", compressed with "zstd", "gzip" or "identity".
+# The agent falls back to plain JSON if the server doesn't support it.
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "msgpack")
+WIRE_COMPRESSION = os.getenv("WIRE_COMPRESSION", "zstd")
+
+# --- Delta Encoding ---
+# Send unchanged data as references and per-core CPU as deltas,
+# once the server has said it understands them
+DELTA_ENCODING = os.getenv("DELTA_ENCODING", "true").lower() == "true"
+# Send a full keyframe after this many deltas of the same type
+KEYFRAME_INTERVAL = int(os.getenv("KEYFRAME_INTERVAL", 30))
+
+# --- On-Disk Spool ---
+# Unsent data is kept here so it survives outages and restarts
+SPOOL_DIR = os.getenv("SPOOL_DIR", ".spool")
+SPOOL_MAX_MB = int(os.getenv("SPOOL_MAX_MB", 256))
+SPOOL_SEGMENT_MB = int(os.getenv("SPOOL_SEGMENT_MB", 8))
+# fsync after this many records or this many milliseconds, whichever is first
+SPOOL_FSYNC_RECORDS = int(os.getenv("SPOOL_FSYNC_RECORDS", 100))
+SPOOL_FSYNC_INTERVAL_MS = int(os.getenv("SPOOL_FSYNC_INTERVAL_MS", 1000))
+
 # --- Agent Config ---
 # Get intervals, with sensible defaults
 HIGH_FREQ_INTERVAL = int(os.getenv("HIGH_FREQ_INTERVAL", 10))
 LOW_FREQ_INTERVAL = int(os.getenv("LOW_FREQ_INTERVAL", 300))
+# How often static data is re-sent after the one on start
+STATIC_REFRESH_INTERVAL = int(os.getenv("STATIC_REFRESH_INTERVAL", 3600))
+
+# How often (in seconds) CPU and RAM are sampled between reports.
+# Each high_freq report carries min/max/mean/p95/last of these samples.
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", 1))
+
+# How often (in seconds) the agent reports on its own health:
+# collector cost, spool backlog and send latency
+AGENT_HEALTH_INTERVAL = int(os.getenv("AGENT_HEALTH_INTERVAL", 60))
+
+# --- Collector Runtime ---
+# Each collector gets this long (in seconds) before its run is abandoned
+HIGH_FREQ_TIMEOUT = float(os.getenv("HIGH_FREQ_TIMEOUT", 4))
+LOW_FREQ_TIMEOUT = float(os.getenv("LOW_FREQ_TIMEOUT", 30))
+STATIC_TIMEOUT = float(os.getenv("STATIC_TIMEOUT", 30))
+# Threads that run the blocking psutil calls
+COLLECTOR_THREADS = int(os.getenv("COLLECTOR_THREADS", 4))
 
 # --- NEW: Fast Reporting Config ---
 # The faster interval when a threshold is breached (in seconds)
@@ -20,8 +82,47 @@ FAST_FREQ_INTERVAL = int(os.getenv("FAST_FREQ_INTERVAL", 5))
 # The metric thresholds that trigger fast reporting
 CPU_THRESHOLD = float(os.getenv("CPU_THRESHOLD", 85.0))
 RAM_THRESHOLD = float(os.getenv("RAM_THRESHOLD", 85.0))
-# You can also add a disk threshold if you like
-# DISK_THRESHOLD = float(os.getenv("DISK_THRESHOLD", 90.0))
+DISK_THRESHOLD = float(os.getenv("DISK_THRESHOLD", 90.0))
+
+# Fast reporting only ends once a metric is this far back below its threshold...
+RULE_HYSTERESIS = float(os.getenv("RULE_HYSTERESIS", 5.0))
+# ...and a breach must last this long (in seconds) to start it, the
+# recovery this long to end it
+RULE_ENTER_DWELL = float(os.getenv("RULE_ENTER_DWELL", 3))
+RULE_EXIT_DWELL = float(os.getenv("RULE_EXIT_DWELL", 30))
+
+# The rules themselves, as 'metric:enter[:exit][:option=value...]'
+# separated by ';' (see rules.py). By default, the thresholds above.
+RULES = os.getenv("RULES") or ";".join(
+    f"{metric}:{threshold}:{threshold - RULE_HYSTERESIS}"
+    for metric, threshold in (
+        ("cpu_percent", CPU_THRESHOLD),
+        ("ram_percent", RAM_THRESHOLD),
+        ("disk_percent_max", DISK_THRESHOLD),
+    )
+)
+
+
+# --- Collectors ---
+# Process collector backend: "auto" (procfs on Linux), "procfs" or "psutil"
+PROCESS_COLLECTOR = os.getenv("PROCESS_COLLECTOR", "auto")
+# Block devices (comma-separated name prefixes) left out of the
+# per-device disk I/O breakdown
+DISK_DEVICE_IGNORE_PREFIXES = os.getenv("DISK_DEVICE_IGNORE_PREFIXES", "loop,ram")
+
+
+# --- Mounts ---
+# Filesystem types and mountpoint prefixes the agent doesn't report on
+# (comma-separated; the defaults skip snap packages)
+MOUNT_IGNORE_FSTYPES = os.getenv("MOUNT_IGNORE_FSTYPES", "squashfs")
+MOUNT_IGNORE_PREFIXES = os.getenv("MOUNT_IGNORE_PREFIXES", "/snap/")
+# Each statvfs call gets this long (in seconds); mounts that don't answer
+# (e.g. a stale NFS server) are reported as unavailable and retried after
+# a back-off that doubles up to MOUNT_BACKOFF_MAX seconds
+STATVFS_TIMEOUT = float(os.getenv("STATVFS_TIMEOUT", 2))
+STATVFS_THREADS = int(os.getenv("STATVFS_THREADS", 8))
+MOUNT_BACKOFF_INITIAL = int(os.getenv("MOUNT_BACKOFF_INITIAL", 60))
+MOUNT_BACKOFF_MAX = int(os.getenv("MOUNT_BACKOFF_MAX", 1800))
 
 
 # --- Local Agent Files ---
@@ -0,0 +1,114 @@
+import copy
+
+# --- Delta Encoding ---
+# Unchanged sub-structures are sent as references to the last snapshot
+# the server acknowledged, and per-core CPU goes as integer deltas in
+# tenths of a percent (psutil already rounds to 0.1, so this is lossless).
+
+# Fields that are dropped (and listed under "unchanged") when equal to the base
+REFERENCE_FIELDS = {
+    "high_freq": ["top_5_processes", "top_5_processes_by_memory", "top_5_processes_by_io"],
+    "low_freq": ["boot_time_timestamp", "logged_in_users", "disk_usage"],
+}
+
+# Numeric series sent as quantized deltas
+SERIES_FIELDS = {
+    "high_freq": ["cpu_percent_per_core"],
+}
+
+QUANTUM = 10  # steps per unit, i.e. 0.1 resolution
+
+def quantize(values):
+    return [round(v * QUANTUM) for v in values]
+
+def dequantize(values):
+    return [q / QUANTUM for q in values]
+
+
+class DeltaEncoder:
+    """
+    Stateful encoder for agent payloads.
+
+    Each message type has its own chain. A keyframe carries the full
+    payload; the deltas after it only carry what changed relative to the
+    previous message in the chain. The chain state only moves forward
+    once the server has accepted a request (see commit), so a failed
+    send is re-encoded against the same acknowledged snapshot.
+    """
+
+    def __init__(self, keyframe_interval):
+        self.keyframe_interval = keyframe_interval
+        # type -> {"seq", "snapshot", "since_keyframe"}
+        self._acked = {}
+        self._next_seq = 1
+
+    def reset(self):
+        """Forgets all snapshots, so the next message of each type is a keyframe."""
+        self._acked = {}
+
+    def encode_batch(self, items):
+        """
+        Encodes a list of spooled items in order.
+        Returns (encoded_items, state) - pass 'state' to commit() once
+        the server has accepted the request.
+        """
+        chains = {t: dict(c) for t, c in self._acked.items()}
+        encoded = []
+
+        for item in items:
+            msg_type = item.get("type")
+            if msg_type not in REFERENCE_FIELDS:
+                encoded.append(item)
+                continue
+
+            payload = self._normalize(msg_type, item["payload"])
+            seq = self._next_seq
+            self._next_seq += 1
+
+            chain = chains.get(msg_type)
+            if chain is None or chain["since_keyframe"] >= self.keyframe_interval:
+                out = dict(item, payload=payload, encoding="keyframe", seq=seq)
+                chains[msg_type] = {"seq": seq, "snapshot": payload, "since_keyframe": 0}
+            else:
+                delta = self._diff(msg_type, chain["snapshot"], payload)
+                out = dict(item, payload=delta, encoding="delta", seq=seq, base_seq=chain["seq"])
+                chains[msg_type] = {"seq": seq, "snapshot": payload,
+                                    "since_keyframe": chain["since_keyframe"] + 1}
+            encoded.append(out)
+
+        return encoded, chains
+
+    def commit(self, state):
+        """Adopts the chain state of a request the server accepted."""
+        self._acked = state
+
+    def _normalize(self, msg_type, payload):
+        """
+        Rounds series to the quantum so the agent's snapshot is exactly
+        what the server will reconstruct.
+        """
+        payload = copy.deepcopy(payload)
+        for field in SERIES_FIELDS.get(msg_type, []):
+            if field in payload:
+                payload[field] = dequantize(quantize(payload[field]))
+        return payload
+
+    def _diff(self, msg_type, base, payload):
+        delta = {}
+        unchanged = []
+        series = SERIES_FIELDS.get(msg_type, [])
+        references = REFERENCE_FIELDS[msg_type]
+
+        for key, value in payload.items():
+            if key in references and key in base and base[key] == value:
+                unchanged.append(key)
+            elif key in series and len(base.get(key, [])) == len(value):
+                delta[f"{key}_delta"] = [
+                    q - b for q, b in zip(quantize(value), quantize(base[key]))
+                ]
+            else:
+                delta[key] = value
+
+        if unchanged:
+            delta["unchanged"] = unchanged
+        return delta
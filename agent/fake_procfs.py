@@ -0,0 +1,163 @@
+import os
+import random
+
+# --- Synthetic /proc Tree ---
+# Builds just enough of a Linux procfs under a temporary directory for
+# the collectors (ours and psutil's, via psutil.PROCFS_PATH) to run
+# against thousands of fake pids and mounts on any machine.
+
+NAMES = ["bash", "python3", "cc1plus", "ld", "java", "node", "sshd", "systemd", "postgres", "nginx"]
+MEM_TOTAL_KB = 64 * 1024 * 1024
+BOOT_TIME = 1700000000
+DISKS = ["nvme0n1", "nvme1n1", "sda", "sdb"]
+NICS = ["lo", "eth0", "eth1"]
+
+def stat_line(pid, name, utime, stime, starttime, rss_pages):
+    # 52 fields, laid out like the real file
+    fields = [
+        "S", "1", str(pid), str(pid), "0", "-1", "4194560", "100", "0", "0", "0",
+        str(utime), str(stime), "0", "0", "20", "0", "1", "0", str(starttime),
+        str(rss_pages * 4096 * 4), str(rss_pages),
+    ] + ["0"] * 30
+    return f"{pid} ({name}) " + " ".join(fields) + "\n"
+
+def write_pid(root, pid, rng, tick_offset=0):
+    pid_dir = os.path.join(root, str(pid))
+    os.makedirs(pid_dir, exist_ok=True)
+    name = rng.choice(NAMES)
+    utime = rng.randint(0, 100000) + tick_offset * rng.randint(0, 50)
+    stime = rng.randint(0, 10000)
+    rss = rng.randint(100, 200000)
+    uid = os.getuid()
+
+    with open(os.path.join(pid_dir, "stat"), "w") as f:
+        f.write(stat_line(pid, name, utime, stime, 1000 + pid, rss))
+    with open(os.path.join(pid_dir, "statm"), "w") as f:
+        f.write(f"{rss * 4} {rss} {rss // 4} 100 0 {rss // 2} 0\n")
+    with open(os.path.join(pid_dir, "status"), "w") as f:
+        f.write(f"Name:\t{name}\nState:\tS (sleeping)\nTgid:\t{pid}\nPid:\t{pid}\nPPid:\t1\n"
+                f"Uid:\t{uid}\t{uid}\t{uid}\t{uid}\nGid:\t0\t0\t0\t0\n"
+                "voluntary_ctxt_switches:\t10\nnonvoluntary_ctxt_switches:\t1\n")
+    with open(os.path.join(pid_dir, "io"), "w") as f:
+        read = rng.randint(0, 10**9) + tick_offset * rng.randint(0, 10**6)
+        write = rng.randint(0, 10**9)
+        f.write(f"rchar: {read}\nwchar: {write}\nsyscr: 1\nsyscw: 1\n"
+                f"read_bytes: {read}\nwrite_bytes: {write}\ncancelled_write_bytes: 0\n")
+    with open(os.path.join(pid_dir, "cmdline"), "w") as f:
+        f.write(f"/usr/bin/{name}\0")
+
+def write_system_files(root, cores=8):
+    with open(os.path.join(root, "meminfo"), "w") as f:
+        f.write(f"MemTotal:       {MEM_TOTAL_KB} kB\nMemFree:        {MEM_TOTAL_KB // 2} kB\n"
+                f"MemAvailable:   {MEM_TOTAL_KB // 2} kB\nBuffers:        1024 kB\n"
+                f"Cached:         {MEM_TOTAL_KB // 8} kB\nSwapCached:     0 kB\n"
+                "Active:         1024 kB\nInactive:       1024 kB\n"
+                "SwapTotal:      8388608 kB\nSwapFree:       8388608 kB\n"
+                "Shmem:          1024 kB\nSReclaimable:   1024 kB\n")
+    with open(os.path.join(root, "stat"), "w") as f:
+        f.write("cpu  4798 0 849 71409 200 0 4 306 0 0\n")
+        for core in range(cores):
+            f.write(f"cpu{core} 600 0 100 9000 20 0 1 40 0 0\n")
+        f.write(f"ctxt 100000\nbtime {BOOT_TIME}\nprocesses 5000\nprocs_running 2\nprocs_blocked 0\n")
+    with open(os.path.join(root, "uptime"), "w") as f:
+        f.write("100000.00 700000.00\n")
+    with open(os.path.join(root, "vmstat"), "w") as f:
+        f.write("pswpin 0\npswpout 0\n")
+    with open(os.path.join(root, "cpuinfo"), "w") as f:
+        for core in range(cores):
+            f.write(f"processor\t: {core}\nphysical id\t: 0\ncore id\t\t: {core}\n\n")
+    with open(os.path.join(root, "filesystems"), "w") as f:
+        f.write("nodev\tsysfs\nnodev\tproc\nnodev\ttmpfs\n\text4\n\txfs\n\tsquashfs\n")
+    write_io_counters(root)
+
+def diskstats_names():
+    """
+    psutil only counts diskstats lines for devices it finds under the
+    real /sys/block, so the host's own device names are listed too.
+    """
+    try:
+        host_disks = sorted(os.listdir("/sys/block"))
+    except OSError:
+        host_disks = []
+    return DISKS + [d for d in host_disks if d not in DISKS]
+
+def write_io_counters(root, step=0):
+    """/proc/diskstats and /proc/net/dev for the fake disks and NICs."""
+    os.makedirs(os.path.join(root, "net"), exist_ok=True)
+    with open(os.path.join(root, "diskstats"), "w") as f:
+        for minor, disk in enumerate(diskstats_names()):
+            reads = 1000 + step * 10
+            f.write(f"   8 {minor * 16:7d} {disk} {reads} 0 {reads * 8} 100 {reads} 0 {reads * 16} "
+                    f"200 0 300 300 0 0 0 0 0 0\n")
+    with open(os.path.join(root, "net", "dev"), "w") as f:
+        f.write("Inter-|   Receive                                                |  Transmit\n"
+                " face |bytes    packets errs drop fifo frame compressed multicast|"
+                "bytes    packets errs drop fifo colls carrier compressed\n")
+        for nic in NICS:
+            rx = 10**6 + step * 10**4
+            f.write(f"{nic:>6}: {rx} {rx // 1000} 0 0 0 0 0 0 {rx // 2} {rx // 2000} 0 0 0 0 0 0\n")
+
+def write_mount_table(root, mount_dir, num_mounts):
+    """
+    Writes /proc/self/mounts and /proc/self/mountinfo with 'num_mounts'
+    entries. Real mountpoints are created under 'mount_dir' so statvfs
+    works; every tenth mount is a snap squashfs, which the agent skips.
+    """
+    os.makedirs(os.path.join(root, "self"), exist_ok=True)
+    mounts, mountinfo = [], []
+    for i in range(num_mounts):
+        if i and i % 10 == 0:
+            device, mountpoint, fstype = f"/dev/loop{i}", f"/snap/pkg{i}/1", "squashfs"
+        else:
+            mountpoint = os.path.join(mount_dir, f"vol{i}")
+            os.makedirs(mountpoint, exist_ok=True)
+            device, fstype = f"/dev/{DISKS[i % len(DISKS)]}p{i + 1}", "ext4"
+        mounts.append(f"{device} {mountpoint} {fstype} rw,relatime 0 0\n")
+        mountinfo.append(f"{100 + i} 1 259:{i} / {mountpoint} rw,relatime shared:{i + 1} "
+                         f"- {fstype} {device} rw\n")
+    with open(os.path.join(root, "self", "mounts"), "w") as f:
+        f.writelines(mounts)
+    with open(os.path.join(root, "self", "mountinfo"), "w") as f:
+        f.writelines(mountinfo)
+
+def build_fake_sysfs(root, step=0):
+    """
+    A fake /sys with per-disk and per-NIC counters. The current
+    collectors read these through psutil, which always uses the real
+    /sys, so this is for backends that take a sysfs root.
+    """
+    for minor, disk in enumerate(DISKS):
+        block = os.path.join(root, "block", disk)
+        os.makedirs(os.path.join(block, "queue"), exist_ok=True)
+        reads = 1000 + step * 10
+        with open(os.path.join(block, "stat"), "w") as f:
+            f.write(f"{reads} 0 {reads * 8} 100 {reads} 0 {reads * 16} 200 0 300 300 0 0 0 0 0 0\n")
+        with open(os.path.join(block, "dev"), "w") as f:
+            f.write(f"8:{minor * 16}\n")
+        with open(os.path.join(block, "queue", "hw_sector_size"), "w") as f:
+            f.write("512\n")
+    for nic in NICS:
+        stats = os.path.join(root, "class", "net", nic, "statistics")
+        os.makedirs(stats, exist_ok=True)
+        rx = 10**6 + step * 10**4
+        for name, value in (("rx_bytes", rx), ("tx_bytes", rx // 2),
+                            ("rx_packets", rx // 1000), ("tx_packets", rx // 2000)):
+            with open(os.path.join(stats, name), "w") as f:
+                f.write(f"{value}\n")
+    return root
+
+def build_fake_procfs(root, num_pids, seed=42):
+    """Creates a fake procfs with 'num_pids' processes under 'root'."""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    write_system_files(root)
+    for pid in range(1, num_pids + 1):
+        write_pid(root, pid, rng)
+    os.makedirs(os.path.join(root, "self"), exist_ok=True)
+    return root
+
+def advance_fake_procfs(root, num_pids, step=1, seed=42):
+    """Rewrites every pid with later counters, as if time had passed."""
+    rng = random.Random(seed + step)
+    for pid in range(1, num_pids + 1):
+        write_pid(root, pid, rng, tick_offset=step)
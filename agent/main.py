@@ -1,115 +1,141 @@
+import asyncio
 import time
 import random
+import signal
 import sys
+import psutil
 import config  # Make sure this import is here
 from config import (
-    HIGH_FREQ_INTERVAL, LOW_FREQ_INTERVAL, 
-    FAST_FREQ_INTERVAL, CPU_THRESHOLD, RAM_THRESHOLD
+    HIGH_FREQ_INTERVAL, LOW_FREQ_INTERVAL, STATIC_REFRESH_INTERVAL, SAMPLE_INTERVAL,
+    AGENT_HEALTH_INTERVAL,
+    FAST_FREQ_INTERVAL, RULES, RULE_ENTER_DWELL, RULE_EXIT_DWELL,
+    HIGH_FREQ_TIMEOUT, LOW_FREQ_TIMEOUT, STATIC_TIMEOUT, COLLECTOR_THREADS
 )
 from metrics import MetricsCollector
+from rules import RuleEngine, flatten_metrics, parse_rules
+from scheduler import AgentRuntime
 from sender import DataSender
+from telemetry import AgentTelemetry
 
-def check_thresholds(metrics_data):
+def disk_percent_max(low_freq_data):
+    """The fullest reachable mount, for the disk rule."""
+    used = [d["percent_used"] for d in low_freq_data.get("disk_usage", []) if d.get("available", True)]
+    return {"disk_percent_max": max(used)} if used else {}
+
+def build_runtime(metrics, sender, telemetry, rules):
     """
-    Checks if any metrics have breached their thresholds.
-    Returns True if a threshold is breached, False otherwise.
+    Sets up one independently scheduled collector per kind of data.
+    Every MetricsCollector call is timed for the agent_health report.
     """
-    if metrics_data['cpu_percent_overall'] > CPU_THRESHOLD:
-        return True
-    if metrics_data['ram_percent_used'] > RAM_THRESHOLD:
-        return True
-    
-    # You could also add a disk check here:
-    # for disk in metrics_data.get('disk_usage', []):
-    #     if disk['percent_used'] > DISK_THRESHOLD:
-    #         return True
-            
-    return False
+    runtime = AgentRuntime(max_workers=COLLECTOR_THREADS)
+    state = {"interval": HIGH_FREQ_INTERVAL} # Start at the normal interval
+
+    # --- THRESHOLD LOGIC ---
+    # Every collector feeds its values to the rules; the report interval
+    # only changes once a rule has become active (or cleared)
+    def observe(values):
+        rules.observe(values)
+        interval = FAST_FREQ_INTERVAL if rules.active else HIGH_FREQ_INTERVAL
+        if interval != state["interval"]:
+            if rules.active:
+                print(f"Threshold breached ({', '.join(map(str, rules.active))})! "
+                      f"Switching to {FAST_FREQ_INTERVAL}s interval.")
+            else:
+                print(f"Metrics normal. Returning to {HIGH_FREQ_INTERVAL}s interval.")
+            state["interval"] = interval
+
+    # --- Fast Sampling Task ---
+    # Cheap CPU/RAM samples, summarized into each high_freq report and
+    # checked against the rules, so a breach is seen within a second
+    runtime.add("sampler", telemetry.timed("sample_fast_metrics", metrics.sample_fast_metrics),
+                interval=SAMPLE_INTERVAL, timeout=SAMPLE_INTERVAL,
+                on_result=observe)
+
+    # --- High-Frequency Task ---
+    def on_high_freq(high_freq_data):
+        sender.send_data("high_freq", high_freq_data)
+        observe(flatten_metrics(high_freq_data))
+        print(f"Sent high_freq data (CPU: {high_freq_data['cpu_percent_overall']}%)")
+
+    runtime.add("high_freq", telemetry.timed("get_high_freq_data", metrics.get_high_freq_data),
+                interval=lambda: state["interval"], timeout=HIGH_FREQ_TIMEOUT,
+                on_result=on_high_freq)
+
+    # --- Low-Frequency Task ---
+    # Runs on its own schedule; a slow disk can't delay high_freq samples
+    def on_low_freq(low_freq_data):
+        sender.send_data("low_freq", low_freq_data)
+        observe(disk_percent_max(low_freq_data))
+        print("Sent low_freq data.")
+
+    runtime.add("low_freq", telemetry.timed("get_low_freq_data", metrics.get_low_freq_data),
+                interval=LOW_FREQ_INTERVAL, timeout=LOW_FREQ_TIMEOUT,
+                on_result=on_low_freq)
+
+    # --- Static Refresh Task ---
+    # Static data is sent once on start; this re-sends it now and then
+    # so hardware or hostname changes are picked up.
+    runtime.add("static", telemetry.timed("get_static_data", metrics.get_static_data),
+                interval=STATIC_REFRESH_INTERVAL, timeout=STATIC_TIMEOUT,
+                on_result=lambda data: sender.send_data("static", data),
+                first_delay=STATIC_REFRESH_INTERVAL)
+
+    # --- Agent Health Task ---
+    # The agent's own overhead and backlog, so costly or lagging agents
+    # can be found across the fleet
+    runtime.add("agent_health", lambda: telemetry.snapshot(sender.spool),
+                interval=AGENT_HEALTH_INTERVAL, timeout=STATIC_TIMEOUT,
+                on_result=lambda data: sender.send_data("agent_health", data),
+                first_delay=AGENT_HEALTH_INTERVAL)
+
+    return runtime
 
 def main():
     print("--- Distributed Monitoring Agent ---")
-    
+
     # --- Handle "Thundering Herd" ---
     jitter = random.uniform(0, 10)
     print(f"Applying startup jitter: waiting {jitter:.2f} seconds...")
     time.sleep(jitter)
-    
+
     # Initialize components
     try:
         metrics = MetricsCollector()
-        sender = DataSender()
+        telemetry = AgentTelemetry(metrics.agent_id)
+        sender = DataSender(telemetry)
     except Exception as e:
         print(f"Critical error on init: {e}")
         sys.exit(1)
-        
+
     print(f"Agent ID: {metrics.agent_id}")
     print(f"Sending data to: {config.SERVER_URL}")
     print(f"Standard Interval: {HIGH_FREQ_INTERVAL}s | Fast Interval: {FAST_FREQ_INTERVAL}s")
-    print(f"Thresholds: CPU > {CPU_THRESHOLD}% | RAM > {RAM_THRESHOLD}%")
+    rules = RuleEngine(parse_rules(RULES, RULE_ENTER_DWELL, RULE_EXIT_DWELL))
+    print(f"Rules: {', '.join(map(str, rules.rules)) or 'none'}")
 
     # --- Send Static Data (Once on Start) ---
+    # Sent before any collector starts, so it is always first in the spool
     print("Sending initial static data...")
-    sender.send_data("static", metrics.get_static_data())
-    
-    # --- Main Loop ---
-    last_low_freq_time = 0
-    current_interval = HIGH_FREQ_INTERVAL # Start at the normal interval
-    
-    # Initialize CPU % collection before loop
+    sender.send_data("static", telemetry.timed("get_static_data", metrics.get_static_data)())
+
+    # Initialize CPU % collection before the collectors start
     psutil.cpu_percent(interval=None)
     time.sleep(0.5) # Let it establish a baseline
-    
+
+    # 'docker stop' / systemd send SIGTERM; shut down like CTRL+C so the spool is synced
+    def interrupt(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
     try:
-        while True:
-            loop_start_time = time.time()
-            
-            # --- High-Frequency Task ---
-            try:
-                high_freq_data = metrics.get_high_freq_data()
-                sender.send_data("high_freq", high_freq_data)
-                
-                # --- NEW THRESHOLD LOGIC ---
-                if check_thresholds(high_freq_data):
-                    if current_interval != FAST_FREQ_INTERVAL:
-                        print(f"Threshold breached! Switching to {FAST_FREQ_INTERVAL}s interval.")
-                    current_interval = FAST_FREQ_INTERVAL
-                else:
-                    if current_interval != HIGH_FREQ_INTERVAL:
-                        print(f"Metrics normal. Returning to {HIGH_FREQ_INTERVAL}s interval.")
-                    current_interval = HIGH_FREQ_INTERVAL
-                # --- END NEW LOGIC ---
-
-                print(f"Sent high_freq data (CPU: {high_freq_data['cpu_percent_overall']}%)")
-                
-            except Exception as e:
-                print(f"Error collecting high-freq data: {e}")
-
-            # --- Low-Frequency Task ---
-            # This task is independent of the high-freq interval
-            if (loop_start_time - last_low_freq_time) >= LOW_FREQ_INTERVAL:
-                try:
-                    print("Collecting low-freq data...")
-                    low_freq_data = metrics.get_low_freq_data()
-                    sender.send_data("low_freq", low_freq_data)
-                    print("Sent low_freq data.")
-                    last_low_freq_time = loop_start_time
-                except Exception as e:
-                    print(f"Error collecting low-freq data: {e}")
-            
-            # --- Sleep ---
-            # Calculate sleep time based on the *current_interval*
-            time_spent = time.time() - loop_start_time
-            sleep_time = max(0, current_interval - time_spent)
-            time.sleep(sleep_time)
-            
+        asyncio.run(build_runtime(metrics, sender, telemetry, rules).run())
     except KeyboardInterrupt:
         print("\nAgent shutting down...")
     except Exception as e:
         print(f"CRITICAL ERROR in main loop: {e}")
     finally:
+        sender.spool.flush()
         print("Agent stopped.")
 
 if __name__ == "__main__":
-    # This import is needed here for the CPU init
-    import psutil 
-    main()
\ No newline at end of file
+    main()
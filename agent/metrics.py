@@ -1,6 +1,15 @@
 import psutil
 import platform
 import socket
+from config import (
+    PROCESS_COLLECTOR, SAMPLE_INTERVAL, HIGH_FREQ_INTERVAL,
+    MOUNT_IGNORE_FSTYPES, MOUNT_IGNORE_PREFIXES, STATVFS_TIMEOUT, STATVFS_THREADS,
+    MOUNT_BACKOFF_INITIAL, MOUNT_BACKOFF_MAX, DISK_DEVICE_IGNORE_PREFIXES
+)
+from mounts import MountTable, DiskUsageCollector, parse_list
+from procfs import get_process_collector
+from rates import CounterRateEngine
+from sampler import HighResSampler
 from utils import get_or_create_agent_id
 
 class MetricsCollector:
@@ -8,33 +17,37 @@ class MetricsCollector:
         # Store the agent's unique ID
         self.agent_id = get_or_create_agent_id()
         
-        # Initialize last I/O counters to calculate deltas
-        self.last_net_io = psutil.net_io_counters()
-        self.last_disk_io = psutil.disk_io_counters()
+        # Keeps the last disk, NIC and per-core counters to turn them into rates
+        self.rates = CounterRateEngine(
+            ignore_disk_prefixes=parse_list(DISK_DEVICE_IGNORE_PREFIXES)
+        )
 
+        # /proc reader on Linux, psutil everywhere else
+        self.process_collector = get_process_collector(PROCESS_COLLECTOR)
+
+        # Fast samples between reports; room for two normal report intervals
+        capacity = int(2 * HIGH_FREQ_INTERVAL / SAMPLE_INTERVAL) + 1
+        self.sampler = HighResSampler(capacity)
+
+        # Mount list, re-read only when something is (un)mounted
+        self.mount_table = MountTable(
+            ignore_fstypes=parse_list(MOUNT_IGNORE_FSTYPES),
+            ignore_prefixes=parse_list(MOUNT_IGNORE_PREFIXES)
+        )
+        # Concurrent statvfs calls, each with a timeout
+        self.disk_usage = DiskUsageCollector(
+            max_workers=STATVFS_THREADS,
+            timeout=STATVFS_TIMEOUT,
+            backoff_initial=MOUNT_BACKOFF_INITIAL,
+            backoff_max=MOUNT_BACKOFF_MAX
+        )
 
     def get_static_data(self):
         """
         Gathers one-time static data about the machine.
-        This now filters out virtual filesystems like 'squashfs' (snaps).
+        Partitions come from the cached mount table, which filters out
+        the filesystems in MOUNT_IGNORE_FSTYPES/MOUNT_IGNORE_PREFIXES.
         """
-        
-        # Define a list of filesystem types to ignore
-        FSTYPES_TO_IGNORE = ['squashfs']
-        
-        filtered_partitions = []
-        for p in psutil.disk_partitions():
-            # Skip any filesystem type we don't care about
-            # or any mountpoint that is clearly a snap mount.
-            if p.fstype in FSTYPES_TO_IGNORE or p.mountpoint.startswith('/snap/'):
-                continue
-            
-            filtered_partitions.append({
-                "device": p.device, 
-                "mountpoint": p.mountpoint, 
-                "fstype": p.fstype
-            })
-
         return {
             "agent_id": self.agent_id,
             "hostname": socket.gethostname(),
@@ -42,91 +55,60 @@ class MetricsCollector:
             "cpu_cores_physical": psutil.cpu_count(logical=False),
             "cpu_cores_logical": psutil.cpu_count(logical=True),
             "ram_total_gb": round(psutil.virtual_memory().total / (1024**3), 2),
-            "partitions": filtered_partitions # This list is now filtered
+            "partitions": self.mount_table.partitions()
         }
 
 
     def get_low_freq_data(self):
         """
         Gathers data that doesn't change as often.
+        Disk usage is read for all mounts at once; a mount that doesn't
+        answer in time is reported with "available": False.
         """
-        disk_usage = []
-        
-        # Define a list of filesystem types to ignore
-        # 'squashfs' is used by snap packages
-        FSTYPES_TO_IGNORE = ['squashfs']
-
-        for p in psutil.disk_partitions():
-            
-            # --- ADD THIS FILTER ---
-            # Skip any filesystem type we don't care about
-            # or any mountpoint that is clearly a snap mount.
-            if p.fstype in FSTYPES_TO_IGNORE or p.mountpoint.startswith('/snap/'):
-                continue 
-            # --- END OF FILTER ---
-            
-            try:
-                usage = psutil.disk_usage(p.mountpoint)
-                disk_usage.append({
-                    "mountpoint": p.mountpoint,
-                    "percent_used": usage.percent,
-                    "total_gb": round(usage.total / (1024**3), 2),
-                    "used_gb": round(usage.used / (1024**3), 2)
-                })
-            except (FileNotFoundError, PermissionError):
-                continue # Skip inaccessible drives (e.g., CD-ROM)
+        mountpoints = [p["mountpoint"] for p in self.mount_table.partitions()]
 
         return {
             "agent_id": self.agent_id,
             "boot_time_timestamp": psutil.boot_time(),
             "logged_in_users": [user.name for user in psutil.users()],
-            "disk_usage": disk_usage  # This list will now be clean!
+            "disk_usage": self.disk_usage.collect(mountpoints)
         }
 
+    def sample_fast_metrics(self):
+        """
+        Takes one cheap CPU/RAM sample. Runs every SAMPLE_INTERVAL
+        seconds; the samples are summarized in the next high_freq report.
+        Returns the values, so local rules can react to them at once.
+        """
+        return self.sampler.sample()
+
     def get_high_freq_data(self):
         """
         Gathers rapidly changing performance metrics.
         """
-        # --- I/O Deltas ---
-        # Network
-        current_net_io = psutil.net_io_counters()
-        net_io = {
-            "bytes_sent_per_sec": (current_net_io.bytes_sent - self.last_net_io.bytes_sent),
-            "bytes_recv_per_sec": (current_net_io.bytes_recv - self.last_net_io.bytes_recv)
-        }
-        self.last_net_io = current_net_io
-        
-        # Disk
-        current_disk_io = psutil.disk_io_counters()
-        disk_io = {
-            "read_bytes_per_sec": (current_disk_io.read_bytes - self.last_disk_io.read_bytes),
-            "write_bytes_per_sec": (current_disk_io.write_bytes - self.last_disk_io.write_bytes)
-        }
-        self.last_disk_io = current_disk_io
+        # --- I/O and Per-Core Rates ---
+        # Divided by the real time since the last report, in total and
+        # per disk/NIC/core
+        rates = self.rates.sample()
         
         # --- Top 5 Processes ---
-        # Get all processes' info
-        processes = []
-        # Calling cpu_percent(None) here starts the interval counter
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
-            try:
-                # cpu_percent(None) returns the value since last call
-                proc.info['cpu_percent'] = proc.cpu_percent(interval=None) 
-                processes.append(proc.info)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-        
-        # Sort by CPU and get top 5
-        top_5_cpu = sorted(processes, key=lambda p: p['cpu_percent'], reverse=True)[:5]
+        # One pass over all processes picks the top 5 by CPU, memory and I/O
+        top_processes = self.process_collector.collect()
         
         # --- Final Payload ---
         return {
             "agent_id": self.agent_id,
             "cpu_percent_overall": psutil.cpu_percent(interval=None),
-            "cpu_percent_per_core": psutil.cpu_percent(interval=None, percpu=True),
+            "cpu_percent_per_core": rates["cpu_percent_per_core"],
             "ram_percent_used": psutil.virtual_memory().percent,
             "swap_percent_used": psutil.swap_memory().percent,
-            "network_io": net_io,
-            "disk_io": disk_io,
-            "top_5_processes": top_5_cpu
+            "network_io": rates["network_io"],
+            "disk_io": rates["disk_io"],
+            "network_io_per_nic": rates["network_io_per_nic"],
+            "disk_io_per_device": rates["disk_io_per_device"],
+            "top_5_processes": top_processes["cpu"],
+            "top_5_processes_by_memory": top_processes["memory"],
+            "top_5_processes_by_io": top_processes["io"],
+            # min/max/mean/p95/last of the fast samples since the last report
+            "summaries": self.sampler.summarize()
         }
\ No newline at end of file
@@ -0,0 +1,165 @@
+import os
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import psutil
+
+# --- Mount Table ---
+# The kernel flags /proc/self/mountinfo with POLLPRI whenever something
+# is mounted or unmounted, so the partition list is only re-read then.
+
+def parse_list(text):
+    """'a, b,c' -> ['a', 'b', 'c'] (for the comma-separated config values)."""
+    return [v.strip() for v in (text or "").split(",") if v.strip()]
+
+
+class MountTable:
+    """
+    Cached, filtered view of psutil.disk_partitions().
+
+    'ignore_fstypes' and 'ignore_prefixes' decide which mounts the agent
+    reports; the defaults in config.py skip snap packages (squashfs
+    under /snap/). Where mountinfo can't be polled (non-Linux) the table
+    is simply re-read on every call.
+    """
+
+    def __init__(self, ignore_fstypes=(), ignore_prefixes=(), proc_root=None):
+        self.ignore_fstypes = set(ignore_fstypes)
+        self.ignore_prefixes = tuple(ignore_prefixes)
+        self._lock = threading.Lock()
+        self._partitions = None
+        self._mountinfo = None
+        self._poller = None
+
+        path = os.path.join(proc_root or psutil.PROCFS_PATH, "self", "mountinfo")
+        try:
+            self._mountinfo = open(path, "rb")
+            self._poller = select.poll()
+            self._poller.register(self._mountinfo, select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            # No mountinfo, or no poll() on this platform
+            self._poller = None
+
+    def _changed(self):
+        if self._poller is None:
+            return True
+        return any(events & (select.POLLPRI | select.POLLERR)
+                   for _, events in self._poller.poll(0))
+
+    def invalidate(self):
+        """Forces a re-read on the next call."""
+        with self._lock:
+            self._partitions = None
+
+    def partitions(self):
+        """
+        Returns [{"device", "mountpoint", "fstype"}] for the mounts the
+        agent reports on.
+        """
+        with self._lock:
+            # Always poll, so a change seen now isn't reported again next time
+            changed = self._changed()
+            if self._partitions is None or changed:
+                self._partitions = [
+                    {"device": p.device, "mountpoint": p.mountpoint, "fstype": p.fstype}
+                    for p in psutil.disk_partitions()
+                    if not self._ignored(p)
+                ]
+            return list(self._partitions)
+
+    def _ignored(self, partition):
+        return (partition.fstype in self.ignore_fstypes
+                or partition.mountpoint.startswith(self.ignore_prefixes))
+
+
+# --- Disk Usage ---
+
+class DiskUsageCollector:
+    """
+    Runs statvfs (psutil.disk_usage) on every mount at once, each call
+    bounded by 'timeout' seconds, so a stale NFS or FUSE mount can't hold
+    up the collection cycle.
+
+    A mount that times out is reported as unavailable and skipped for a
+    back-off period that doubles on every further timeout (up to
+    'backoff_max'). A hung statvfs can't be cancelled, so a mount whose
+    previous call is still stuck is never queried a second time.
+    """
+
+    def __init__(self, max_workers=8, timeout=2.0, backoff_initial=60, backoff_max=1800):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="statvfs")
+        self.timeout = timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._in_flight = {}   # mountpoint -> Future still running from an earlier cycle
+        self._backoff = {}     # mountpoint -> (retry_at, current backoff in seconds)
+
+    def collect(self, mountpoints):
+        """
+        Returns one entry per mountpoint: usage figures when statvfs
+        answered in time, {"mountpoint", "available": False} when it
+        didn't (or the mount is backed off). Mounts that can't be read
+        at all (e.g. an empty CD-ROM drive) are left out, as before.
+        """
+        now = time.monotonic()
+        futures = {}
+        unavailable = []
+
+        for mountpoint in mountpoints:
+            stuck = self._in_flight.get(mountpoint)
+            if stuck is not None and not stuck.done():
+                unavailable.append(mountpoint)
+                continue
+            self._in_flight.pop(mountpoint, None)
+
+            retry_at, _ = self._backoff.get(mountpoint, (0, 0))
+            if now < retry_at:
+                unavailable.append(mountpoint)
+                continue
+
+            futures[mountpoint] = self.executor.submit(psutil.disk_usage, mountpoint)
+
+        if futures:
+            wait(futures.values(), timeout=self.timeout)
+
+        results = {}
+        for mountpoint, future in futures.items():
+            if not future.done():
+                if future.cancel():
+                    # Never started (all workers busy); try again next cycle
+                    unavailable.append(mountpoint)
+                    continue
+                self._in_flight[mountpoint] = future
+                self._back_off(mountpoint, now)
+                unavailable.append(mountpoint)
+                continue
+
+            self._backoff.pop(mountpoint, None)
+            try:
+                usage = future.result()
+            except (FileNotFoundError, PermissionError):
+                continue # Skip inaccessible drives (e.g., CD-ROM)
+            except OSError as e:
+                print(f"Could not read disk usage for {mountpoint}: {e}")
+                continue
+            results[mountpoint] = {
+                "mountpoint": mountpoint,
+                "available": True,
+                "percent_used": usage.percent,
+                "total_gb": round(usage.total / (1024**3), 2),
+                "used_gb": round(usage.used / (1024**3), 2)
+            }
+
+        for mountpoint in unavailable:
+            results[mountpoint] = {"mountpoint": mountpoint, "available": False}
+
+        # Keep the mount table's order
+        return [results[m] for m in mountpoints if m in results]
+
+    def _back_off(self, mountpoint, now):
+        _, previous = self._backoff.get(mountpoint, (0, 0))
+        backoff = min(self.backoff_max, previous * 2 if previous else self.backoff_initial)
+        self._backoff[mountpoint] = (now + backoff, backoff)
+        print(f"statvfs on {mountpoint} timed out after {self.timeout}s. "
+              f"Reporting it as unavailable for {backoff}s.")
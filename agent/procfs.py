@@ -0,0 +1,240 @@
+import os
+import time
+import heapq
+import pwd
+import psutil
+
+# How many processes are reported for each ranking
+TOP_N = 5
+
+# Field positions in /proc/[pid]/stat, counted after the ')' that closes 'comm'
+STAT_UTIME = 11
+STAT_STIME = 12
+STAT_STARTTIME = 19
+STAT_RSS = 21
+
+
+class TopN:
+    """
+    Keeps the N largest items seen so far in a bounded min-heap,
+    so choosing the top N never needs to sort every process.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self._heap = []
+
+    def push(self, key, pid, record):
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, (key, pid, record))
+        elif key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (key, pid, record))
+
+    def items(self):
+        return [record for _, _, record in sorted(self._heap, reverse=True)]
+
+
+def to_process_dict(record):
+    pid, name, username, cpu, mem, io = record
+    proc = {
+        "pid": pid,
+        "name": name,
+        "username": username,
+        "cpu_percent": round(cpu, 1),
+        "memory_percent": mem,
+    }
+    if io is not None:
+        proc["io_bytes_per_sec"] = round(io, 1)
+    return proc
+
+
+class ProcfsProcessCollector:
+    """
+    Reads /proc/[pid]/stat directly instead of building a psutil.Process
+    for every pid.
+
+    One read of 'stat' gives the name, CPU ticks, start time and resident
+    set size (the same 'resident' figure as 'statm'), and 'io' gives the
+    read/write byte counters when we're allowed to see them. CPU% and
+    I/O rates come from the deltas against a small per-pid cache of the
+    previous pass. Top N by CPU, memory and I/O are chosen in that same
+    pass with bounded heaps.
+    """
+
+    def __init__(self, proc_root="/proc", top_n=TOP_N, collect_io=True):
+        self.proc_root = proc_root
+        self.top_n = top_n
+        self.collect_io = collect_io
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.mem_total = self._read_mem_total()
+
+        # pid -> (starttime, cpu ticks, io bytes) from the previous pass
+        self._previous = {}
+        self._last_time = None
+        self._usernames = {}
+
+    def _read_mem_total(self):
+        with open(os.path.join(self.proc_root, "meminfo"), "rb") as f:
+            for line in f:
+                if line.startswith(b"MemTotal:"):
+                    return int(line.split()[1]) * 1024
+        return psutil.virtual_memory().total
+
+    def _username(self, uid):
+        name = self._usernames.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self._usernames[uid] = name
+        return name
+
+    def _read_io(self, pid_dir):
+        try:
+            with open(pid_dir + "/io", "rb") as f:
+                total = 0
+                for line in f:
+                    if line.startswith(b"read_bytes:") or line.startswith(b"write_bytes:"):
+                        total += int(line.split()[1])
+                return total
+        except (FileNotFoundError, PermissionError, ProcessLookupError):
+            return None
+
+    def collect(self):
+        """
+        Returns {"cpu": [...], "memory": [...], "io": [...]}, each the
+        top N processes for that resource as payload-ready dicts.
+        """
+        now = time.monotonic()
+        elapsed = (now - self._last_time) if self._last_time else None
+        self._last_time = now
+
+        tick_scale = 100.0 / (elapsed * self.clock_ticks) if elapsed else 0.0
+        mem_scale = 100.0 * self.page_size / self.mem_total
+        previous = self._previous
+        current = {}
+
+        top_cpu = TopN(self.top_n)
+        top_mem = TopN(self.top_n)
+        top_io = TopN(self.top_n)
+
+        for entry in os.scandir(self.proc_root):
+            if not entry.name.isdigit():
+                continue
+            pid = int(entry.name)
+            pid_dir = entry.path
+
+            try:
+                with open(pid_dir + "/stat", "rb") as f:
+                    stat = f.read()
+                uid = entry.stat().st_uid
+            except (FileNotFoundError, ProcessLookupError, PermissionError):
+                continue # Process exited while we were reading it
+
+            close = stat.rfind(b")")
+            name = stat[stat.find(b"(") + 1:close].decode(errors="replace")
+            fields = stat[close + 2:].split()
+            ticks = int(fields[STAT_UTIME]) + int(fields[STAT_STIME])
+            starttime = int(fields[STAT_STARTTIME])
+            rss_pages = int(fields[STAT_RSS])
+            io_bytes = self._read_io(pid_dir) if self.collect_io else None
+
+            cpu = 0.0
+            io_rate = None
+            prev = previous.get(pid)
+            # Same start time means the same process, not a reused pid
+            if prev and prev[0] == starttime and elapsed:
+                cpu = (ticks - prev[1]) * tick_scale
+                if io_bytes is not None and prev[2] is not None:
+                    io_rate = (io_bytes - prev[2]) / elapsed
+            current[pid] = (starttime, ticks, io_bytes)
+
+            mem = rss_pages * mem_scale
+            record = (pid, name, uid, cpu, mem, io_rate)
+            top_cpu.push(cpu, pid, record)
+            top_mem.push(mem, pid, record)
+            if io_rate is not None:
+                top_io.push(io_rate, pid, record)
+
+        # Dead pids drop out of the cache here
+        self._previous = current
+
+        # Usernames are only resolved for the handful we report
+        def finish(records):
+            return [to_process_dict((pid, name, self._username(uid), cpu, mem, io))
+                    for pid, name, uid, cpu, mem, io in records]
+
+        return {"cpu": finish(top_cpu.items()),
+                "memory": finish(top_mem.items()),
+                "io": finish(top_io.items())}
+
+
+class PsutilProcessCollector:
+    """
+    Portable fallback with the same interface, built on psutil.process_iter.
+    Still a single pass with bounded heaps instead of a full sort.
+    """
+
+    def __init__(self, top_n=TOP_N, collect_io=True):
+        self.top_n = top_n
+        self.collect_io = collect_io
+        self._previous_io = {}
+        self._last_time = None
+
+    def collect(self):
+        now = time.monotonic()
+        elapsed = (now - self._last_time) if self._last_time else None
+        self._last_time = now
+
+        attrs = ['pid', 'name', 'username', 'memory_percent']
+        if self.collect_io and hasattr(psutil.Process, "io_counters"):
+            attrs.append('io_counters')
+
+        top_cpu = TopN(self.top_n)
+        top_mem = TopN(self.top_n)
+        top_io = TopN(self.top_n)
+        current_io = {}
+
+        for proc in psutil.process_iter(attrs):
+            try:
+                # cpu_percent(None) returns the value since last call
+                cpu = proc.cpu_percent(interval=None)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+
+            info = proc.info
+            pid = info['pid']
+            mem = info['memory_percent'] or 0.0
+
+            io_rate = None
+            counters = info.get('io_counters')
+            if counters is not None:
+                io_bytes = counters.read_bytes + counters.write_bytes
+                current_io[pid] = io_bytes
+                if elapsed and pid in self._previous_io:
+                    io_rate = max(0, io_bytes - self._previous_io[pid]) / elapsed
+
+            record = (pid, info['name'] or "", info['username'] or "", cpu, mem, io_rate)
+            top_cpu.push(cpu, pid, record)
+            top_mem.push(mem, pid, record)
+            if io_rate is not None:
+                top_io.push(io_rate, pid, record)
+
+        self._previous_io = current_io
+        return {"cpu": [to_process_dict(r) for r in top_cpu.items()],
+                "memory": [to_process_dict(r) for r in top_mem.items()],
+                "io": [to_process_dict(r) for r in top_io.items()]}
+
+
+def get_process_collector(backend="auto", top_n=TOP_N):
+    """
+    Picks the process collector backend: "procfs", "psutil" or "auto"
+    (procfs when /proc is available, psutil otherwise).
+    """
+    if backend in ("auto", "procfs") and os.path.exists("/proc/self/stat"):
+        return ProcfsProcessCollector(top_n=top_n)
+    if backend == "procfs":
+        print("procfs collector is not available here. Falling back to psutil.")
+    return PsutilProcessCollector(top_n=top_n)
@@ -0,0 +1,181 @@
+import math
+import time
+from array import array
+import psutil
+
+# --- Counter Rates ---
+# Kernel counters only ever go up, so a per-second rate is the change
+# since the previous sample divided by the (monotonic) time between the
+# two samples - not by the nominal interval, which changes when the
+# agent switches to fast reporting.
+
+WRAP_32 = 2 ** 32
+
+def counter_delta(current, previous):
+    """
+    Change of a monotonic counter between two samples.
+    A drop means the counter either wrapped (32-bit counters on some
+    NIC drivers) or was reset (device re-created, driver reloaded);
+    after a reset the counter has counted up from zero.
+    """
+    if current >= previous:
+        return current - previous
+    if previous < WRAP_32 and previous - current > WRAP_32 / 2:
+        return current + WRAP_32 - previous
+    return current
+
+def busy_and_total(times):
+    """Busy and total CPU seconds from a psutil cpu_times() tuple."""
+    total = sum(times)
+    # On Linux guest time is already counted in user/nice
+    total -= getattr(times, "guest", 0) + getattr(times, "guest_nice", 0)
+    idle = times.idle + getattr(times, "iowait", 0)
+    return total - idle, total
+
+
+class RateTable:
+    """
+    Per-second rates for one kind of device (disks, NICs, cores):
+    one row per device, one column per counter.
+
+    The previous sample is kept as a single flat array('d'), so every
+    counter of every device is handled in one pass over two arrays.
+    Devices that appear are given a rate from their second sample on;
+    devices that disappear are simply dropped.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._keys = []
+        self._previous = array('d')
+        self._last_time = None
+
+    def update(self, counters, now=None):
+        """
+        'counters' maps device -> counter values in 'fields' order.
+        Returns {device: {field: per-second rate}} for every device that
+        was also in the previous sample.
+        """
+        now = time.monotonic() if now is None else now
+        keys = list(counters)
+        current = array('d')
+        for key in keys:
+            current.extend(counters[key])
+
+        rates = {}
+        if self._last_time is not None and now > self._last_time:
+            elapsed = now - self._last_time
+            previous = self._previous if keys == self._keys else self._align(keys)
+            flat = [
+                counter_delta(c, p) / elapsed if p == p else math.nan # NaN: new device
+                for c, p in zip(current, previous)
+            ]
+            width = len(self.fields)
+            for row, key in enumerate(keys):
+                values = flat[row * width:(row + 1) * width]
+                if values and values[0] == values[0]:
+                    rates[key] = dict(zip(self.fields, values))
+
+        self._keys = keys
+        self._previous = current
+        self._last_time = now
+        return rates
+
+    def _align(self, keys):
+        """The previous sample re-ordered to match 'keys' (NaN for new devices)."""
+        width = len(self.fields)
+        index = {key: row for row, key in enumerate(self._keys)}
+        aligned = array('d')
+        for key in keys:
+            row = index.get(key)
+            if row is None:
+                aligned.extend([math.nan] * width)
+            else:
+                aligned.extend(self._previous[row * width:(row + 1) * width])
+        return aligned
+
+
+class CounterRateEngine:
+    """
+    Turns psutil's disk, network and per-core CPU counters into
+    per-second rates, in total and per device.
+    """
+
+    DISK_FIELDS = ("read_bytes", "write_bytes", "read_count", "write_count")
+    NIC_FIELDS = ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+                  "errin", "errout", "dropin", "dropout")
+
+    def __init__(self, ignore_disk_prefixes=()):
+        self.ignore_disk_prefixes = tuple(ignore_disk_prefixes)
+        self.disk_total = RateTable(self.DISK_FIELDS)
+        self.nic_total = RateTable(self.NIC_FIELDS)
+        self.disks = RateTable(self.DISK_FIELDS)
+        self.nics = RateTable(self.NIC_FIELDS)
+        self.cores = RateTable(("busy", "total"))
+        self.sample() # Baseline, so the first report already has rates
+
+    def _counters(self, nt, fields):
+        return [getattr(nt, f) for f in fields]
+
+    def sample(self):
+        now = time.monotonic()
+
+        disk_total = psutil.disk_io_counters()
+        net_total = psutil.net_io_counters()
+        disks = psutil.disk_io_counters(perdisk=True) or {}
+        nics = psutil.net_io_counters(pernic=True) or {}
+        cores = psutil.cpu_times(percpu=True)
+
+        totals_disk = self.disk_total.update(
+            {"all": self._counters(disk_total, self.DISK_FIELDS)} if disk_total else {}, now)
+        totals_net = self.nic_total.update(
+            {"all": self._counters(net_total, self.NIC_FIELDS)} if net_total else {}, now)
+        per_disk = self.disks.update({
+            name: self._counters(c, self.DISK_FIELDS) for name, c in disks.items()
+            if not name.startswith(self.ignore_disk_prefixes)
+        }, now)
+        per_nic = self.nics.update({
+            name: self._counters(c, self.NIC_FIELDS) for name, c in nics.items()
+        }, now)
+        per_core = self.cores.update({
+            core: busy_and_total(times) for core, times in enumerate(cores)
+        }, now)
+
+        disk = totals_disk.get("all", {})
+        net = totals_net.get("all", {})
+        return {
+            "network_io": {
+                "bytes_sent_per_sec": int(round(net.get("bytes_sent", 0))),
+                "bytes_recv_per_sec": int(round(net.get("bytes_recv", 0)))
+            },
+            "disk_io": {
+                "read_bytes_per_sec": int(round(disk.get("read_bytes", 0))),
+                "write_bytes_per_sec": int(round(disk.get("write_bytes", 0)))
+            },
+            "network_io_per_nic": [
+                {
+                    "nic": name,
+                    "bytes_sent_per_sec": round(r["bytes_sent"], 1),
+                    "bytes_recv_per_sec": round(r["bytes_recv"], 1),
+                    "packets_sent_per_sec": round(r["packets_sent"], 1),
+                    "packets_recv_per_sec": round(r["packets_recv"], 1),
+                    "errors_per_sec": round(r["errin"] + r["errout"], 2),
+                    "drops_per_sec": round(r["dropin"] + r["dropout"], 2),
+                }
+                for name, r in per_nic.items()
+            ],
+            "disk_io_per_device": [
+                {
+                    "device": name,
+                    "read_bytes_per_sec": round(r["read_bytes"], 1),
+                    "write_bytes_per_sec": round(r["write_bytes"], 1),
+                    "reads_per_sec": round(r["read_count"], 1),
+                    "writes_per_sec": round(r["write_count"], 1),
+                }
+                for name, r in per_disk.items()
+            ],
+            "cpu_percent_per_core": [
+                round(max(0.0, min(100.0, r["busy"] / r["total"] * 100)), 1) if r["total"] > 0 else 0.0
+                for _, r in sorted(per_core.items())
+            ],
+        }
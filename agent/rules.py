@@ -0,0 +1,148 @@
+import time
+
+# --- Local Rules ---
+# Rules are checked on every local sample (about once a second), but a
+# rule only becomes active once its condition has held for its dwell
+# time, and only clears once the metric has stayed back past its exit
+# threshold for the exit dwell time. So a metric hovering around a
+# threshold can't make the reporting rate flap.
+
+
+class Rule:
+    """
+    One condition on one metric.
+
+    Fires when the metric reaches 'enter' - from below, or from above
+    when 'enter' is lower than 'exit' (e.g. free memory). With 'rate',
+    it also fires straight away when the metric moves towards 'enter'
+    faster than 'rate' units per second. Clears when the metric is back
+    past 'exit'.
+    """
+
+    def __init__(self, metric, enter, exit=None, enter_dwell=0.0, exit_dwell=0.0, rate=None):
+        self.metric = metric
+        self.enter = enter
+        self.exit = enter if exit is None else exit
+        self.rising = self.enter >= self.exit
+        self.enter_dwell = enter_dwell
+        self.exit_dwell = exit_dwell
+        self.rate = rate
+        self.active = False
+        self._since = None  # when the pending state change started to hold
+        self._last = None   # (time, value) of the previous observation
+
+    def __repr__(self):
+        op = ">=" if self.rising else "<="
+        return f"{self.metric} {op} {self.enter}"
+
+    def _reached(self, value, threshold):
+        return value >= threshold if self.rising else value <= threshold
+
+    def observe(self, value, now):
+        """Feeds one value. Returns True if the rule became active or cleared."""
+        spiking = False
+        if self.rate is not None and self._last and now > self._last[0]:
+            change = (value - self._last[1]) / (now - self._last[0])
+            spiking = (change if self.rising else -change) >= self.rate
+        self._last = (now, value)
+
+        if not self.active:
+            holding = self._reached(value, self.enter) or spiking
+            dwell = self.enter_dwell
+        else:
+            holding = not self._reached(value, self.exit) and not spiking
+            dwell = self.exit_dwell
+
+        if not holding:
+            self._since = None
+            return False
+
+        if self._since is None:
+            self._since = now
+            if not self.active and not spiking and dwell:
+                print(f"Rule '{self}' breached ({value}). Acting on it if it lasts {dwell}s.")
+
+        if (spiking and not self.active) or now - self._since >= dwell:
+            self.active = not self.active
+            self._since = None
+            return True
+        return False
+
+
+class RuleEngine:
+    """
+    Holds the agent's rules and feeds them whatever metrics come in.
+    Metrics a rule doesn't know are ignored, so any numeric value a
+    collector produces can have a rule on it.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def observe(self, values, now=None):
+        now = time.monotonic() if now is None else now
+        for rule in self.rules:
+            value = values.get(rule.metric)
+            if value is None:
+                continue
+            if rule.observe(value, now):
+                state = "active" if rule.active else "cleared"
+                print(f"Rule '{rule}' {state} ({rule.metric} = {value}).")
+
+    @property
+    def active(self):
+        return [rule for rule in self.rules if rule.active]
+
+
+def flatten_metrics(payload):
+    """
+    Numeric values of a payload by name, one level of nesting deep:
+    {"cpu_percent_overall": 12.0, "disk_io.read_bytes_per_sec": 0, ...}
+    """
+    values = {}
+    for key, value in payload.items():
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            values[key] = value
+        elif isinstance(value, dict):
+            for sub, sub_value in value.items():
+                if isinstance(sub_value, (int, float)) and not isinstance(sub_value, bool):
+                    values[f"{key}.{sub}"] = sub_value
+    return values
+
+
+def parse_rules(spec, enter_dwell=0.0, exit_dwell=0.0):
+    """
+    Parses rules written as 'metric:enter[:exit][:option=value...]',
+    separated by ';'. Options are enter_dwell, exit_dwell and rate, e.g.
+
+        cpu_percent:85:75:enter_dwell=3;disk_percent_max:90:85;cpu_percent:100:rate=20
+
+    Invalid rules are reported and skipped.
+    """
+    rules = []
+    for entry in (spec or "").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            metric, *parts = [p.strip() for p in entry.split(":")]
+            numbers = [float(p) for p in parts if "=" not in p]
+            options = dict(p.split("=", 1) for p in parts if "=" in p)
+            if not metric or not 1 <= len(numbers) <= 2:
+                raise ValueError("expected metric:enter[:exit]")
+            unknown = set(options) - {"enter_dwell", "exit_dwell", "rate"}
+            if unknown:
+                raise ValueError(f"unknown option(s) {', '.join(sorted(unknown))}")
+            rules.append(Rule(
+                metric,
+                enter=numbers[0],
+                exit=numbers[1] if len(numbers) > 1 else None,
+                enter_dwell=float(options.get("enter_dwell", enter_dwell)),
+                exit_dwell=float(options.get("exit_dwell", exit_dwell)),
+                rate=float(options["rate"]) if "rate" in options else None
+            ))
+        except ValueError as e:
+            print(f"Ignoring invalid rule '{entry}': {e}")
+    return rules
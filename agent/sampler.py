@@ -0,0 +1,100 @@
+import threading
+from array import array
+import psutil
+from rates import busy_and_total
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of floats backed by array('d').
+    When full, new samples overwrite the oldest ones.
+    """
+
+    def __init__(self, capacity):
+        self._data = array('d', bytes(8 * capacity))
+        self._capacity = capacity
+        self._start = 0
+        self._length = 0
+
+    def append(self, value):
+        end = (self._start + self._length) % self._capacity
+        self._data[end] = value
+        if self._length < self._capacity:
+            self._length += 1
+        else:
+            self._start = (self._start + 1) % self._capacity
+
+    def values(self):
+        """Samples in the order they were taken."""
+        end = self._start + self._length
+        if end <= self._capacity:
+            return self._data[self._start:end]
+        return self._data[self._start:] + self._data[:end - self._capacity]
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+
+def summarize(values):
+    """min/max/mean/p95/last for one interval's samples."""
+    ordered = sorted(values)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p95": ordered[p95_index],
+        "last": values[-1],
+    }
+
+
+class HighResSampler:
+    """
+    Samples cheap metrics (CPU and RAM) every second or so between
+    reports, so short spikes show up in the per-interval summary even
+    though only one message is sent per interval.
+
+    CPU is computed from its own cpu_times() deltas rather than
+    psutil.cpu_percent(), which keeps a single shared 'last call' and
+    would otherwise shorten the interval behind cpu_percent_overall.
+    """
+
+    METRICS = ("cpu_percent", "ram_percent")
+
+    def __init__(self, capacity):
+        self._buffers = {name: RingBuffer(capacity) for name in self.METRICS}
+        self._lock = threading.Lock()
+        self._last_cpu = psutil.cpu_times()
+
+    def sample(self):
+        current = psutil.cpu_times()
+        busy_now, total_now = busy_and_total(current)
+        busy_before, total_before = busy_and_total(self._last_cpu)
+        self._last_cpu = current
+
+        total_delta = total_now - total_before
+        cpu = 0.0
+        if total_delta > 0:
+            cpu = round(max(0.0, min(100.0, (busy_now - busy_before) / total_delta * 100)), 1)
+
+        ram = psutil.virtual_memory().percent
+
+        with self._lock:
+            self._buffers["cpu_percent"].append(cpu)
+            self._buffers["ram_percent"].append(ram)
+        return {"cpu_percent": cpu, "ram_percent": ram}
+
+    def summarize(self):
+        """
+        Returns {metric: {min, max, mean, p95, last}} for everything sampled
+        since the previous call, and starts a new interval.
+        """
+        with self._lock:
+            snapshot = {name: buf.values() for name, buf in self._buffers.items()}
+            for buf in self._buffers.values():
+                buf.clear()
+        return {name: summarize(values) for name, values in snapshot.items() if len(values)}
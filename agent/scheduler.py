@@ -0,0 +1,101 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Collector:
+    """
+    One periodic job: a blocking function, how often to run it,
+    how long to wait for it, and what to do with its result.
+    'interval' may be a number or a function returning one, so a
+    cadence can change at runtime (e.g. fast reporting on a breach).
+    """
+
+    def __init__(self, name, fn, interval, timeout, on_result=None, first_delay=0):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.timeout = timeout
+        self.on_result = on_result
+        self.first_delay = first_delay
+        self.in_flight = None  # concurrent.futures.Future of the current run
+
+    def current_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+
+class AgentRuntime:
+    """
+    Runs every collector as its own asyncio task on a monotonic,
+    drift-corrected schedule.
+
+    Blocking psutil calls run in a small thread pool. Each run is bounded
+    by its collector's timeout, and a collector whose previous run is
+    still stuck (e.g. statvfs on a hung NFS mount) skips its turn rather
+    than piling more threads into the pool. So one slow collector can
+    never hold up the others.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="collector")
+        self.collectors = []
+
+    def add(self, name, fn, interval, timeout, on_result=None, first_delay=0):
+        self.collectors.append(Collector(name, fn, interval, timeout, on_result, first_delay))
+
+    async def run(self):
+        try:
+            await asyncio.gather(*(self._schedule(c) for c in self.collectors))
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _schedule(self, collector):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time() + collector.first_delay
+
+        while True:
+            delay = next_run - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self._run_once(collector)
+
+            # Advance from the planned time, not from 'now', so the cadence
+            # doesn't drift by however long the collector took
+            interval = collector.current_interval()
+            next_run += interval
+            behind = loop.time() - next_run
+            if behind > 0:
+                missed = int(behind // interval) + 1
+                next_run += missed * interval
+                print(f"Collector '{collector.name}' fell behind; skipped {missed} run(s).")
+
+    async def _run_once(self, collector):
+        if collector.in_flight is not None and not collector.in_flight.done():
+            print(f"Collector '{collector.name}' is still running from last time. Skipping this run.")
+            return
+
+        started = time.monotonic()
+        collector.in_flight = self.executor.submit(collector.fn)
+        try:
+            # shield() keeps the timeout from cancelling our handle on the thread
+            result = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(collector.in_flight)),
+                timeout=collector.timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"Collector '{collector.name}' timed out after {collector.timeout}s.")
+            return
+        except Exception as e:
+            print(f"Error in collector '{collector.name}': {e}")
+            return
+
+        if collector.on_result:
+            try:
+                collector.on_result(result)
+            except Exception as e:
+                print(f"Error handling '{collector.name}' result: {e}")
+
+        elapsed = time.monotonic() - started
+        if elapsed > collector.current_interval():
+            print(f"Collector '{collector.name}' took {elapsed:.1f}s, longer than its interval.")
@@ -1,70 +1,275 @@
+import random
 import requests
 import threading
-import queue
 import time
-import json
-from config import SERVER_URL, API_KEY
+from email.utils import parsedate_to_datetime
+from config import (
+    SERVER_URL, BATCH_SERVER_URL, API_KEY, SEND_BATCH_SIZE, SEND_BATCH_LINGER_MS,
+    REPLAY_BATCH_SIZE, SPOOL_DIR, SPOOL_MAX_MB, SPOOL_SEGMENT_MB,
+    SPOOL_FSYNC_RECORDS, SPOOL_FSYNC_INTERVAL_MS, WIRE_FORMAT, WIRE_COMPRESSION,
+    DELTA_ENCODING, KEYFRAME_INTERVAL, SEND_BACKOFF_INITIAL, SEND_BACKOFF_MAX,
+    SEND_BACKOFF_JITTER
+)
+from codec import encode, resolve_wire_format
+from delta import DeltaEncoder
+from spool import DiskSpool
 
 class DataSender:
-    def __init__(self):
-        self.data_queue = queue.Queue()
+    def __init__(self, telemetry=None):
+        # Everything waiting to be sent lives on disk, not in memory
+        self.spool = DiskSpool(
+            SPOOL_DIR,
+            max_bytes=SPOOL_MAX_MB * 1024 * 1024,
+            segment_bytes=SPOOL_SEGMENT_MB * 1024 * 1024,
+            fsync_interval=SPOOL_FSYNC_INTERVAL_MS / 1000,
+            fsync_records=SPOOL_FSYNC_RECORDS
+        )
+        if len(self.spool):
+            print(f"Spool: {len(self.spool)} unsent item(s) found from a previous run.")
+
+        # Preferred encoding; downgraded to JSON if the server answers 415
+        self.wire_format, self.wire_compression = resolve_wire_format(WIRE_FORMAT, WIRE_COMPRESSION)
+
+        # Deltas are only used once a response shows the server supports them
+        self.encoder = DeltaEncoder(KEYFRAME_INTERVAL)
+        self.delta_enabled = False
+
+        # Optional AgentTelemetry; records send latency, retries and drops
+        self.telemetry = telemetry
+
+        # Failed sends in a row; the back-off doubles with each one
+        self.failures = 0
+
+        # Cleared if the server has no batch endpoint (404/405); items
+        # then go one at a time to SERVER_URL until the agent restarts
+        self.batch_supported = True
+
+        # Most items per request; halved whenever the server answers 413
+        self.batch_limit = REPLAY_BATCH_SIZE
+
         self.session = requests.Session()
         self.session.headers.update({
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
+            "Authorization": f"Bearer {API_KEY}"
         })
         self.worker_thread = threading.Thread(target=self._worker, daemon=True)
         self.worker_thread.start()
 
     def send_data(self, data_type, payload):
         """
-        Public method to add data to the queue.
-        This is non-blocking.
+        Public method to add data to the spool.
+        This is non-blocking (it only appends to a local file).
         """
         try:
             item = {"type": data_type, "payload": payload, "timestamp": time.time()}
-            self.data_queue.put(item)
+            self.spool.append(item)
         except Exception as e:
-            print(f"Error adding to queue: {e}")
+            print(f"Error adding to spool: {e}")
+
+    def _next_batch(self):
+        """
+        Blocks until at least one item is spooled. With a backlog, returns
+        a large batch straight away so it drains quickly. Otherwise waits
+        up to SEND_BATCH_LINGER_MS for more items to share the request.
+        """
+        pending = self.spool.wait(1)
+
+        if not self.batch_supported:
+            return self.spool.read_batch(1)
+
+        if pending > SEND_BATCH_SIZE:
+            return self.spool.read_batch(min(REPLAY_BATCH_SIZE, self.batch_limit))
+
+        self.spool.wait(SEND_BATCH_SIZE, timeout=SEND_BATCH_LINGER_MS / 1000)
+        return self.spool.read_batch(min(SEND_BATCH_SIZE, self.batch_limit))
 
     def _worker(self):
         """
-        Internal worker thread that processes the queue.
+        Internal worker thread that drains the spool.
         This is where all risk mitigation happens.
         """
+        resend = None
         while True:
+            if resend:
+                # What's left of a batch after its invalid (or unencodable) items were removed
+                items, resend = resend, None
+            else:
+                items, position = self._next_batch()
+            if not items:
+                continue
             try:
-                # Get item from queue; this blocks until an item is available
-                item = self.data_queue.get()
-                
-                # Convert payload to JSON
-                json_payload = json.dumps(item)
+                batch, delta_state = items, None
+                if self.delta_enabled:
+                    batch, delta_state = self.encoder.encode_batch(items)
 
-                response = self.session.post(SERVER_URL, data=json_payload, timeout=5)
+                # Encode the whole batch as one array (or the item on its own)
+                if self.batch_supported:
+                    url, obj = BATCH_SERVER_URL, batch
+                else:
+                    url, obj = SERVER_URL, batch[0]
+                body, headers = encode(obj, self.wire_format, self.wire_compression)
 
-                if response.status_code == 200:
-                    print(f"Successfully sent {item['type']} data.")
+                started = time.perf_counter()
+                response = self.session.post(url, data=body, headers=headers, timeout=5)
+                self._record_send(time.perf_counter() - started, len(batch), response.ok)
+                invalid = invalid_items(response, len(items)) if response.status_code == 422 else set()
+
+                if response.status_code == 415 and (self.wire_format, self.wire_compression) != ("json", "identity"):
+                    # Older server: it only understands plain JSON. Resend right away.
+                    print(f"Server does not accept {self.wire_format}/{self.wire_compression}. Falling back to JSON.")
+                    self.wire_format, self.wire_compression = "json", "identity"
+                    self._record_retry()
+                elif response.status_code == 409:
+                    # The server lost our last snapshot (e.g. it restarted). Resend as keyframes.
+                    print("Server asked for a keyframe. Resending full payloads.")
+                    self.encoder.reset()
+                    self._record_retry()
+                elif response.status_code in (404, 405) and self.batch_supported:
+                    # Older server without the batch endpoint. Nothing was
+                    # accepted; the spool is re-read one item at a time.
+                    print(f"Server has no batch endpoint ({response.status_code}). Sending items one at a time.")
+                    self.batch_supported = False
+                    self._record_retry()
+                elif response.ok:
+                    self.failures = 0
+                    self.spool.commit(position)
+                    if delta_state is not None:
+                        self.encoder.commit(delta_state)
+                    elif DELTA_ENCODING and response.headers.get("X-Delta-Encoding") == "supported":
+                        self.delta_enabled = True
+                    print(f"Successfully sent {len(batch)} item(s). {len(self.spool)} left in spool.")
+                elif response.status_code == 429 or response.status_code >= 500:
+                    # The server is up but can't take data right now (429: it is
+                    # shedding load); keep it spooled and come back when it says
+                    delay = self._backoff(retry_after(response))
+                    print(f"Server busy ({response.status_code}). {len(self.spool)} item(s) spooled. "
+                          f"Retrying in {delay:.1f}s...")
+                    self._record_retry()
+                    time.sleep(delay)
+                elif response.status_code in (401, 403):
+                    # Wrong or rotated API_KEY. The data is fine; keep it
+                    # spooled until the key is fixed
+                    delay = self._backoff()
+                    print(f"Server refused the API key ({response.status_code}). {len(self.spool)} item(s) spooled. "
+                          f"Retrying in {delay:.1f}s...")
+                    self._record_retry()
+                    time.sleep(delay)
+                elif response.status_code == 413 and len(items) > 1:
+                    # More items than the server takes per request (MAX_INGEST_BATCH);
+                    # the spool is re-read in smaller batches
+                    self.batch_limit = max(1, len(items) // 2)
+                    print(f"Batch of {len(items)} too large. Sending at most {self.batch_limit} item(s) per request.")
+                    self._record_retry()
+                elif invalid:
+                    # The server rejects the whole batch for its invalid items;
+                    # drop just those and resend the rest right away
+                    print(f"Server rejected {len(invalid)} of {len(items)} item(s): {response.text}")
+                    self._record_dropped(len(invalid))
+                    resend = [item for index, item in enumerate(items) if index not in invalid]
+                    if not resend:
+                        self.spool.commit(position)
                 else:
-                    # Server error, log it
+                    # The server rejected the data itself. Retrying won't help,
+                    # so drop it to avoid old data flooding
                     print(f"Server error {response.status_code}: {response.text}")
-                    # You could re-queue here, but be careful of infinite loops
-                    # For now, we'll just drop it to avoid old data flooding
+                    self.spool.commit(position)
+                    self._record_dropped(len(batch))
 
             except requests.exceptions.ConnectionError:
                 # --- This handles Network Congestion / Reliability ---
-                print("Network Error: Server unreachable. Retrying in 30s...")
-                # Put the item back in the queue to retry
-                self.data_queue.put(item)
+                # Nothing is committed, so the batch stays in the spool
+                delay = self._backoff()
+                print(f"Network Error: Server unreachable. {len(self.spool)} item(s) spooled. Retrying in {delay:.1f}s...")
+                self._record_retry()
                 # Wait before retrying to avoid spamming
-                time.sleep(30) 
+                time.sleep(delay)
             except requests.exceptions.Timeout:
-                print("Network Error: Request timed out. Retrying in 30s...")
-                self.data_queue.put(item)
-                time.sleep(30)
+                delay = self._backoff()
+                print(f"Network Error: Request timed out. {len(self.spool)} item(s) spooled. Retrying in {delay:.1f}s...")
+                self._record_retry()
+                time.sleep(delay)
             except Exception as e:
                 print(f"Unhandled error in sender worker: {e}")
-                # Don't re-queue unknown errors, just log and continue
-            
-            finally:
-                # Signal to the queue that this task is done
-                self.data_queue.task_done()
\ No newline at end of file
+                # Only items that can't be encoded at all are dropped; for
+                # anything else the batch stays spooled and is retried
+                unencodable = [index for index, item in enumerate(items) if not self._encodable(item)]
+                if unencodable:
+                    print(f"Dropping {len(unencodable)} item(s) that cannot be encoded.")
+                    self._record_dropped(len(unencodable))
+                    resend = [item for index, item in enumerate(items) if index not in unencodable]
+                    if not resend:
+                        self.spool.commit(position)
+                else:
+                    delay = self._backoff()
+                    print(f"{len(self.spool)} item(s) spooled. Retrying in {delay:.1f}s...")
+                    self._record_retry()
+                    time.sleep(delay)
+
+    def _encodable(self, item):
+        """True if the item on its own can be put on the wire."""
+        try:
+            encode(item, self.wire_format, self.wire_compression)
+            return True
+        except Exception:
+            return False
+
+    def _backoff(self, server_delay=None):
+        """
+        Seconds to wait before the next attempt. Doubles with every
+        failure in a row (up to SEND_BACKOFF_MAX), and is never shorter
+        than the server's Retry-After. Jitter spreads a fleet that failed
+        together, so it doesn't come back in lockstep.
+        """
+        self.failures += 1
+        delay = min(SEND_BACKOFF_MAX, SEND_BACKOFF_INITIAL * 2 ** (self.failures - 1))
+        if server_delay is not None:
+            delay = server_delay
+        return delay * (1 + random.uniform(0, SEND_BACKOFF_JITTER))
+
+    # --- Telemetry ---
+
+    def _record_send(self, latency_seconds, items, ok):
+        if self.telemetry:
+            self.telemetry.record_send(latency_seconds, items, ok)
+
+    def _record_retry(self):
+        if self.telemetry:
+            self.telemetry.record_retry()
+
+    def _record_dropped(self, items):
+        if self.telemetry:
+            self.telemetry.record_dropped(items)
+
+def retry_after(response):
+    """The Retry-After header in seconds (seconds or an HTTP date), if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def invalid_items(response, count):
+    """
+    Indexes of the batch items a 422 response complains about: the
+    first number in each validation error's 'loc'. Empty if the errors
+    don't point at items.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        return set()
+    errors = body.get("detail") if isinstance(body, dict) else None
+    if not isinstance(errors, list):
+        return set()
+    invalid = set()
+    for error in errors:
+        loc = error.get("loc") if isinstance(error, dict) else None
+        index = next((part for part in loc or () if isinstance(part, int)), None)
+        if index is not None and 0 <= index < count:
+            invalid.add(index)
+    return invalid
@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import struct
+import threading
+
+# --- Record Format ---
+# Each record is: [4-byte length][1-byte kind][JSON body]
+# The kind byte lets eviction filter records without decoding them.
+HEADER = struct.Struct(">IB")
+
+KIND_STATIC = 0
+KIND_LOW_FREQ = 1
+KIND_HIGH_FREQ = 2
+KIND_OTHER = 3
+
+KIND_BY_TYPE = {
+    "static": KIND_STATIC,
+    "low_freq": KIND_LOW_FREQ,
+    "high_freq": KIND_HIGH_FREQ,
+}
+
+# Eviction order: oldest high_freq goes first, then low_freq/other.
+# 'static' is never dropped.
+EVICTION_ORDER = [(KIND_HIGH_FREQ,), (KIND_HIGH_FREQ, KIND_LOW_FREQ, KIND_OTHER)]
+
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+
+
+class DiskSpool:
+    """
+    Append-only, segment-based queue on local disk.
+
+    Items are appended to the newest segment with buffered writes and
+    fsync'd in batches. A cursor file records how far the sender has
+    got, so nothing acknowledged is sent twice and nothing unsent is
+    lost if the agent restarts. Total size is capped; when the cap is
+    hit the oldest segments are rewritten without their high_freq
+    records first (then low_freq), and static records are always kept.
+    """
+
+    def __init__(self, directory, max_bytes, segment_bytes,
+                 fsync_interval=1.0, fsync_records=100):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Eviction works segment by segment, so keep several per cap
+        self.segment_bytes = max(1, min(segment_bytes, max_bytes // 4))
+        self.fsync_interval = fsync_interval
+        self.fsync_records = fsync_records
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Segment ids in order; the last one is being written to
+        self._segments = sorted(self._list_segments())
+        self._sizes = {seg: os.path.getsize(self._path(seg)) for seg in self._segments}
+
+        # Read position: (segment id, byte offset) of the first unsent record
+        self._read_seg, self._read_off = self._load_cursor()
+
+        self._writer = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # Bumped whenever eviction rewrites segments; read positions
+        # handed out before that no longer line up with the files.
+        self._generation = 0
+        self.evicted = 0
+        # The batch handed out by read_batch() and not committed yet:
+        # {"position", "seg", "off", "count"}, where seg/off/count are
+        # kept in line with the files when eviction rewrites them
+        self._in_flight = None
+        # Commits that couldn't be matched to the files any more
+        self.commits_skipped = 0
+
+        self._recover()
+        self._open_writer()
+        self.pending = self._count_pending()
+
+        # append() only syncs when it is called; this catches the last
+        # records of a quiet spell once the interval has passed
+        self._syncer = threading.Thread(target=self._sync_periodically, daemon=True)
+        self._syncer.start()
+
+    # --- Paths & Files ---
+
+    def _path(self, seg):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seg:012d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    yield int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r") as f:
+                seg, off = f.read().split()
+                return int(seg), int(off)
+        except (FileNotFoundError, ValueError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        # Write-then-rename so a crash never leaves a half-written cursor
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{self._read_seg} {self._read_off}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _recover(self):
+        """
+        Drops segments that were fully sent before a restart and truncates
+        a torn record at the end of the newest segment.
+        """
+        for seg in list(self._segments):
+            if seg < self._read_seg:
+                self._remove_segment(seg)
+
+        if not self._segments:
+            return
+
+        last = self._segments[-1]
+        valid_end = 0
+        for offset, _, _, _ in self._iter_records(last, 0):
+            valid_end = offset
+        if valid_end != self._sizes[last]:
+            print(f"Spool: truncating torn record in segment {last}.")
+            with open(self._path(last), "r+b") as f:
+                f.truncate(valid_end)
+            self._sizes[last] = valid_end
+
+    def _open_writer(self):
+        if not self._segments:
+            self._segments.append(self._read_seg)
+            self._sizes[self._read_seg] = 0
+        self._writer = open(self._path(self._segments[-1]), "ab")
+
+    def _remove_segment(self, seg):
+        try:
+            os.remove(self._path(seg))
+        except FileNotFoundError:
+            pass
+        self._segments.remove(seg)
+        self._sizes.pop(seg, None)
+
+    def _iter_records(self, seg, offset):
+        """
+        Yields (end_offset, kind, body, start_offset) for each complete
+        record in a segment, starting at the given offset.
+        """
+        try:
+            with open(self._path(seg), "rb") as f:
+                f.seek(offset)
+                while True:
+                    header = f.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        return
+                    length, kind = HEADER.unpack(header)
+                    body = f.read(length)
+                    if len(body) < length:
+                        return
+                    start = offset
+                    offset += HEADER.size + length
+                    yield offset, kind, body, start
+        except FileNotFoundError:
+            return
+
+    def _count_pending(self):
+        count = 0
+        for seg in self._segments:
+            start = self._read_off if seg == self._read_seg else 0
+            for _ in self._iter_records(seg, start):
+                count += 1
+        return count
+
+    # --- Writing ---
+
+    def append(self, item):
+        """Appends one item to the spool (never blocks on the network)."""
+        body = json.dumps(item).encode()
+        kind = KIND_BY_TYPE.get(item.get("type"), KIND_OTHER)
+        record = HEADER.pack(len(body), kind) + body
+
+        with self._lock:
+            seg = self._segments[-1]
+            if self._sizes[seg] and self._sizes[seg] + len(record) > self.segment_bytes:
+                self._roll_segment()
+                seg = self._segments[-1]
+
+            self._writer.write(record)
+            self._sizes[seg] += len(record)
+            self.pending += 1
+            self._unsynced += 1
+            self._maybe_sync()
+
+            if self.size_bytes() > self.max_bytes:
+                self._evict()
+
+            self._not_empty.notify_all()
+
+    def _roll_segment(self):
+        self._sync()
+        self._writer.close()
+        seg = self._segments[-1] + 1
+        self._segments.append(seg)
+        self._sizes[seg] = 0
+        self._writer = open(self._path(seg), "ab")
+
+    def _maybe_sync(self):
+        if (self._unsynced >= self.fsync_records
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self._sync()
+
+    def _sync(self):
+        self._writer.flush()
+        if self._unsynced:
+            os.fsync(self._writer.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _sync_periodically(self):
+        while True:
+            time.sleep(max(self.fsync_interval, 0.01))
+            with self._lock:
+                if self._unsynced:
+                    self._maybe_sync()
+
+    def flush(self):
+        """Forces buffered records to disk (e.g. on shutdown)."""
+        with self._lock:
+            self._sync()
+
+    def size_bytes(self):
+        return sum(self._sizes.values())
+
+    # --- Eviction ---
+
+    def _evict(self):
+        """
+        Rewrites the oldest segments without their least valuable records
+        until the spool is back under its cap. The segment being written
+        is left alone, so the newest data always survives.
+        """
+        for kinds in EVICTION_ORDER:
+            for seg in list(self._segments[:-1]):
+                if self.size_bytes() <= self.max_bytes:
+                    return
+                self._compact_segment(seg, kinds)
+
+        if self.size_bytes() > self.max_bytes:
+            print("Spool: over size cap but only static data is left to keep.")
+
+    def _compact_segment(self, seg, drop_kinds):
+        start = self._read_off if seg == self._read_seg else 0
+        tmp = self._path(seg) + ".tmp"
+        kept = dropped = 0
+
+        # Where the in-flight batch ends in the rewritten file, and how
+        # many of its records are evicted
+        in_flight = self._in_flight
+        written = in_flight_off = in_flight_dropped = 0
+
+        with open(tmp, "wb") as out:
+            for end, kind, body, _ in self._iter_records(seg, start):
+                in_batch = in_flight is not None and self._read_seg <= seg and (
+                    seg < in_flight["seg"] or (seg == in_flight["seg"] and end <= in_flight["off"]))
+                if kind in drop_kinds:
+                    dropped += 1
+                    in_flight_dropped += in_batch
+                    continue
+                record = HEADER.pack(len(body), kind) + body
+                out.write(record)
+                written += len(record)
+                kept += 1
+                if in_batch:
+                    in_flight_off = written
+            out.flush()
+            os.fsync(out.fileno())
+
+        if not dropped and start == 0:
+            os.remove(tmp)
+            return
+
+        if kept:
+            os.replace(tmp, self._path(seg))
+            self._sizes[seg] = os.path.getsize(self._path(seg))
+        else:
+            os.remove(tmp)
+            self._remove_segment(seg)
+
+        # Records before the cursor were already sent and are gone now
+        if seg == self._read_seg:
+            if kept:
+                self._read_off = 0
+            else:
+                self._read_seg, self._read_off = self._segments[0], 0
+            self._save_cursor()
+
+        if in_flight is not None:
+            in_flight["count"] -= in_flight_dropped
+            if seg == in_flight["seg"]:
+                if kept:
+                    in_flight["off"] = in_flight_off
+                else:
+                    # The batch ended in this segment; it now ends where the next one starts
+                    in_flight["seg"] = next(s for s in self._segments if s > seg)
+                    in_flight["off"] = 0
+
+        self._generation += 1
+        self.pending -= dropped
+        self.evicted += dropped
+        print(f"Spool: evicted {dropped} record(s) from segment {seg}.")
+
+    # --- Reading ---
+
+    def wait(self, min_items=1, timeout=None):
+        """
+        Blocks until at least min_items are waiting to be sent or the
+        timeout (in seconds) expires. Returns the number waiting.
+        """
+        with self._lock:
+            self._not_empty.wait_for(lambda: self.pending >= min_items, timeout)
+            return self.pending
+
+    def read_batch(self, max_items):
+        """
+        Returns (items, position) for up to max_items of the oldest
+        unsent records. Pass 'position' to commit() once the items
+        have been delivered.
+        """
+        with self._lock:
+            if not self.pending:
+                return [], None
+
+            # Make sure everything appended so far is readable
+            self._writer.flush()
+
+            items = []
+            seg, off = self._read_seg, self._read_off
+            for current in self._segments:
+                if current < seg:
+                    continue
+                start = off if current == seg else 0
+                for end, _, body, _ in self._iter_records(current, start):
+                    items.append(json.loads(body))
+                    seg, off = current, end
+                    if len(items) >= max_items:
+                        return items, self._hand_out(seg, off, len(items))
+            return items, self._hand_out(seg, off, len(items))
+
+    def _hand_out(self, seg, off, count):
+        """The position of a batch being read, remembered as the one in flight."""
+        position = (seg, off, count, self._generation)
+        self._in_flight = {"position": position, "seg": seg, "off": off, "count": count}
+        return position
+
+    def oldest_timestamp(self):
+        """The 'timestamp' of the oldest unsent item, or None if empty."""
+        with self._lock:
+            if not self.pending:
+                return None
+            self._writer.flush()
+            for current in self._segments:
+                if current < self._read_seg:
+                    continue
+                start = self._read_off if current == self._read_seg else 0
+                for _, _, body, _ in self._iter_records(current, start):
+                    return json.loads(body).get("timestamp")
+            return None
+
+    def commit(self, position):
+        """Marks everything up to 'position' as delivered."""
+        if position is None:
+            return
+        seg, off, count, generation = position
+        with self._lock:
+            in_flight = self._in_flight
+            if in_flight is not None and in_flight["position"] == position:
+                # Eviction keeps the in-flight batch's end in line with the
+                # rewritten segments, so what survived of it is committed
+                seg, off, count = in_flight["seg"], in_flight["off"], in_flight["count"]
+                self._in_flight = None
+            elif generation != self._generation:
+                # Not the batch being tracked and the offsets no longer line
+                # up; its records are sent again
+                self.commits_skipped += 1
+                print(f"Spool: could not commit {count} sent record(s) after eviction; "
+                      f"they will be sent again ({self.commits_skipped} so far).")
+                return
+            self._read_seg, self._read_off = seg, off
+            self.pending = max(0, self.pending - count)
+
+            # Fully-sent segments (except the one being written) can go
+            for old in list(self._segments[:-1]):
+                if old < self._read_seg:
+                    self._remove_segment(old)
+            if self._read_seg in self._sizes and self._read_off >= self._sizes[self._read_seg] \
+                    and self._read_seg != self._segments[-1]:
+                self._remove_segment(self._read_seg)
+                self._read_seg, self._read_off = self._segments[0], 0
+
+            self._save_cursor()
+
+    def __len__(self):
+        return self.pending
@@ -0,0 +1,123 @@
+import threading
+import time
+import psutil
+
+# --- Agent Self-Telemetry ---
+# What the agent itself costs the host, and how far behind its sender is.
+# Counters cover one reporting interval and start over after each snapshot.
+
+
+class AgentTelemetry:
+    """
+    Thread-safe counters for collector cost and sender health.
+    Collectors run in the runtime's thread pool and the sender in its
+    own thread, so every update goes through one lock.
+    """
+
+    def __init__(self, agent_id):
+        self.agent_id = agent_id
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._process.cpu_percent(interval=None) # Establish a baseline
+        self._interval_start = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self._collectors = {}   # name -> {"runs", "wall_total", "wall_max", "cpu_total"}
+        self._send_latencies = []
+        self._requests = 0
+        self._items_sent = 0
+        self._retries = 0
+        self._dropped = 0
+
+    # --- Collection Cost ---
+
+    def timed(self, name, fn):
+        """
+        Wraps a collector function so each call records its wall time and
+        the CPU time of the thread that ran it.
+        """
+        def wrapper():
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                return fn()
+            finally:
+                self.record_collection(
+                    name, time.perf_counter() - wall_start, time.thread_time() - cpu_start
+                )
+        return wrapper
+
+    def record_collection(self, name, wall_seconds, cpu_seconds):
+        with self._lock:
+            stats = self._collectors.setdefault(
+                name, {"runs": 0, "wall_total": 0.0, "wall_max": 0.0, "cpu_total": 0.0}
+            )
+            stats["runs"] += 1
+            stats["wall_total"] += wall_seconds
+            stats["wall_max"] = max(stats["wall_max"], wall_seconds)
+            stats["cpu_total"] += cpu_seconds
+
+    # --- Sender ---
+
+    def record_send(self, latency_seconds, items, ok):
+        """One HTTP request; 'ok' means the server accepted its items."""
+        with self._lock:
+            self._requests += 1
+            self._send_latencies.append(latency_seconds)
+            if ok:
+                self._items_sent += items
+
+    def record_retry(self):
+        """A batch that stays spooled and will be sent again."""
+        with self._lock:
+            self._retries += 1
+
+    def record_dropped(self, items):
+        """Items given up on (rejected by the server or unsendable)."""
+        with self._lock:
+            self._dropped += items
+
+    # --- Snapshot ---
+
+    def snapshot(self, spool):
+        """
+        Returns the agent_health payload for the interval since the last
+        call and starts a new interval.
+        """
+        oldest = spool.oldest_timestamp()
+        now = time.monotonic()
+
+        with self._lock:
+            elapsed = now - self._interval_start
+            collectors = [
+                {
+                    "name": name,
+                    "runs": s["runs"],
+                    "wall_ms_mean": round(s["wall_total"] / s["runs"] * 1000, 2),
+                    "wall_ms_max": round(s["wall_max"] * 1000, 2),
+                    "cpu_ms_total": round(s["cpu_total"] * 1000, 2),
+                }
+                for name, s in sorted(self._collectors.items())
+            ]
+            latencies = sorted(self._send_latencies)
+            payload = {
+                "agent_id": self.agent_id,
+                "interval_seconds": round(elapsed, 2),
+                "process_cpu_percent": self._process.cpu_percent(interval=None),
+                "process_rss_mb": round(self._process.memory_info().rss / (1024**2), 2),
+                "collectors": collectors,
+                "queue_depth": len(spool),
+                "queue_oldest_age_seconds": round(time.time() - oldest, 2) if oldest else None,
+                "spool_bytes": spool.size_bytes(),
+                "spool_evicted_total": spool.evicted,
+                "send_requests": self._requests,
+                "send_latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                "send_latency_ms_max": round(latencies[-1] * 1000, 2) if latencies else None,
+                "items_sent": self._items_sent,
+                "send_retries": self._retries,
+                "items_dropped": self._dropped,
+            }
+            self._interval_start = now
+            self._reset()
+        return payload
@@ -0,0 +1,62 @@
+import argparse
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from dotenv import load_dotenv
+
+# Run from the 'server' directory against a running API:
+#   python bench_ingest.py --requests 2000 --concurrency 20
+# Run it once on the old build and once on the new one to compare.
+load_dotenv('.env')
+
+BASE_URL = os.getenv('SERVER_URL', 'http://localhost:8000')
+API_KEY = os.getenv('AGENT_API_KEY')
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ingest endpoint latency (p50/p99).")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Bearer {API_KEY}"})
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # The worker drops data for unknown agents; only the API path is measured here
+    body = {"type": "high_freq", "payload": {"agent_id": str(uuid.uuid4())}}
+
+    def send(_):
+        start = time.perf_counter()
+        response = session.post(f"{BASE_URL}/v1/data/ingest", json=body, timeout=10)
+        return time.perf_counter() - start, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, code in results if code != 202)
+
+    print(f"--- Ingest latency: {args.requests} requests, concurrency {args.concurrency} ---")
+    print(f"Throughput: {args.requests / elapsed:10.1f} req/s")
+    print(f"p50:        {percentile(latencies, 50):10.2f} ms")
+    print(f"p99:        {percentile(latencies, 99):10.2f} ms")
+    print(f"Errors:     {errors:10d}")
+
+    # Server-side view (only available on builds that track it)
+    stats = session.get(f"{BASE_URL}/v1/stats/ingest-latency", timeout=5)
+    if stats.status_code == 200:
+        print(f"Server-side: {stats.json()}")
+
+if __name__ == "__main__":
+    main()
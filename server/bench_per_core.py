@@ -0,0 +1,103 @@
+import argparse
+import json
+import time
+
+# Run from the 'server' directory: python bench_per_core.py
+# Needs the same .env as the worker (it uses the real database, but only
+# temporary tables that disappear with the connection).
+from src.database import get_db_connection, release_db_connection
+
+# Measures what storing per-core CPU costs per metrics_high_freq row:
+#
+#   array     one SMALLINT[] column (hundredths of a percent), as stored
+#   rows      the naive layout: one (timestamp, agent_id, core, percent) row per core
+#
+# Both are measured as the table's size on disk divided by the number of
+# samples, after subtracting a table with only (timestamp, agent_id) -
+# i.e. what per-core data adds on top of a row that exists anyway.
+#
+#   python bench_per_core.py [--samples 100000] [--cores 4,16,64] [--output bench_per_core.json]
+
+TABLES = {
+    "base": 'CREATE TEMP TABLE bench_base ("timestamp" TIMESTAMPTZ, agent_id UUID)',
+    "array": 'CREATE TEMP TABLE bench_array ("timestamp" TIMESTAMPTZ, agent_id UUID, '
+             'cpu_percent_per_core SMALLINT[])',
+    "rows": 'CREATE TEMP TABLE bench_rows ("timestamp" TIMESTAMPTZ, agent_id UUID, '
+            'core SMALLINT, cpu_percent REAL)',
+}
+
+FILL = {
+    "base": """
+        INSERT INTO bench_base
+        SELECT now() - s * interval '5 seconds', gen_random_uuid()
+        FROM generate_series(1, %(samples)s) AS s
+    """,
+    "array": """
+        INSERT INTO bench_array
+        SELECT now() - s * interval '5 seconds', gen_random_uuid(),
+               -- 's > 0' ties the subquery to the row, so each row gets its own values
+               ARRAY(SELECT (random() * 10000)::smallint
+                     FROM generate_series(1, %(cores)s) WHERE s > 0)
+        FROM generate_series(1, %(samples)s) AS s
+    """,
+    "rows": """
+        INSERT INTO bench_rows
+        SELECT now() - s * interval '5 seconds', a.agent_id, c, (random() * 100)::real
+        FROM generate_series(1, %(samples)s) AS s
+        CROSS JOIN LATERAL (SELECT gen_random_uuid() AS agent_id) AS a
+        CROSS JOIN generate_series(0, %(cores)s - 1) AS c
+    """,
+}
+
+def table_bytes(cur, name, samples, cores):
+    cur.execute(f"DROP TABLE IF EXISTS bench_{name}; {TABLES[name]};")
+    cur.execute(FILL[name], {"samples": samples, "cores": cores})
+    cur.execute(f"SELECT pg_total_relation_size('bench_{name}');")
+    return cur.fetchone()[0]
+
+def measure(cur, samples, cores):
+    base = table_bytes(cur, "base", samples, cores)
+    array = table_bytes(cur, "array", samples, cores)
+    rows = table_bytes(cur, "rows", samples, cores)
+    cur.execute("SELECT avg(pg_column_size(cpu_percent_per_core)) FROM bench_array;")
+    column = float(cur.fetchone()[0])
+    return {
+        "cores": cores,
+        "array_bytes_per_sample": round((array - base) / samples, 1),
+        "array_column_bytes": round(column, 1),
+        "rows_bytes_per_sample": round(rows / samples, 1),
+        "saving": round(rows / max(array - base, 1), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage cost of per-core CPU: array column vs row per core.")
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--cores", default="4,16,64", help="Comma-separated core counts")
+    parser.add_argument("--output", help="Also save the results as JSON")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("No database connection (check .env)")
+
+    results = []
+    try:
+        with conn.cursor() as cur:
+            for cores in (int(c) for c in args.cores.split(",")):
+                result = measure(cur, args.samples, cores)
+                results.append(result)
+                print(f"{cores:>3} cores   array {result['array_bytes_per_sample']:8.1f} B/sample "
+                      f"(column {result['array_column_bytes']:.0f} B)   "
+                      f"row per core {result['rows_bytes_per_sample']:8.1f} B/sample   "
+                      f"{result['saving']:.1f}x smaller")
+        conn.rollback()
+    finally:
+        release_db_connection(conn)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created_at": time.time(), "samples": args.samples, "results": results}, f, indent=2)
+        print(f"Saved {len(results)} result(s) to {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
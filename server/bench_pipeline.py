@@ -0,0 +1,123 @@
+import argparse
+import json
+import time
+import uuid
+from src.codec import decode_request, encode_message, decode_message, JSON_CONTENT_TYPE
+from src.delta import DeltaDecoder
+from src.models import IngestEnvelope, IngestDataAdapter
+from src.rows import normalize, build_batch_rows
+
+# Measures the CPU time one message costs on each side of the broker:
+#
+#   api        request body -> validated, normalized broker message
+#   worker     broker message -> table rows (everything but the INSERTs)
+#
+# "worker (unvalidated)" is the same message published without the
+# API's validation, which the worker then has to validate itself - the
+# cost every message paid before validation moved to the API.
+#
+#   python bench_pipeline.py [--messages 20000] [--output bench_pipeline.json]
+
+def sample_messages():
+    agent_id = str(uuid.uuid4())
+    process = lambda pid: {"pid": pid, "name": f"proc-{pid}", "username": "root",
+                           "cpu_percent": 12.5, "memory_percent": 3.2, "io_bytes_per_sec": 1024.0}
+    summary = {"min": 1.0, "max": 80.0, "mean": 20.0, "p95": 75.0, "last": 18.0}
+    return {
+        "high_freq": {
+            "agent_id": agent_id,
+            "cpu_percent_overall": 21.5,
+            "cpu_percent_per_core": [12.5] * 16,
+            "ram_percent_used": 48.1,
+            "swap_percent_used": 0.0,
+            "network_io": {"bytes_sent_per_sec": 12000, "bytes_recv_per_sec": 90000},
+            "disk_io": {"read_bytes_per_sec": 4096, "write_bytes_per_sec": 81920},
+            "network_io_per_nic": [
+                {"nic": f"eth{i}", "bytes_sent_per_sec": 6000.0, "bytes_recv_per_sec": 45000.0,
+                 "packets_sent_per_sec": 40.0, "packets_recv_per_sec": 60.0,
+                 "errors_per_sec": 0.0, "drops_per_sec": 0.0}
+                for i in range(3)
+            ],
+            "disk_io_per_device": [
+                {"device": f"sd{c}", "read_bytes_per_sec": 2048.0, "write_bytes_per_sec": 40960.0,
+                 "reads_per_sec": 1.0, "writes_per_sec": 10.0}
+                for c in "ab"
+            ],
+            "top_5_processes": [process(pid) for pid in range(1, 6)],
+            "top_5_processes_by_memory": [process(pid) for pid in range(4, 9)],
+            "top_5_processes_by_io": [process(pid) for pid in range(7, 12)],
+            "summaries": {"cpu_percent": summary, "ram_percent": summary},
+        },
+        "low_freq": {
+            "agent_id": agent_id,
+            "boot_time_timestamp": 1700000000.0,
+            "logged_in_users": ["admin"],
+            "disk_usage": [
+                {"mountpoint": f"/mnt/{i}", "available": True, "percent_used": 40.0,
+                 "total_gb": 100.0, "used_gb": 40.0}
+                for i in range(4)
+            ],
+        },
+        "static": {
+            "agent_id": agent_id,
+            "hostname": "bench-host",
+            "os": "Linux-6.1-x86_64",
+            "cpu_cores_physical": 8,
+            "cpu_cores_logical": 16,
+            "ram_total_gb": 31.2,
+            "partitions": [{"device": "/dev/sda1", "mountpoint": "/", "fstype": "ext4"}],
+        },
+    }
+
+def api_path(body):
+    """What /v1/data/ingest does with a body before publishing it."""
+    envelope = IngestEnvelope.model_validate(decode_request(body, JSON_CONTENT_TYPE))
+    messages, _ = DeltaDecoder().decode([envelope])
+    message = normalize(IngestDataAdapter.validate_python(messages[0]))
+    return encode_message(message)
+
+def worker_path(encoded):
+    body, content_type = encoded
+    return build_batch_rows([(time.time(), decode_message(body, content_type))])
+
+def cpu_us(fn, arg, count):
+    """Mean CPU time per call, in microseconds."""
+    fn(arg)
+    start = time.process_time()
+    for _ in range(count):
+        fn(arg)
+    return (time.process_time() - start) / count * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-message CPU cost of the ingest pipeline.")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--output", help="Also save the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for msg_type, payload in sample_messages().items():
+        item = {"type": msg_type, "payload": payload, "timestamp": time.time()}
+        body = json.dumps(item).encode()
+        validated = api_path(body)
+        unvalidated = encode_message(item)
+
+        result = {
+            "type": msg_type,
+            "request_bytes": len(body),
+            "message_bytes": len(validated[0]),
+            "api_us": round(cpu_us(api_path, body, args.messages), 1),
+            "worker_us": round(cpu_us(worker_path, validated, args.messages), 1),
+            "worker_unvalidated_us": round(cpu_us(worker_path, unvalidated, args.messages), 1),
+        }
+        results.append(result)
+        print(f"{msg_type:<10} api {result['api_us']:7.1f} us   worker {result['worker_us']:7.1f} us   "
+              f"(unvalidated {result['worker_unvalidated_us']:7.1f} us)   "
+              f"{result['request_bytes']} -> {result['message_bytes']} bytes")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created_at": time.time(), "messages": args.messages, "results": results}, f, indent=2)
+        print(f"Saved {len(results)} result(s) to {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
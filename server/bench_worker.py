@@ -0,0 +1,123 @@
+import argparse
+import random
+import time
+import uuid
+
+# Run from the 'server' directory: python bench_worker.py
+# Needs the same .env as the worker (it writes to the real database).
+from src.config import settings
+from src.database import get_db_connection, release_db_connection
+from src.rows import trusted_message
+from src.worker import route_message, write_batch
+
+# All benchmark agents are created in this group and deleted afterwards
+BENCH_GROUP = "Worker Benchmark"
+
+# --- Fake Data Generators ---
+
+def fake_static(agent_id, num):
+    return {
+        "agent_id": agent_id,
+        "hostname": f"bench-pc-{num}",
+        "group_name": BENCH_GROUP,
+        "os": "Linux-Benchmark-x86_64",
+        "cpu_cores_physical": 8,
+        "cpu_cores_logical": 16,
+        "ram_total_gb": 15.6,
+        "partitions": [{"device": "/dev/sda1", "mountpoint": "/", "fstype": "ext4"}]
+    }
+
+def fake_high_freq(agent_id):
+    return {
+        "agent_id": agent_id,
+        "cpu_percent_overall": random.uniform(10.0, 95.0),
+        "cpu_percent_per_core": [random.uniform(0.0, 100.0) for _ in range(16)],
+        "ram_percent_used": random.uniform(20.0, 90.0),
+        "swap_percent_used": 0.0,
+        "network_io": {"bytes_sent_per_sec": random.randint(1000, 50000),
+                       "bytes_recv_per_sec": random.randint(10000, 500000)},
+        "disk_io": {"read_bytes_per_sec": random.randint(0, 100000),
+                    "write_bytes_per_sec": random.randint(50000, 1000000)},
+        "top_5_processes": [
+            {"pid": 100 + i, "name": f"proc-{i}", "username": "bench",
+             "cpu_percent": random.uniform(0, 50), "memory_percent": random.uniform(0, 10)}
+            for i in range(5)
+        ]
+    }
+
+def fake_low_freq(agent_id):
+    return {
+        "agent_id": agent_id,
+        "boot_time_timestamp": time.time() - 3600,
+        "logged_in_users": ["bench"],
+        "disk_usage": [
+            {"mountpoint": m, "percent_used": random.uniform(20.0, 90.0),
+             "total_gb": 467.0, "used_gb": 200.0}
+            for m in ("/", "/home", "/var")
+        ]
+    }
+
+def make_messages(agent_ids, count):
+    """
+    One low_freq message for every nine high_freq ones, like a real fleet.
+    Messages are validated up front, as the API publishes them.
+    """
+    messages = []
+    for i in range(count):
+        agent_id = random.choice(agent_ids)
+        if i % 10 == 9:
+            messages.append({"type": "low_freq", "payload": fake_low_freq(agent_id)})
+        else:
+            messages.append({"type": "high_freq", "payload": fake_high_freq(agent_id)})
+    return [trusted_message(m) for m in messages]
+
+# --- Benchmarks ---
+
+def bench_per_message(messages):
+    start = time.perf_counter()
+    for data in messages:
+        route_message(data)
+    return len(messages) / (time.perf_counter() - start)
+
+def bench_batched(messages, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(messages), batch_size):
+        chunk = messages[i:i + batch_size]
+        now = time.time()
+        write_batch([(now, data) for data in chunk])
+    return len(messages) / (time.perf_counter() - start)
+
+def cleanup():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM agents WHERE group_name = %s;", (BENCH_GROUP,))
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-message and batched worker writes.")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=settings.WORKER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    agent_ids = [str(uuid.uuid4()) for _ in range(args.agents)]
+    for num, agent_id in enumerate(agent_ids):
+        route_message({"type": "static", "payload": fake_static(agent_id, num)})
+
+    messages = make_messages(agent_ids, args.messages)
+
+    try:
+        print(f"--- Worker benchmark: {args.messages} messages, {args.agents} agents ---")
+        per_message = bench_per_message(messages)
+        print(f"Per-message path:        {per_message:10.1f} msg/s")
+        batched = bench_batched(messages, args.batch_size)
+        print(f"Batched (size {args.batch_size:>5}):    {batched:10.1f} msg/s")
+        print(f"Speed-up:                {batched / per_message:10.1f}x")
+    finally:
+        cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -28,9 +28,38 @@ CREATE TABLE agents (
     partitions JSONB
 );
 
+---
+-- TABLE 1b: agent_latest
+-- The newest high_freq and disk values per agent, kept up to date by
+-- the worker (see src/latest.py) for the fleet overview. Rows are
+-- updated in place every flush; the free space per page lets those be
+-- HOT updates that don't touch the index.
+---
+CREATE TABLE agent_latest (
+    agent_id UUID PRIMARY KEY REFERENCES agents(agent_id) ON DELETE CASCADE,
+
+    high_freq_at TIMESTAMPTZ,
+    cpu_percent FLOAT,
+    ram_percent FLOAT,
+    swap_percent FLOAT,
+    disk_read_bytes_per_sec FLOAT,
+    disk_write_bytes_per_sec FLOAT,
+    net_bytes_sent_per_sec FLOAT,
+    net_bytes_recv_per_sec FLOAT,
+
+    low_freq_at TIMESTAMPTZ,
+    disk_percent_used_max FLOAT, -- the fullest mount that answered
+    disk_fullest_mountpoint VARCHAR(255),
+    disk_used_gb NUMERIC(12, 2),
+    disk_total_gb NUMERIC(12, 2),
+    disks_unavailable INT
+) WITH (fillfactor = 70);
+
 ---
 -- TABLE 2: metrics_high_freq
--- This is the main time-series table
+-- This is the main time-series table. Like the other metric tables
+-- except metrics_low_freq_disk it has no key, so a sample delivered
+-- twice (broker redelivery, agent resend) is stored twice.
 ---
 CREATE TABLE metrics_high_freq (
     "timestamp" TIMESTAMPTZ NOT NULL,
@@ -45,12 +74,67 @@ CREATE TABLE metrics_high_freq (
     disk_read_bytes_per_sec BIGINT,
     disk_write_bytes_per_sec BIGINT,
     net_bytes_sent_per_sec BIGINT,
-    net_bytes_recv_per_sec BIGINT
+    net_bytes_recv_per_sec BIGINT,
+
+    -- Summaries of the agent's ~1s samples over the reporting interval
+    -- (NULL for agents that don't send them)
+    cpu_percent_min FLOAT,
+    cpu_percent_max FLOAT,
+    cpu_percent_mean FLOAT,
+    cpu_percent_p95 FLOAT,
+    cpu_percent_last FLOAT,
+    ram_percent_min FLOAT,
+    ram_percent_max FLOAT,
+    ram_percent_mean FLOAT,
+    ram_percent_p95 FLOAT,
+    ram_percent_last FLOAT,
+
+    -- Per-core CPU in hundredths of a percent (0-10000), core 0 first:
+    -- 2 bytes a core in one array instead of a row per core
+    cpu_percent_per_core SMALLINT[]
 );
 
 -- Turn it into a TimescaleDB Hypertable
 SELECT create_hypertable('metrics_high_freq', 'timestamp');
 
+-- Reads of one agent's range (see /v1/agents/{agent_id}/metrics) use
+-- this instead of scanning every agent's rows in the time index
+CREATE INDEX ON metrics_high_freq (agent_id, "timestamp" DESC);
+
+---
+-- TABLE 2b: metrics_net_per_nic / metrics_disk_per_device
+-- Per-NIC and per-disk rates behind the totals in metrics_high_freq
+---
+CREATE TABLE metrics_net_per_nic (
+    "timestamp" TIMESTAMPTZ NOT NULL,
+    agent_id UUID NOT NULL REFERENCES agents(agent_id) ON DELETE CASCADE,
+    nic VARCHAR(64) NOT NULL,
+
+    bytes_sent_per_sec FLOAT,
+    bytes_recv_per_sec FLOAT,
+    packets_sent_per_sec FLOAT,
+    packets_recv_per_sec FLOAT,
+    errors_per_sec FLOAT,
+    drops_per_sec FLOAT
+);
+
+SELECT create_hypertable('metrics_net_per_nic', 'timestamp');
+CREATE INDEX ON metrics_net_per_nic (agent_id, "timestamp" DESC);
+
+CREATE TABLE metrics_disk_per_device (
+    "timestamp" TIMESTAMPTZ NOT NULL,
+    agent_id UUID NOT NULL REFERENCES agents(agent_id) ON DELETE CASCADE,
+    device VARCHAR(64) NOT NULL,
+
+    read_bytes_per_sec FLOAT,
+    write_bytes_per_sec FLOAT,
+    reads_per_sec FLOAT,
+    writes_per_sec FLOAT
+);
+
+SELECT create_hypertable('metrics_disk_per_device', 'timestamp');
+CREATE INDEX ON metrics_disk_per_device (agent_id, "timestamp" DESC);
+
 ---
 -- TABLE 3: metrics_low_freq (Disk Usage)
 -- This is a separate time-series table
@@ -61,6 +145,7 @@ CREATE TABLE metrics_low_freq_disk (
     
     -- Disk info
     mountpoint VARCHAR(255),
+    available BOOLEAN NOT NULL DEFAULT TRUE, -- FALSE when the mount didn't answer in time
     percent_used FLOAT,
     total_gb NUMERIC(10, 2),
     used_gb NUMERIC(10, 2),
@@ -76,17 +161,236 @@ SELECT create_hypertable('metrics_low_freq_disk', 'timestamp');
 -- TABLE 4: process_data
 -- Stores top processes (only sent on threshold breach)
 ---
-CREATE TABLE metrics_processes (
+
+-- Every distinct (name, username) pair gets a small id once; the samples
+-- store the id instead of repeating the strings on every row
+CREATE TABLE process_identities (
+    process_id INT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    username VARCHAR(255),
+    UNIQUE NULLS NOT DISTINCT (name, username)
+);
+
+CREATE TABLE metrics_process_samples (
     "timestamp" TIMESTAMPTZ NOT NULL,
     agent_id UUID NOT NULL REFERENCES agents(agent_id) ON DELETE CASCADE,
     
     -- Process info
     pid INT,
-    name VARCHAR(255),
-    username VARCHAR(255),
+    process_id INT NOT NULL REFERENCES process_identities(process_id),
     cpu_percent FLOAT,
-    memory_percent FLOAT
+    memory_percent FLOAT,
+    io_bytes_per_sec FLOAT -- NULL when the agent can't read the process's I/O
 );
 
 -- Turn it into a TimescaleDB Hypertable
-SELECT create_hypertable('metrics_processes', 'timestamp');
\ No newline at end of file
+SELECT create_hypertable('metrics_process_samples', 'timestamp');
+CREATE INDEX ON metrics_process_samples (agent_id, "timestamp" DESC);
+
+-- "Which process hogs CPU across the lab" groups by the id, not by strings
+CREATE INDEX ON metrics_process_samples (process_id, "timestamp" DESC);
+
+-- The readable shape, with the names joined back in
+CREATE VIEW metrics_processes AS
+SELECT s."timestamp", s.agent_id, s.pid, p.name, p.username,
+       s.cpu_percent, s.memory_percent, s.io_bytes_per_sec
+FROM metrics_process_samples s
+JOIN process_identities p USING (process_id);
+
+---
+-- TABLE 5: metrics_agent_health
+-- The agent's own overhead and sender backlog, one row per report
+---
+CREATE TABLE metrics_agent_health (
+    "timestamp" TIMESTAMPTZ NOT NULL,
+    agent_id UUID NOT NULL REFERENCES agents(agent_id) ON DELETE CASCADE,
+    interval_seconds FLOAT,
+
+    -- What the agent costs the host
+    process_cpu_percent FLOAT,
+    process_rss_mb FLOAT,
+    collectors JSONB, -- Per MetricsCollector method: runs, wall ms, CPU ms
+
+    -- Sender backlog
+    queue_depth INT,
+    queue_oldest_age_seconds FLOAT,
+    spool_bytes BIGINT,
+    spool_evicted_total BIGINT,
+
+    -- Sends during the interval
+    send_requests INT,
+    send_latency_ms_p50 FLOAT,
+    send_latency_ms_max FLOAT,
+    items_sent INT,
+    send_retries INT,
+    items_dropped INT
+);
+
+-- Turn it into a TimescaleDB Hypertable
+SELECT create_hypertable('metrics_agent_health', 'timestamp');
+CREATE INDEX ON metrics_agent_health (agent_id, "timestamp" DESC);
+
+---
+-- ROLLUPS: 1-minute and 1-hour continuous aggregates
+-- avg/min/max/p95 per agent (and mountpoint) for long-range reads, so
+-- they don't scan raw chunks (see src/rollups.py). Both levels are built
+-- from the raw rows, so p95 is exact. 'materialized_only = false' adds
+-- the not yet materialized recent rows at read time.
+---
+CREATE MATERIALIZED VIEW metrics_high_freq_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 minute', "timestamp") AS bucket,
+    agent_id,
+    count(*) AS samples,
+    avg(cpu_percent_overall::float8) AS cpu_percent_overall_avg,
+    min(coalesce(cpu_percent_min, cpu_percent_overall)) AS cpu_percent_overall_min,
+    max(coalesce(cpu_percent_max, cpu_percent_overall)) AS cpu_percent_overall_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY cpu_percent_overall::float8) AS cpu_percent_overall_p95,
+    avg(ram_percent_used::float8) AS ram_percent_used_avg,
+    min(coalesce(ram_percent_min, ram_percent_used)) AS ram_percent_used_min,
+    max(coalesce(ram_percent_max, ram_percent_used)) AS ram_percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY ram_percent_used::float8) AS ram_percent_used_p95,
+    avg(swap_percent_used::float8) AS swap_percent_used_avg,
+    min(swap_percent_used::float8) AS swap_percent_used_min,
+    max(swap_percent_used::float8) AS swap_percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY swap_percent_used::float8) AS swap_percent_used_p95,
+    avg(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_avg,
+    min(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_min,
+    max(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_p95,
+    avg(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_avg,
+    min(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_min,
+    max(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_p95,
+    avg(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_avg,
+    min(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_min,
+    max(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_p95,
+    avg(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_avg,
+    min(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_min,
+    max(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_p95
+FROM metrics_high_freq
+GROUP BY bucket, agent_id
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW metrics_high_freq_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 hour', "timestamp") AS bucket,
+    agent_id,
+    count(*) AS samples,
+    avg(cpu_percent_overall::float8) AS cpu_percent_overall_avg,
+    min(coalesce(cpu_percent_min, cpu_percent_overall)) AS cpu_percent_overall_min,
+    max(coalesce(cpu_percent_max, cpu_percent_overall)) AS cpu_percent_overall_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY cpu_percent_overall::float8) AS cpu_percent_overall_p95,
+    avg(ram_percent_used::float8) AS ram_percent_used_avg,
+    min(coalesce(ram_percent_min, ram_percent_used)) AS ram_percent_used_min,
+    max(coalesce(ram_percent_max, ram_percent_used)) AS ram_percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY ram_percent_used::float8) AS ram_percent_used_p95,
+    avg(swap_percent_used::float8) AS swap_percent_used_avg,
+    min(swap_percent_used::float8) AS swap_percent_used_min,
+    max(swap_percent_used::float8) AS swap_percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY swap_percent_used::float8) AS swap_percent_used_p95,
+    avg(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_avg,
+    min(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_min,
+    max(disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY disk_read_bytes_per_sec::float8) AS disk_read_bytes_per_sec_p95,
+    avg(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_avg,
+    min(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_min,
+    max(disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY disk_write_bytes_per_sec::float8) AS disk_write_bytes_per_sec_p95,
+    avg(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_avg,
+    min(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_min,
+    max(net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY net_bytes_sent_per_sec::float8) AS net_bytes_sent_per_sec_p95,
+    avg(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_avg,
+    min(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_min,
+    max(net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY net_bytes_recv_per_sec::float8) AS net_bytes_recv_per_sec_p95
+FROM metrics_high_freq
+GROUP BY bucket, agent_id
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW metrics_low_freq_disk_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 minute', "timestamp") AS bucket,
+    agent_id, mountpoint,
+    count(*) AS samples,
+    avg(percent_used::float8) AS percent_used_avg,
+    min(percent_used::float8) AS percent_used_min,
+    max(percent_used::float8) AS percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY percent_used::float8) AS percent_used_p95,
+    avg(used_gb::float8) AS used_gb_avg,
+    min(used_gb::float8) AS used_gb_min,
+    max(used_gb::float8) AS used_gb_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY used_gb::float8) AS used_gb_p95,
+    avg(total_gb::float8) AS total_gb_avg,
+    min(total_gb::float8) AS total_gb_min,
+    max(total_gb::float8) AS total_gb_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY total_gb::float8) AS total_gb_p95
+FROM metrics_low_freq_disk
+GROUP BY bucket, agent_id, mountpoint
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW metrics_low_freq_disk_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 hour', "timestamp") AS bucket,
+    agent_id, mountpoint,
+    count(*) AS samples,
+    avg(percent_used::float8) AS percent_used_avg,
+    min(percent_used::float8) AS percent_used_min,
+    max(percent_used::float8) AS percent_used_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY percent_used::float8) AS percent_used_p95,
+    avg(used_gb::float8) AS used_gb_avg,
+    min(used_gb::float8) AS used_gb_min,
+    max(used_gb::float8) AS used_gb_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY used_gb::float8) AS used_gb_p95,
+    avg(total_gb::float8) AS total_gb_avg,
+    min(total_gb::float8) AS total_gb_min,
+    max(total_gb::float8) AS total_gb_max,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY total_gb::float8) AS total_gb_p95
+FROM metrics_low_freq_disk
+GROUP BY bucket, agent_id, mountpoint
+WITH NO DATA;
+
+-- Keep the rollups current. The 1h refresh window (3 days) must stay
+-- shorter than RAW_RETENTION, or refreshing would erase rollups of
+-- dropped raw data (src/policies.py checks this). Rows written with
+-- older timestamps (backfills, late spool replays) are refreshed by the
+-- worker and the backfill endpoint (see LateRows in src/rollups.py).
+SELECT add_continuous_aggregate_policy('metrics_high_freq_1m',
+    start_offset => INTERVAL '3 hours', end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute');
+SELECT add_continuous_aggregate_policy('metrics_high_freq_1h',
+    start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes');
+SELECT add_continuous_aggregate_policy('metrics_low_freq_disk_1m',
+    start_offset => INTERVAL '3 hours', end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute');
+SELECT add_continuous_aggregate_policy('metrics_low_freq_disk_1h',
+    start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes');
+
+---
+-- COMPRESSION
+-- Compressed chunks are segmented by agent, so one host's range is
+-- still read without decompressing everyone's. When chunks get
+-- compressed, and when raw data and rollups are dropped, is set from
+-- .env by src/policies.py (the worker applies it at startup).
+---
+ALTER TABLE metrics_high_freq SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id', timescaledb.compress_orderby = '"timestamp" DESC');
+ALTER TABLE metrics_net_per_nic SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id, nic', timescaledb.compress_orderby = '"timestamp" DESC');
+ALTER TABLE metrics_disk_per_device SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id, device', timescaledb.compress_orderby = '"timestamp" DESC');
+ALTER TABLE metrics_low_freq_disk SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id, mountpoint', timescaledb.compress_orderby = '"timestamp" DESC');
+ALTER TABLE metrics_process_samples SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id', timescaledb.compress_orderby = '"timestamp" DESC');
+ALTER TABLE metrics_agent_health SET (timescaledb.compress,
+    timescaledb.compress_segmentby = 'agent_id', timescaledb.compress_orderby = '"timestamp" DESC');
\ No newline at end of file
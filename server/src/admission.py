@@ -0,0 +1,174 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# --- Admission Control ---
+# Decides, before anything is published, whether the API can take a
+# request. Each agent has a token bucket and all agents share a global
+# one (one token per item), so a single agent draining a large backlog
+# can't crowd out the rest. On top of that, the broker's queue depth
+# and the publisher's confirm latency give a "pressure" between 0 and 1:
+#
+#   0 < pressure < 1   high_freq items are shed, each with probability
+#                      'pressure'; everything else is still accepted
+#   pressure >= 1      whole requests are refused with 429
+#
+# A refused request carries Retry-After, and agents keep the data
+# spooled until then.
+
+# Item types that may be dropped under pressure (most expendable first)
+SHEDDABLE_TYPES = ("high_freq",)
+
+class TokenBucket:
+    """
+    'rate' tokens per second, up to 'burst'. A request is let through
+    whenever the bucket isn't empty and may leave it in debt, so batches
+    larger than the burst still get through - the agent then waits the
+    debt off before its next one.
+    """
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until the bucket has a token again (0 if it has one now)."""
+        return 0.0 if self.tokens > 0 else (1 - self.tokens) / self.rate
+
+    def take(self, count):
+        self.tokens -= count
+
+
+class Decision:
+    def __init__(self, admitted, retry_after=None, reason=None, shed_probability=0.0,
+                 agent_id=None, items=0):
+        self.admitted = admitted
+        self.retry_after = retry_after          # whole seconds, when refused
+        self.reason = reason
+        self.shed_probability = shed_probability
+        self.agent_id = agent_id                # who was charged, and how many tokens
+        self.items = items
+
+    def shed(self, messages):
+        """
+        Drops sheddable items from a list of messages according to the
+        pressure. Returns (kept, number shed).
+        """
+        if self.shed_probability <= 0:
+            return messages, 0
+        kept = [
+            m for m in messages
+            if m.get("type") not in SHEDDABLE_TYPES or random.random() >= self.shed_probability
+        ]
+        return kept, len(messages) - len(kept)
+
+
+class AdmissionController:
+
+    def __init__(self, agent_rate, agent_burst, global_rate, global_burst,
+                 queue_soft, queue_hard, latency_soft_ms, latency_hard_ms,
+                 retry_after_min, retry_after_max, max_agents=100000):
+        self.agent_rate = agent_rate
+        self.agent_burst = agent_burst
+        self.queue_soft = queue_soft
+        self.queue_hard = queue_hard
+        self.latency_soft = latency_soft_ms / 1000
+        self.latency_hard = latency_hard_ms / 1000
+        self.retry_after_min = retry_after_min
+        self.retry_after_max = retry_after_max
+        self.max_agents = max_agents
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._agents = OrderedDict()  # agent_id -> TokenBucket, least recently used first
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.refused = {}             # reason -> count
+        self.shed_items = 0
+        self.last_pressure = 0.0
+
+    def pressure(self, queue_depth, publish_latency):
+        """0 when the pipeline keeps up, 1 or more when it must stop taking data."""
+        def scale(value, soft, hard):
+            if value is None or value <= soft:
+                return 0.0
+            return (value - soft) / max(hard - soft, 1e-9)
+        return max(scale(queue_depth, self.queue_soft, self.queue_hard),
+                   scale(publish_latency, self.latency_soft, self.latency_hard))
+
+    def _agent_bucket(self, agent_id, now):
+        bucket = self._agents.get(agent_id)
+        if bucket is None:
+            bucket = self._agents[agent_id] = TokenBucket(self.agent_rate, self.agent_burst, now)
+            if len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+        else:
+            self._agents.move_to_end(agent_id)
+        bucket.refill(now)
+        return bucket
+
+    def _retry_after(self, wait, pressure):
+        """Whole seconds, at least the minimum, longer the higher the pressure."""
+        base = self.retry_after_min * max(1.0, pressure)
+        return int(min(self.retry_after_max, math.ceil(max(wait, base))))
+
+    def _refuse(self, reason, wait, pressure):
+        self.refused[reason] = self.refused.get(reason, 0) + 1
+        return Decision(False, self._retry_after(wait, pressure), reason)
+
+    def admit(self, agent_id, items, queue_depth=None, publish_latency=None):
+        """Checks a request with 'items' items from one agent."""
+        now = time.monotonic()
+        pressure = self.pressure(queue_depth, publish_latency)
+        with self._lock:
+            self.last_pressure = pressure
+            if pressure >= 1:
+                return self._refuse("overloaded", 0, pressure)
+
+            agent = self._agent_bucket(agent_id, now)
+            self._global.refill(now)
+            if agent.wait_time() > 0:
+                return self._refuse("agent_rate", agent.wait_time(), pressure)
+            if self._global.wait_time() > 0:
+                return self._refuse("global_rate", self._global.wait_time(), pressure)
+
+            agent.take(items)
+            self._global.take(items)
+            self.admitted += 1
+        return Decision(True, shed_probability=min(pressure, 1.0), agent_id=agent_id, items=items)
+
+    def refund(self, decision):
+        """
+        Gives back the tokens of an admitted request that was then
+        rejected (e.g. 409 keyframe required, 422 invalid), so an agent
+        resyncing or fixing its data isn't rate limited for it.
+        """
+        if not decision.admitted or not decision.items:
+            return
+        with self._lock:
+            agent = self._agents.get(decision.agent_id)
+            if agent is not None:
+                agent.tokens = min(agent.burst, agent.tokens + decision.items)
+            self._global.tokens = min(self._global.burst, self._global.tokens + decision.items)
+            decision.items = 0
+
+    def record_shed(self, count):
+        with self._lock:
+            self.shed_items += count
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "pressure": round(self.last_pressure, 3),
+                "admitted_requests": self.admitted,
+                "refused_requests": dict(self.refused),
+                "shed_items": self.shed_items,
+                "tracked_agents": len(self._agents),
+                "global_tokens": round(self._global.tokens, 1),
+            }
\ No newline at end of file
@@ -0,0 +1,461 @@
+import csv
+import io
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+import psycopg2
+from pydantic import ValidationError
+from .config import settings
+from .models import IngestDataAdapter
+from .process_identities import ProcessIdentities
+from .rollups import LateRows
+from .rows import (
+    SUMMARY_COLUMNS, AGENT_HEALTH_COLUMNS, normalize, static_values, high_freq_values,
+    agent_health_values, nic_rows, disk_device_rows, process_rows, disk_usage_rows,
+    quantize_cores
+)
+
+# --- Bulk Backfill ---
+# Loads historical data (an agent's spool after a long outage, a dump
+# from another tool) straight into the hypertables with COPY, skipping
+# the broker and the worker. The upload is read line by line, so memory
+# use is bounded by BACKFILL_COPY_ROWS buffered rows per table, not by
+# the size of the upload. Bad lines are counted and reported, the rest
+# of the upload still goes in.
+
+def _columns(text):
+    return tuple(c.strip() for c in text.split(","))
+
+# Columns each table is COPYed with, in row order
+COPY_COLUMNS = {
+    "metrics_high_freq": (
+        "timestamp", "agent_id", "cpu_percent_overall", "ram_percent_used",
+        "swap_percent_used", "disk_read_bytes_per_sec", "disk_write_bytes_per_sec",
+        "net_bytes_sent_per_sec", "net_bytes_recv_per_sec"
+    ) + _columns(SUMMARY_COLUMNS) + ("cpu_percent_per_core",),
+    "metrics_net_per_nic": (
+        "timestamp", "agent_id", "nic", "bytes_sent_per_sec", "bytes_recv_per_sec",
+        "packets_sent_per_sec", "packets_recv_per_sec", "errors_per_sec", "drops_per_sec"
+    ),
+    "metrics_disk_per_device": (
+        "timestamp", "agent_id", "device", "read_bytes_per_sec",
+        "write_bytes_per_sec", "reads_per_sec", "writes_per_sec"
+    ),
+    "metrics_processes": (
+        "timestamp", "agent_id", "pid", "name", "username",
+        "cpu_percent", "memory_percent", "io_bytes_per_sec"
+    ),
+    "metrics_low_freq_disk": (
+        "timestamp", "agent_id", "mountpoint", "available",
+        "percent_used", "total_gb", "used_gb"
+    ),
+    "metrics_agent_health": ("timestamp",) + _columns(AGENT_HEALTH_COLUMNS),
+}
+
+# metrics_processes is a view; its rows are COPYed into the hypertable
+# behind it, with (name, username) replaced by a process_id
+PROCESS_SAMPLE_COLUMNS = (
+    "timestamp", "agent_id", "pid", "process_id",
+    "cpu_percent", "memory_percent", "io_bytes_per_sec"
+)
+
+# Tables with a primary key. Rows go through a staging table and
+# duplicates of rows already stored are skipped, instead of failing
+# the whole COPY.
+UPSERT_KEYS = {
+    "metrics_low_freq_disk": ("agent_id", "mountpoint", "timestamp"),
+}
+
+# CSV uploads: ?table=<name> -> (table, {column: converter}).
+# The header row names the columns; "timestamp" and "agent_id" are required.
+def _bool(value):
+    if value.strip().lower() in ("1", "t", "true", "yes"):
+        return True
+    if value.strip().lower() in ("0", "f", "false", "no"):
+        return False
+    raise ValueError(f"not a boolean: '{value}'")
+
+def _cores(value):
+    # Per-core percents, e.g. "12.5;80" or "{12.5,80}"
+    parts = value.strip().strip("{}[]").replace(";", ",").split(",")
+    return quantize_cores([float(p) for p in parts if p.strip()])
+
+CSV_TABLES = {
+    "high_freq": ("metrics_high_freq", dict(
+        {c: float for c in COPY_COLUMNS["metrics_high_freq"][2:5]},
+        **{c: int for c in COPY_COLUMNS["metrics_high_freq"][5:9]},
+        **{c: float for c in COPY_COLUMNS["metrics_high_freq"][9:-1]},
+        cpu_percent_per_core=_cores
+    )),
+    "processes": ("metrics_processes", {
+        "pid": int, "name": str, "username": str, "cpu_percent": float,
+        "memory_percent": float, "io_bytes_per_sec": float
+    }),
+    "disk": ("metrics_low_freq_disk", {
+        "mountpoint": str, "available": _bool, "percent_used": float,
+        "total_gb": float, "used_gb": float
+    }),
+}
+
+# Values for CSV columns that are left out or empty but can't be NULL
+CSV_DEFAULTS = {"available": True}
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-seq"}
+CSV_CONTENT_TYPE = "text/csv"
+
+class BackfillError(Exception):
+    """The upload can't be loaded at all (bad parameters)."""
+
+class BackfillUnavailable(Exception):
+    """The database could not be reached or went away mid-upload."""
+
+def parse_timestamp(value):
+    """Epoch seconds or an ISO 8601 string (UTC if it has no offset)."""
+    if isinstance(value, bool) or value is None:
+        raise ValueError("missing or invalid timestamp")
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.fromtimestamp(value, timezone.utc)
+    except (TypeError, OverflowError, OSError) as e:
+        raise ValueError(f"invalid timestamp: {e}")
+
+def copy_value(value):
+    """One field in COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        return (value.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+    if isinstance(value, list):
+        # Array of numbers, e.g. cpu_percent_per_core
+        return "{" + ",".join(str(v) for v in value) + "}"
+    return str(value)
+
+
+class LineSplitter:
+    """
+    Splits a byte stream into lines. A line longer than 'max_bytes' is
+    dropped (up to its newline) and reported as None, so one runaway
+    line can't make the buffer grow without bound.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._buffer = bytearray()
+        self._overlong = False
+
+    def feed(self, data):
+        self._buffer += data
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            yield None if self._overlong else bytes(self._buffer[start:end]).rstrip(b"\r")
+            self._overlong = False
+            start = end + 1
+        del self._buffer[:start]
+        if len(self._buffer) > self.max_bytes:
+            self._overlong = True
+            self._buffer.clear()
+
+    def finish(self):
+        if self._overlong:
+            yield None
+        elif self._buffer.strip():
+            yield bytes(self._buffer)
+        self._buffer.clear()
+        self._overlong = False
+
+
+class BackfillLoader:
+    """
+    Parses one upload and COPYs its rows in, committing every time a
+    table has BACKFILL_COPY_ROWS rows buffered.
+
+    NDJSON lines are the items agents queue: {"type", "timestamp",
+    "payload"}, where the timestamp (epoch seconds or ISO 8601) is
+    required and kept. "static" lines register the agent (existing
+    agents are left alone); "high_freq", "low_freq" and "agent_health"
+    lines become metric rows. CSV uploads hold rows for a single table
+    (see CSV_TABLES), one record per line.
+
+    Lines for agents the server has never seen are rejected, as the
+    metric tables reference the agents table.
+    """
+
+    def __init__(self, conn, fmt="ndjson", table=None):
+        check_format(fmt, table)
+        if fmt == "csv":
+            self.csv_table, self.csv_types = CSV_TABLES[table]
+        self.conn = conn
+        self.fmt = fmt
+        self.lines = LineSplitter(settings.BACKFILL_MAX_LINE_BYTES)
+        self.header = None
+        self.buffers = {name: [] for name in COPY_COLUMNS}
+        self.known_agents = {}
+        self.process_identities = ProcessIdentities(settings.PROCESS_IDENTITY_CACHE_SIZE)
+        self.late_rows = LateRows()
+        self.line_no = 0
+        self.pending_from = None    # first line in the unflushed buffers
+        self.pending_lines = 0      # lines in the unflushed buffers
+        self.rows = {name: 0 for name in COPY_COLUMNS}
+        self.rejected = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    # --- Parsing ---
+
+    def feed(self, data: bytes):
+        for line in self.lines.feed(data):
+            self._line(line)
+
+    def finish(self):
+        """Loads what is left and returns the upload's summary."""
+        for line in self.lines.finish():
+            self._line(line)
+        self.flush()
+        seconds = time.monotonic() - self.started
+        total = sum(self.rows.values())
+        return {
+            "lines": self.line_no,
+            "rows": {name: n for name, n in self.rows.items() if n},
+            "rows_total": total,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(total / seconds, 1) if seconds > 0 else None,
+        }
+
+    def _reject(self, line_no, error):
+        self.rejected += 1
+        if len(self.errors) < settings.BACKFILL_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": error})
+
+    def _line(self, line):
+        self.line_no += 1
+        if line is None:
+            self._reject(self.line_no, f"Line longer than {settings.BACKFILL_MAX_LINE_BYTES} bytes")
+            return
+        if not line.strip():
+            return
+        try:
+            if self.fmt == "csv":
+                rows = self._csv_rows(line)
+            else:
+                rows = self._ndjson_rows(line)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            self._reject(self.line_no, f"{field}: {error['msg']}" if field else error["msg"])
+            return
+        except (ValueError, TypeError, KeyError) as e:
+            self._reject(self.line_no, str(e).splitlines()[0] if str(e) else repr(e))
+            return
+        if not rows:
+            return
+
+        for table, row in rows:
+            self.buffers[table].append(row)
+        if self.pending_from is None:
+            self.pending_from = self.line_no
+        self.pending_lines += 1
+        if any(len(b) >= settings.BACKFILL_COPY_ROWS for b in self.buffers.values()):
+            self.flush()
+
+    def _ndjson_rows(self, line):
+        item = json.loads(line)
+        if not isinstance(item, dict):
+            raise ValueError("expected a JSON object")
+        msg_type = item.get("type")
+        payload = item.get("payload")
+        if not msg_type or not isinstance(payload, dict):
+            raise ValueError("expected 'type' and 'payload'")
+        ts = parse_timestamp(item.get("timestamp"))
+        # The timestamp may be ISO 8601 here, so only the rest is validated
+        payload = normalize(IngestDataAdapter.validate_python(dict(item, timestamp=None)))["payload"]
+
+        if msg_type == "static":
+            self._register_agent(payload)
+            return []
+
+        stamp = (ts,)
+        self._known(payload["agent_id"])
+        if msg_type == "high_freq":
+            return ([("metrics_high_freq", stamp + high_freq_values(payload))]
+                    + [("metrics_net_per_nic", stamp + row) for row in nic_rows(payload)]
+                    + [("metrics_disk_per_device", stamp + row) for row in disk_device_rows(payload)]
+                    + [("metrics_processes", stamp + row) for row in process_rows(payload)])
+        if msg_type == "low_freq":
+            return [("metrics_low_freq_disk", stamp + row) for row in disk_usage_rows(payload)]
+        return [("metrics_agent_health", stamp + agent_health_values(payload))]
+
+    def _csv_rows(self, line):
+        fields = next(csv.reader([line.decode("utf-8")]))
+        if self.header is None:
+            unknown = set(fields) - set(self.csv_types) - {"timestamp", "agent_id"}
+            if unknown or not {"timestamp", "agent_id"} <= set(fields):
+                raise BackfillError(
+                    f"CSV header must have timestamp, agent_id and columns of "
+                    f"{self.csv_table} (unknown: {', '.join(sorted(unknown)) or 'none'})")
+            self.header = fields
+            return []
+        if len(fields) != len(self.header):
+            raise ValueError(f"expected {len(self.header)} fields, got {len(fields)}")
+
+        record = dict(zip(self.header, fields))
+        values = {
+            "timestamp": parse_timestamp(record.pop("timestamp")),
+            "agent_id": self._known(uuid.UUID(record.pop("agent_id"))),
+        }
+        for column, text in record.items():
+            values[column] = self.csv_types[column](text) if text != "" else CSV_DEFAULTS.get(column)
+        row = tuple(values.get(c, CSV_DEFAULTS.get(c)) for c in COPY_COLUMNS[self.csv_table])
+        return [(self.csv_table, row)]
+
+    # --- Agents ---
+
+    def _known(self, agent_id):
+        agent_id = str(agent_id)
+        if agent_id not in self.known_agents:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM agents WHERE agent_id = %s;", (agent_id,))
+                self.known_agents[agent_id] = cur.fetchone() is not None
+            self.conn.commit()
+        if not self.known_agents[agent_id]:
+            raise ValueError(f"unknown agent {agent_id} (send its static data first)")
+        return agent_id
+
+    def _register_agent(self, payload: dict):
+        """Adds an agent the server doesn't know yet. Committed right away,
+        so its rows can be loaded whatever happens to later flushes."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO agents (
+                    agent_id, hostname, os, cpu_cores_physical, cpu_cores_logical,
+                    ram_total_gb, partitions, group_name, sub_group_name
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (agent_id) DO NOTHING;
+                """,
+                static_values(payload)
+            )
+        self.conn.commit()
+        self.known_agents[payload["agent_id"]] = True
+
+    # --- Loading ---
+
+    def flush(self):
+        """COPYs every buffered row in one transaction."""
+        if not self.pending_lines:
+            return
+        try:
+            # New process identities are committed first, on their own
+            processes = self.process_identities.with_ids(
+                self.conn, self.buffers["metrics_processes"], 3
+            )
+            with self.conn.cursor() as cur:
+                for table, rows in self.buffers.items():
+                    if table == "metrics_processes":
+                        self._copy(cur, "metrics_process_samples", processes, PROCESS_SAMPLE_COLUMNS)
+                    else:
+                        self._copy(cur, table, rows)
+            self.conn.commit()
+            for table, rows in self.buffers.items():
+                self.rows[table] += len(rows)
+                self.late_rows.add(table, (row[0].timestamp() for row in rows))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            raise BackfillUnavailable(str(e))
+        except psycopg2.Error as e:
+            # Rows that got past validation but not the database (e.g. an
+            # agent deleted mid-upload). Only this flush is lost.
+            self.conn.rollback()
+            last = self.pending_from + self.pending_lines - 1
+            print(f"Backfill: COPY of lines {self.pending_from}-{last} failed: {e}")
+            self.rejected += self.pending_lines
+            if len(self.errors) < settings.BACKFILL_MAX_ERRORS:
+                self.errors.append({
+                    "line": self.pending_from,
+                    "error": f"lines {self.pending_from}-{last} not loaded: {str(e).strip()}"
+                })
+        finally:
+            for rows in self.buffers.values():
+                rows.clear()
+            self.pending_from = None
+            self.pending_lines = 0
+
+    def refresh_rollups(self):
+        """
+        Refreshes the rollups over the loaded rows the refresh policies
+        don't look back far enough for. A failure only leaves them
+        missing from the rollups; the raw rows stay loaded.
+        """
+        try:
+            for rollup, start, end in self.late_rows.refresh(self.conn):
+                print(f"Backfill: refreshed {rollup} from {start.isoformat()} to {end.isoformat()}")
+        except psycopg2.Error as e:
+            print(f"Backfill: could not refresh rollups: {e}")
+
+    def _copy(self, cur, table, rows, columns=None):
+        if not rows:
+            return
+        columns = columns or COPY_COLUMNS[table]
+        data = io.StringIO()
+        for row in rows:
+            data.write("\t".join(copy_value(v) for v in row))
+            data.write("\n")
+        data.seek(0)
+
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        key = UPSERT_KEYS.get(table)
+        if key is None:
+            cur.copy_expert(f"COPY {table} ({column_list}) FROM STDIN", data)
+            return
+
+        staging = f"backfill_{table}"
+        key_list = ", ".join(f'"{c}"' for c in key)
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;"
+        )
+        cur.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", data)
+        cur.execute(
+            f"INSERT INTO {table} ({column_list}) "
+            f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {staging} "
+            f"ON CONFLICT DO NOTHING;"
+        )
+
+
+def check_format(fmt, table=None):
+    if fmt == "csv" and table not in CSV_TABLES:
+        raise BackfillError(f"CSV uploads need ?table= one of {', '.join(CSV_TABLES)}")
+
+def open_loader(fmt, table=None):
+    """A BackfillLoader on its own connection (an upload can run for minutes)."""
+    check_format(fmt, table)
+    try:
+        conn = psycopg2.connect(settings.DATABASE_URL)
+    except psycopg2.Error as e:
+        raise BackfillUnavailable(str(e))
+    try:
+        return BackfillLoader(conn, fmt, table)
+    except Exception:
+        conn.close()
+        raise
+
+def close_loader(loader):
+    """Brings the rollups up to date with what was loaded and closes the connection."""
+    if not loader.conn.closed:
+        loader.refresh_rollups()
+    loader.conn.close()
@@ -0,0 +1,113 @@
+import gzip
+import json
+import zlib
+
+# msgpack and zstandard are listed in requirements.txt, but the API still
+# works without them: it just answers 415 and agents fall back to JSON.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+MSGPACK_ALIASES = {MSGPACK_CONTENT_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+# Largest body we will inflate, to guard against compression bombs
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+class UnsupportedEncoding(Exception):
+    """The body uses a content type or encoding this server can't read."""
+
+class MalformedBody(Exception):
+    """The body could not be decompressed or parsed."""
+
+def decompress(body: bytes, content_encoding: str = None) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+
+    try:
+        if encoding == "identity":
+            return body
+        if encoding == "gzip":
+            return gzip.decompress(body)
+        if encoding == "zstd" and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(
+                body, max_output_size=MAX_DECOMPRESSED_BYTES
+            )
+    except Exception as e:
+        # gzip raises OSError/EOFError, zstandard its own ZstdError
+        raise MalformedBody(f"Could not decompress body: {e}")
+
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding '{encoding}'")
+
+class StreamDecompressor:
+    """
+    Decompresses a body chunk by chunk, for uploads too big to hold in
+    memory. No single chunk may inflate past MAX_DECOMPRESSED_BYTES.
+    """
+
+    def __init__(self, content_encoding: str = None):
+        encoding = (content_encoding or "identity").strip().lower()
+        if encoding == "identity":
+            self._obj = None
+        elif encoding == "gzip":
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "zstd" and zstandard is not None:
+            self._obj = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise UnsupportedEncoding(f"Unsupported Content-Encoding '{encoding}'")
+        self._gzip = encoding == "gzip"
+
+    def decompress(self, chunk: bytes) -> bytes:
+        if self._obj is None:
+            return chunk
+        try:
+            if self._gzip:
+                data = self._obj.decompress(chunk, MAX_DECOMPRESSED_BYTES)
+                too_big = bool(self._obj.unconsumed_tail)
+            else:
+                data = self._obj.decompress(chunk)
+                too_big = len(data) > MAX_DECOMPRESSED_BYTES
+        except Exception as e:
+            raise MalformedBody(f"Could not decompress body: {e}")
+        if too_big:
+            raise MalformedBody("Body chunk inflates past the decompression limit")
+        return data
+
+def loads(body: bytes, content_type: str = None):
+    """Parses a JSON or msgpack body based on its content type."""
+    media_type = (content_type or JSON_CONTENT_TYPE).split(";")[0].strip().lower()
+
+    try:
+        if media_type == JSON_CONTENT_TYPE:
+            return json.loads(body)
+        if media_type in MSGPACK_ALIASES and msgpack is not None:
+            return msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        # json raises ValueError, msgpack its own ExtraData/FormatError
+        raise MalformedBody(f"Could not parse body: {e}")
+
+    raise UnsupportedEncoding(f"Unsupported Content-Type '{media_type}'")
+
+def decode_request(body: bytes, content_type: str = None, content_encoding: str = None):
+    """Decompresses and parses an agent request body."""
+    return loads(decompress(body, content_encoding), content_type)
+
+# --- Broker Messages ---
+# Messages between the API and the worker use msgpack when available.
+# The content type travels in the AMQP message properties.
+
+def encode_message(message_body) -> tuple:
+    """Returns (body, content_type) for publishing to the broker."""
+    if msgpack is not None:
+        return msgpack.packb(message_body, use_bin_type=True), MSGPACK_CONTENT_TYPE
+    return json.dumps(message_body).encode(), JSON_CONTENT_TYPE
+
+def decode_message(body: bytes, content_type: str = None):
+    """Decodes a broker message. Messages without a content type are JSON."""
+    return loads(body, content_type)
@@ -17,6 +17,94 @@ class Settings(BaseSettings):
     # API Security
     AGENT_API_KEY: str
 
+    # Worker Pool
+    # Number of worker processes. Each has its own queue, and an agent's
+    # messages always go to the same one (1 = the single 'metrics_queue')
+    WORKER_SHARDS: int = 1
+    # Database connections each worker process may open
+    DB_POOL_MAX: int = 2
+
+    # Agent Registry
+    # How often each worker writes the agents' last_seen times and latest values it collected (in seconds)
+    AGENT_LAST_SEEN_FLUSH_S: float = 15.0
+    # Most agents each worker process keeps in its registry
+    AGENT_REGISTRY_SIZE: int = 100000
+    # Most (name, username) -> process_id pairs each writer keeps in memory
+    PROCESS_IDENTITY_CACHE_SIZE: int = 50000
+    # Hours of late rows (older than the rollup refresh policies look back)
+    # each worker refreshes the rollups over per flush; the rest waits for the next
+    WORKER_ROLLUP_REFRESH_HOURS: int = 6
+
+    # Worker Retries
+    # Delays (in seconds, comma-separated) of the tiers a failed message is retried through
+    WORKER_RETRY_DELAYS: str = "5,30,300"
+    # Retries before a message is moved to the dead-letter queue
+    WORKER_MAX_RETRIES: int = 5
+    # Longest wait (in seconds) between database checks while the database is down
+    WORKER_DB_PROBE_MAX_S: float = 30.0
+
+    # Worker Batching
+    # How many messages the worker buffers before writing them in one transaction
+    WORKER_BATCH_SIZE: int = 500
+    # The longest a partial batch may wait before it is flushed (in milliseconds)
+    WORKER_BATCH_LINGER_MS: int = 1000
+
+    # API Publisher
+    # Most messages published together before their confirms are awaited
+    MQ_PUBLISH_BATCH: int = 100
+    # How long an ingest request waits for the broker to confirm (in milliseconds)
+    MQ_PUBLISH_TIMEOUT_MS: int = 5000
+
+    # Most items accepted in one /v1/data/ingest/batch request
+    MAX_INGEST_BATCH: int = 1000
+
+    # Admission Control
+    # Items per second (and burst) each agent may send, and all agents together
+    ADMISSION_AGENT_RATE: float = 10.0
+    ADMISSION_AGENT_BURST: int = 1000
+    ADMISSION_GLOBAL_RATE: float = 5000.0
+    ADMISSION_GLOBAL_BURST: int = 20000
+    # Depth (in messages) of the busiest shard queue at which high_freq data
+    # starts to be shed, and at which requests are refused with 429
+    ADMISSION_QUEUE_SOFT: int = 20000
+    ADMISSION_QUEUE_HARD: int = 200000
+    # The same for the publisher's average confirm latency (in milliseconds)
+    ADMISSION_LATENCY_SOFT_MS: int = 250
+    ADMISSION_LATENCY_HARD_MS: int = 2000
+    # Bounds for the Retry-After sent with 429 and 503 (in seconds)
+    ADMISSION_RETRY_AFTER_MIN: int = 5
+    ADMISSION_RETRY_AFTER_MAX: int = 120
+    # How often the API reads the queue depth (in milliseconds)
+    MQ_QUEUE_POLL_MS: int = 1000
+
+    # Storage Policies (applied by the worker at startup; "" turns one off)
+    # Raw chunks older than this are compressed
+    COMPRESS_AFTER: str = "2 days"
+    # How long raw rows are kept (the rollups keep them summarized); must be
+    # longer than the 3 days the 1-hour rollups are refreshed over
+    RAW_RETENTION: str = "30 days"
+    # How long the 1-minute and 1-hour rollups are kept
+    ROLLUP_1M_RETENTION: str = "90 days"
+    ROLLUP_1H_RETENTION: str = ""
+
+    # Read API
+    # Points a /v1/agents/{agent_id}/metrics series is thinned to by default, and at most
+    QUERY_DEFAULT_POINTS: int = 500
+    QUERY_MAX_POINTS: int = 5000
+    # Agents seen within this many seconds count as online in /v1/fleet/status
+    # (keep it well above AGENT_LAST_SEEN_FLUSH_S plus the agents' send interval)
+    FLEET_ONLINE_WINDOW_S: float = 60.0
+    # How long the API reuses one read of the fleet snapshot (in milliseconds)
+    FLEET_CACHE_MS: int = 2000
+
+    # Bulk Backfill
+    # Rows buffered per table before they are COPYed and committed
+    BACKFILL_COPY_ROWS: int = 5000
+    # Longest line accepted in a backfill upload (in bytes)
+    BACKFILL_MAX_LINE_BYTES: int = 1024 * 1024
+    # Most rejected lines described in a backfill response
+    BACKFILL_MAX_ERRORS: int = 100
+
     # Get the database connection string
     @property
     def DATABASE_URL(self) -> str:
@@ -1,41 +1,71 @@
 import psycopg2
 from psycopg2 import pool
-import sys
 from .config import settings
 
-# Create a connection pool
-# This pool will be used by our worker to get connections
-try:
-    db_pool = psycopg2.pool.SimpleConnectionPool(
-        minconn=1,
-        maxconn=5,  # Max 5 connections, adjust as needed
-        dsn=settings.DATABASE_URL
-    )
-    print("Database connection pool created successfully.")
+# The connection pool is created on first use, not at import: every
+# worker process needs its own connections (psycopg2 connections can't
+# be shared across a fork), and the parent process never touches the
+# database at all. The pool is thread-safe because the API reads
+# through it from its thread pool.
+db_pool = None
 
-except (Exception, psycopg2.DatabaseError) as error:
-    print(f"Error while creating connection pool: {error}")
-    sys.exit(1)
+def get_db_pool():
+    """
+    Get this process's connection pool, creating it if needed.
+    Returns None while the database can't be reached.
+    """
+    global db_pool
+    if db_pool is None:
+        try:
+            db_pool = psycopg2.pool.ThreadedConnectionPool(
+                minconn=1,
+                maxconn=settings.DB_POOL_MAX,
+                dsn=settings.DATABASE_URL
+            )
+            print("Database connection pool created successfully.")
+        except (Exception, psycopg2.DatabaseError) as error:
+            print(f"Error while creating connection pool: {error}")
+    return db_pool
 
 def get_db_connection():
     """
     Get a connection from the pool.
     """
     try:
-        return db_pool.getconn()
+        db = get_db_pool()
+        return db.getconn() if db else None
     except Exception as error:
         print(f"Error getting connection from pool: {error}")
         return None
 
+def check_db_connection():
+    """
+    True if the database answers a trivial query. A broken pooled
+    connection is dropped by the pool when it is released.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+    finally:
+        release_db_connection(conn)
+
 def release_db_connection(conn):
     """
     Release a connection back to the pool.
     """
-    if conn:
+    if conn and db_pool:
         db_pool.putconn(conn)
 
 def close_db_pool():
     """
     Close all connections in the pool (on app shutdown).
     """
-    db_pool.closeall()
\ No newline at end of file
+    if db_pool:
+        db_pool.closeall()
\ No newline at end of file
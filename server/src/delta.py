@@ -0,0 +1,70 @@
+import copy
+import threading
+
+# --- Delta Decoding ---
+# Matches the agent's DeltaEncoder (agent/delta.py). The API keeps the
+# last snapshot of each (agent, type) chain and rebuilds full payloads
+# before they are validated and published, so the worker and the
+# database always see complete data.
+
+QUANTUM = 10  # per-core CPU deltas are in tenths of a percent
+
+class KeyframeRequired(Exception):
+    """A delta refers to a snapshot this server doesn't have."""
+
+class DeltaDecoder:
+
+    def __init__(self):
+        # (agent_id, type) -> (seq, full payload)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def decode(self, items):
+        """
+        Rebuilds full payloads for a list of IngestEnvelope items, in order.
+        Returns (messages, updates). Call commit(updates) only after the
+        messages were published, so a failed request can be resent
+        against the same snapshots.
+        """
+        messages = []
+        updates = {}
+
+        for item in items:
+            payload = item.payload
+            if item.encoding in ("keyframe", "delta"):
+                if not isinstance(payload, dict) or "agent_id" not in payload:
+                    raise KeyframeRequired("Encoded payload without agent_id")
+                key = (str(payload["agent_id"]), item.type)
+
+                if item.encoding == "delta":
+                    seq, base = updates.get(key) or self._snapshots.get(key, (None, None))
+                    if base is None or seq != item.base_seq:
+                        raise KeyframeRequired(f"No snapshot {item.base_seq} for {key[1]}")
+                    payload = apply_delta(base, payload)
+
+                updates[key] = (item.seq, payload)
+
+            messages.append({"type": item.type, "payload": payload, "timestamp": item.timestamp})
+
+        return messages, updates
+
+    def commit(self, updates):
+        with self._lock:
+            self._snapshots.update(updates)
+
+def apply_delta(base: dict, delta: dict) -> dict:
+    payload = {key: copy.deepcopy(base[key]) for key in delta.get("unchanged", []) if key in base}
+
+    for key, value in delta.items():
+        if key == "unchanged":
+            continue
+        if key.endswith("_delta"):
+            field = key[:-len("_delta")]
+            previous = [round(v * QUANTUM) for v in base.get(field, [])]
+            if len(previous) != len(value):
+                raise KeyframeRequired(f"Series '{field}' changed length")
+            payload[field] = [(p + d) / QUANTUM for p, d in zip(previous, value)]
+        else:
+            payload[key] = value
+
+    return payload
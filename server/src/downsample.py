@@ -0,0 +1,58 @@
+# --- Largest-Triangle-Three-Buckets ---
+# Thins a series down to a point budget while keeping its visual shape
+# (Steinarsson, "Downsampling Time Series for Visual Representation",
+# 2013). The first and last points are always kept; the rest is split
+# into equal buckets, and each bucket keeps the point that forms the
+# largest triangle with the point kept before it and the average of the
+# next bucket - so spikes survive where plain averaging would flatten
+# them. One pass, no dependencies.
+
+def lttb(xs, ys, threshold):
+    """
+    Indices of the points to keep, with the range of rows each one
+    stands for: a list of (index, start, end), 'end' exclusive. 'xs'
+    must be ascending and 'ys' free of None. Series that already fit
+    (or a threshold below 3) are returned whole.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return [(i, i, i + 1) for i in range(n)]
+
+    size = (n - 2) / (threshold - 2)
+    kept = [(0, 0, 1)]
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * size) + 1
+        end = int((bucket + 1) * size) + 1
+
+        # The third corner: the average of the next bucket (the last point
+        # for the last bucket)
+        next_end = min(int((bucket + 2) * size) + 1, n)
+        if end >= n - 1 or end >= next_end:
+            avg_x, avg_y = xs[n - 1], ys[n - 1]
+        else:
+            count = next_end - end
+            avg_x = sum(xs[end:next_end]) / count
+            avg_y = sum(ys[end:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            # Twice the triangle's area; only the comparison matters
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append((best, start, end))
+        a = best
+
+    kept.append((n - 1, n - 1, n))
+    return kept
+
+def fill_gaps(values):
+    """None -> the previous value (or the first real one), so LTTB can rank points."""
+    filled, last = [], next((v for v in values if v is not None), 0.0)
+    for value in values:
+        if value is not None:
+            last = value
+        filled.append(last)
+    return filled
\ No newline at end of file
@@ -0,0 +1,125 @@
+from psycopg2.extras import execute_values
+
+# --- Latest State ---
+# The fleet overview (/v1/fleet/status) reads the agent_latest table:
+# one row per agent with its newest high_freq and disk values, so it
+# never has to look for the last sample in the hypertables. Static data
+# needs nothing extra; the overview joins the 'agents' row the static
+# message already upserts.
+#
+# Like last_seen (see src/registry.py), the newest values are collected
+# in memory and written for all agents at once with the periodic flush,
+# not with every message. A flush that fails is dropped rather than
+# retried; the next samples replace it anyway.
+
+# A sample older than what the row already has (e.g. from a retried
+# message) changes nothing
+HIGH_FREQ_SQL = """
+    INSERT INTO agent_latest (
+        agent_id, high_freq_at, cpu_percent, ram_percent, swap_percent,
+        disk_read_bytes_per_sec, disk_write_bytes_per_sec,
+        net_bytes_sent_per_sec, net_bytes_recv_per_sec
+    )
+    VALUES %s
+    ON CONFLICT (agent_id) DO UPDATE SET
+        high_freq_at = EXCLUDED.high_freq_at,
+        cpu_percent = EXCLUDED.cpu_percent,
+        ram_percent = EXCLUDED.ram_percent,
+        swap_percent = EXCLUDED.swap_percent,
+        disk_read_bytes_per_sec = EXCLUDED.disk_read_bytes_per_sec,
+        disk_write_bytes_per_sec = EXCLUDED.disk_write_bytes_per_sec,
+        net_bytes_sent_per_sec = EXCLUDED.net_bytes_sent_per_sec,
+        net_bytes_recv_per_sec = EXCLUDED.net_bytes_recv_per_sec
+    WHERE agent_latest.high_freq_at IS NULL OR agent_latest.high_freq_at <= EXCLUDED.high_freq_at;
+"""
+HIGH_FREQ_TEMPLATE = "(%s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s)"
+
+DISK_SQL = """
+    INSERT INTO agent_latest (
+        agent_id, low_freq_at, disk_percent_used_max, disk_fullest_mountpoint,
+        disk_used_gb, disk_total_gb, disks_unavailable
+    )
+    VALUES %s
+    ON CONFLICT (agent_id) DO UPDATE SET
+        low_freq_at = EXCLUDED.low_freq_at,
+        disk_percent_used_max = EXCLUDED.disk_percent_used_max,
+        disk_fullest_mountpoint = EXCLUDED.disk_fullest_mountpoint,
+        disk_used_gb = EXCLUDED.disk_used_gb,
+        disk_total_gb = EXCLUDED.disk_total_gb,
+        disks_unavailable = EXCLUDED.disks_unavailable
+    WHERE agent_latest.low_freq_at IS NULL OR agent_latest.low_freq_at <= EXCLUDED.low_freq_at;
+"""
+DISK_TEMPLATE = "(%s, to_timestamp(%s), %s, %s, %s, %s, %s)"
+
+def disk_summary(agent_id, sampled_at, disks):
+    """
+    One agent_latest disk row from a low_freq sample's
+    {mountpoint: (available, percent_used, total_gb, used_gb)}: the
+    fullest mount, the totals over the mounts that answered, and how
+    many didn't.
+    """
+    answered = [(mount, d) for mount, d in disks.items() if d[0] and d[1] is not None]
+    fullest = max(answered, key=lambda item: item[1][1], default=(None, None))
+    return (
+        agent_id, sampled_at,
+        fullest[1][1] if fullest[1] else None, fullest[0],
+        sum(float(d[3] or 0) for _, d in answered) if answered else None,
+        sum(float(d[2] or 0) for _, d in answered) if answered else None,
+        len(disks) - len(answered),
+    )
+
+class LatestState:
+
+    def __init__(self):
+        self._high_freq = {}  # agent_id -> newest agent_latest high_freq row, not written yet
+        self._disks = {}      # agent_id -> (sampled_at, {mountpoint: disk values}), not written yet
+
+    def record_high_freq(self, row):
+        """
+        Takes a metrics_high_freq row as build_batch_rows() makes it:
+        (sampled_at, agent_id, cpu, ram, swap, disk and net rates, ...).
+        """
+        sampled_at, agent_id = row[0], row[1]
+        pending = self._high_freq.get(agent_id)
+        if pending is None or sampled_at >= pending[1]:
+            self._high_freq[agent_id] = (agent_id, sampled_at) + tuple(row[2:9])
+
+    def record_disks(self, rows):
+        """Takes metrics_low_freq_disk rows: (sampled_at, agent_id, mountpoint, available, ...)."""
+        for sampled_at, agent_id, mountpoint, available, percent_used, total_gb, used_gb in rows:
+            pending = self._disks.get(agent_id)
+            if pending is None or sampled_at > pending[0]:
+                pending = self._disks[agent_id] = (sampled_at, {})
+            elif sampled_at < pending[0]:
+                continue
+            pending[1][mountpoint] = (available, percent_used, total_gb, used_gb)
+
+    @property
+    def pending(self):
+        return len(self._high_freq) + len(self._disks)
+
+    def flush(self, conn):
+        """
+        Upserts every collected value with one statement per kind and
+        commits. Values older than what the table has are left alone.
+        """
+        high_freq, self._high_freq = list(self._high_freq.values()), {}
+        disks, self._disks = self._disks, {}
+        if not high_freq and not disks:
+            return 0
+        try:
+            with conn.cursor() as cur:
+                if high_freq:
+                    execute_values(cur, HIGH_FREQ_SQL, high_freq, template=HIGH_FREQ_TEMPLATE, page_size=1000)
+                if disks:
+                    execute_values(
+                        cur, DISK_SQL,
+                        [disk_summary(agent_id, *pending) for agent_id, pending in disks.items()],
+                        template=DISK_TEMPLATE, page_size=1000
+                    )
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        return len(high_freq) + len(disks)
\ No newline at end of file
@@ -1,14 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
+from .admission import AdmissionController
+from .backfill import (
+    BackfillError, BackfillUnavailable, NDJSON_CONTENT_TYPES, CSV_CONTENT_TYPE,
+    open_loader, close_loader
+)
+from .codec import decode_request, StreamDecompressor, UnsupportedEncoding, MalformedBody
 from .config import settings
-from .models import IngestData
-from .mq_client import publish_message
-from typing import Optional
+from .delta import DeltaDecoder, KeyframeRequired
+from .models import IngestEnvelope, IngestDataAdapter
+from .mq_client import publisher
+from .queries import (
+    DatabaseUnavailable, FleetCache, FLEET_SORT_KEYS, fleet_status, read_agent_metrics
+)
+from .rollups import SOURCES
+from .rows import normalize
+from .stats import LatencyTracker
+from typing import List, Optional
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep one RabbitMQ connection open for the lifetime of the API process
+    await publisher.start()
+    yield
+    await publisher.close()
 
 app = FastAPI(
     title="Distributed Resource Monitoring Server",
-    description="API for ingesting metrics from agents."
+    description="API for ingesting metrics from agents.",
+    lifespan=lifespan
+)
+
+# Last acknowledged snapshot per agent, for delta-encoded payloads
+delta_decoder = DeltaDecoder()
+
+# Rolling window of ingest request latencies (see /v1/stats/ingest-latency)
+ingest_latency = LatencyTracker()
+
+# Latest values of every agent, re-read at most every FLEET_CACHE_MS (see /v1/fleet/status)
+fleet_cache = FleetCache(settings.FLEET_CACHE_MS / 1000)
+
+# Per-agent and global rate limits plus load shedding (see /v1/stats/admission)
+admission = AdmissionController(
+    agent_rate=settings.ADMISSION_AGENT_RATE,
+    agent_burst=settings.ADMISSION_AGENT_BURST,
+    global_rate=settings.ADMISSION_GLOBAL_RATE,
+    global_burst=settings.ADMISSION_GLOBAL_BURST,
+    queue_soft=settings.ADMISSION_QUEUE_SOFT,
+    queue_hard=settings.ADMISSION_QUEUE_HARD,
+    latency_soft_ms=settings.ADMISSION_LATENCY_SOFT_MS,
+    latency_hard_ms=settings.ADMISSION_LATENCY_HARD_MS,
+    retry_after_min=settings.ADMISSION_RETRY_AFTER_MIN,
+    retry_after_max=settings.ADMISSION_RETRY_AFTER_MAX
 )
 
+@app.middleware("http")
+async def track_ingest_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    if request.url.path.startswith("/v1/data/ingest"):
+        ingest_latency.record(time.perf_counter() - start)
+    return response
+
 # --- Security Dependency ---
 
 def get_api_key(authorization: Optional[str] = Header(None)) -> str:
@@ -38,6 +98,137 @@ def get_api_key(authorization: Optional[str] = Header(None)) -> str:
         )
     return token
 
+# --- Body Decoding ---
+# Agents may send JSON or msgpack, optionally gzip/zstd compressed,
+# so bodies are decoded by hand instead of by FastAPI's JSON parser.
+
+IngestBatchAdapter = TypeAdapter(List[IngestEnvelope])
+
+async def read_agent_body(request: Request):
+    """
+    Dependency that decodes the request body according to its
+    Content-Type and Content-Encoding headers.
+    """
+    body = await request.body()
+    try:
+        return decode_request(
+            body,
+            request.headers.get("content-type"),
+            request.headers.get("content-encoding")
+        )
+    except UnsupportedEncoding as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except MalformedBody as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def validate_body(adapter_or_model, obj):
+    """Validates a decoded body, turning errors into the usual 422 response."""
+    try:
+        if isinstance(adapter_or_model, TypeAdapter):
+            return adapter_or_model.validate_python(obj)
+        return adapter_or_model.model_validate(obj)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+def validate_messages(messages, indexed=False):
+    """
+    Validates rebuilt messages against IngestData, once, here. Returns
+    them normalized for the worker, which trusts them from then on.
+    Any invalid item fails the request with a 422.
+    """
+    normalized = []
+    errors = []
+    for index, message in enumerate(messages):
+        try:
+            normalized.append(normalize(IngestDataAdapter.validate_python(message)))
+        except ValidationError as e:
+            prefix = (index,) if indexed else ()
+            errors.extend(dict(error, loc=prefix + tuple(error["loc"])) for error in e.errors())
+    if errors:
+        raise RequestValidationError(errors)
+    return normalized
+
+def item_agent_id(item: IngestEnvelope) -> str:
+    payload = item.payload
+    return str(payload.get("agent_id")) if isinstance(payload, dict) else "unknown"
+
+def check_single_agent(items: List[IngestEnvelope]):
+    """
+    A batch is charged to, and routed by, one agent. Items from any
+    other agent fail the request with a 422 pointing at them.
+    """
+    agent_id = item_agent_id(items[0])
+    errors = [
+        {
+            "type": "value_error",
+            "loc": (index, "payload", "agent_id"),
+            "msg": f"All items in a batch must come from one agent ({agent_id})",
+            "input": item_agent_id(item),
+        }
+        for index, item in enumerate(items) if item_agent_id(item) != agent_id
+    ]
+    if errors:
+        raise RequestValidationError(errors)
+
+# --- Admission ---
+
+def admit(items: List[IngestEnvelope]):
+    """
+    Applies admission control to a request from one agent.
+    Answers 429 with Retry-After when it is over budget or the
+    pipeline is overloaded.
+    """
+    decision = admission.admit(
+        item_agent_id(items[0]), len(items),
+        queue_depth=publisher.queue_depth,
+        publish_latency=publisher.publish_latency
+    )
+    if not decision.admitted:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Server is busy ({decision.reason}). Please retry later.",
+            headers={"Retry-After": str(decision.retry_after)}
+        )
+    return decision
+
+def queue_unavailable():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Message queue is currently unavailable. Please retry later.",
+        headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_MIN)}
+    )
+
+def expand_deltas(items: List[IngestEnvelope]):
+    """
+    Rebuilds full payloads from delta-encoded items.
+    Answers 409 when the agent must send a keyframe first.
+    """
+    try:
+        return delta_decoder.decode(items)
+    except KeyframeRequired as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Keyframe required: {e}"
+        )
+
+def expand_and_validate(items: List[IngestEnvelope], decision, indexed=False):
+    """
+    expand_deltas() and validate_messages() for an admitted request.
+    If either rejects it (409/422), its admission tokens are refunded.
+    """
+    try:
+        messages, snapshots = expand_deltas(items)
+        return validate_messages(messages, indexed=indexed), snapshots
+    except (HTTPException, RequestValidationError):
+        admission.refund(decision)
+        raise
+
 # --- API Endpoints ---
 
 @app.get("/health", tags=["General"])
@@ -45,31 +236,286 @@ async def health_check():
     """A simple health check endpoint."""
     return {"status": "ok"}
 
+@app.get("/v1/stats/ingest-latency", tags=["General"])
+async def ingest_latency_stats(api_key: str = Depends(get_api_key)):
+    """p50/p99 latency of recent ingest requests, measured inside the API."""
+    return ingest_latency.summary()
+
+@app.get("/v1/stats/admission", tags=["General"])
+async def admission_stats(api_key: str = Depends(get_api_key)):
+    """Current load pressure, what admission control let through, refused and shed."""
+    summary = admission.summary()
+    summary["queue_depth"] = publisher.queue_depth
+    summary["publish_latency_ms"] = round(publisher.publish_latency * 1000, 1)
+    return summary
+
+@app.get("/v1/stats/shards", tags=["General"])
+async def shard_stats(api_key: str = Depends(get_api_key)):
+    """
+    Depth and consumer count of every worker shard queue. A growing
+    depth means that shard's worker is falling behind; 0 consumers
+    means it isn't running.
+    """
+    return {
+        "shards": settings.WORKER_SHARDS,
+        "queues": [{"queue": name, **stats} for name, stats in publisher.shard_stats.items()],
+    }
+
+@app.get("/v1/agents/{agent_id}/metrics", tags=["Queries"])
+async def agent_metrics(
+    agent_id: UUID,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    fields: str = "cpu_percent_overall",
+    source: str = "high_freq",
+    max_points: int = Query(settings.QUERY_DEFAULT_POINTS, ge=3, le=settings.QUERY_MAX_POINTS),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    One agent's metrics between 'from' and 'to' (ISO 8601; default the
+    last hour), for chart rendering. 'fields' is comma-separated;
+    'source' is high_freq or disk (one series per mountpoint). Long
+    ranges are read from the 1-minute or 1-hour rollups and every series
+    is thinned to at most 'max_points' points with LTTB, each with
+    avg/min/max/p95 per field.
+    """
+    if source not in SOURCES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown source. Use one of: {', '.join(SOURCES)}"
+        )
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    if not field_list:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No fields requested")
+
+    # Times without a zone are taken as UTC
+    end = end or datetime.now(timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    start = start or end - timedelta(hours=1)
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must be before 'to'")
+
+    try:
+        resolution, series = await run_in_threadpool(
+            read_agent_metrics, source, agent_id, start, end, field_list, max_points
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except DatabaseUnavailable as e:
+        print(f"Metrics query: database unavailable: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is currently unavailable. Please retry later."
+        )
+
+    return {
+        "agent_id": str(agent_id),
+        "source": source,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "resolution": resolution,
+        "max_points": max_points,
+        "series": series,
+    }
+
+@app.get("/v1/fleet/status", tags=["Queries"])
+async def fleet_overview(
+    group_name: Optional[str] = None,
+    sub_group_name: Optional[str] = None,
+    online: Optional[bool] = None,
+    sort: str = "hostname",
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Every agent with its current CPU/RAM/swap, I/O rates, fullest disk
+    and online status, from the snapshot the worker keeps in
+    agent_latest. Filter by group, sub-group or online status and sort
+    by any metric; agents without that metric come last.
+    """
+    if sort not in FLEET_SORT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown sort key. Use one of: {', '.join(FLEET_SORT_KEYS)}"
+        )
+    try:
+        agents, generated_at = await run_in_threadpool(fleet_cache.get)
+    except DatabaseUnavailable as e:
+        print(f"Fleet status: database unavailable: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is currently unavailable. Please retry later."
+        )
+
+    total, online_count, selected = fleet_status(
+        agents, settings.FLEET_ONLINE_WINDOW_S,
+        group_name=group_name, sub_group_name=sub_group_name, online=online,
+        sort=sort, descending=order == "desc", limit=limit
+    )
+    # The rows are plain JSON types already; skipping FastAPI's encoder
+    # keeps large fleets fast
+    return JSONResponse({
+        "generated_at": generated_at,
+        "total": total,
+        "online": online_count,
+        "agents": selected,
+    })
+
 @app.post("/v1/data/ingest", status_code=status.HTTP_202_ACCEPTED, tags=["Ingestion"])
 async def ingest_data(
-    data: IngestData, 
+    response: Response,
+    body = Depends(read_agent_body),
     api_key: str = Depends(get_api_key)
 ):
     """
     Asynchronous endpoint to receive metrics data from agents.
-    It validates the top-level structure and publishes to the message queue.
+    It validates the full payload and publishes it to the message queue.
     """
+    data = validate_body(IngestEnvelope, body)
+    decision = admit([data])
+    messages, snapshots = expand_and_validate([data], decision)
+    messages, shed = decision.shed(messages)
+    if shed:
+        # Dropped under load; the agent shouldn't send it again
+        admission.record_shed(shed)
+        delta_decoder.commit(snapshots)
+        response.headers["X-Delta-Encoding"] = "supported"
+        return {"status": "shed"}
+
     try:
-        # Publish the raw dictionary to the queue
-        # The worker will handle the detailed parsing
-        success = publish_message(data.model_dump())
+        # Publish the validated, normalized message to the queue
+        # The worker writes it without validating it again
+        success = await publisher.publish(messages[0], key=messages[0]["payload"]["agent_id"])
         
         if not success:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Message queue is currently unavailable. Please retry later."
-            )
-            
+            raise queue_unavailable()
+
+        delta_decoder.commit(snapshots)
+        response.headers["X-Delta-Encoding"] = "supported"
         return {"status": "accepted"}
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in ingestion endpoint: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An internal server error occurred."
-        )
\ No newline at end of file
+        )
+
+@app.post("/v1/data/ingest/batch", status_code=status.HTTP_202_ACCEPTED, tags=["Ingestion"])
+async def ingest_batch(
+    response: Response,
+    body = Depends(read_agent_body),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Receives many queued items from one agent in a single request.
+    The whole array is validated and published as one broker message.
+    """
+    items = validate_body(IngestBatchAdapter, body)
+    if len(items) > settings.MAX_INGEST_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch too large. Send at most {settings.MAX_INGEST_BATCH} items."
+        )
+    if not items:
+        return {"status": "accepted", "count": 0}
+
+    check_single_agent(items)
+    decision = admit(items)
+    messages, snapshots = expand_and_validate(items, decision, indexed=True)
+    # Under load, high_freq items are dropped before anything else
+    messages, shed = decision.shed(messages)
+    if shed:
+        admission.record_shed(shed)
+
+    try:
+        if messages:
+            # One agent per batch, so the batch goes to that agent's shard
+            success = await publisher.publish(
+                {"type": "batch", "items": messages},
+                key=messages[0]["payload"]["agent_id"]
+            )
+
+            if not success:
+                raise queue_unavailable()
+
+        delta_decoder.commit(snapshots)
+        response.headers["X-Delta-Encoding"] = "supported"
+        return {"status": "accepted", "count": len(messages), "shed": shed}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in batch ingestion endpoint: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An internal server error occurred."
+        )
+
+@app.post("/v1/data/backfill", tags=["Ingestion"])
+async def backfill(
+    request: Request,
+    table: Optional[str] = None,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Loads historical data straight into the metric tables, bypassing
+    the message queue. Takes a (chunked, optionally gzip/zstd
+    compressed) NDJSON upload of timestamped agent items, or a CSV
+    upload for one table (?table=high_freq|processes|disk). Bad lines
+    are skipped and reported; everything else keeps its timestamps.
+    """
+    media_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if media_type in NDJSON_CONTENT_TYPES:
+        fmt = "ndjson"
+    elif media_type == CSV_CONTENT_TYPE:
+        fmt = "csv"
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Backfill takes {', '.join(sorted(NDJSON_CONTENT_TYPES))} or {CSV_CONTENT_TYPE}"
+        )
+
+    try:
+        decompressor = StreamDecompressor(request.headers.get("content-encoding"))
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+    try:
+        loader = await run_in_threadpool(open_loader, fmt, table)
+    except BackfillError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except BackfillUnavailable as e:
+        print(f"Backfill: database unavailable: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is currently unavailable. Please retry later."
+        )
+
+    try:
+        async for chunk in request.stream():
+            data = decompressor.decompress(chunk)
+            if data:
+                await run_in_threadpool(loader.feed, data)
+        summary = await run_in_threadpool(loader.finish)
+        print(f"Backfill: {summary['rows_total']} rows from {summary['lines']} lines "
+              f"({summary['rejected']} rejected) at {summary['rows_per_sec']} rows/s")
+        return summary
+
+    except (BackfillError, MalformedBody) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{e} (stopped at line {loader.line_no}; earlier rows may be loaded)"
+        )
+    except BackfillUnavailable as e:
+        print(f"Backfill: database went away: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database became unavailable at line {loader.line_no}; earlier rows may be loaded."
+        )
+    finally:
+        await run_in_threadpool(close_loader, loader)
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, UUID4, Field
-from typing import List, Optional, Any
+from pydantic import BaseModel, UUID4, Field, TypeAdapter
+from typing import List, Optional, Any, Literal, Union, Annotated
 
 # --- Models for High-Frequency Data ---
 
@@ -11,30 +11,68 @@ class DiskIO(BaseModel):
     read_bytes_per_sec: int
     write_bytes_per_sec: int
 
+class NicIO(BaseModel):
+    nic: str
+    bytes_sent_per_sec: float
+    bytes_recv_per_sec: float
+    packets_sent_per_sec: float
+    packets_recv_per_sec: float
+    errors_per_sec: float
+    drops_per_sec: float
+
+class DiskDeviceIO(BaseModel):
+    device: str
+    read_bytes_per_sec: float
+    write_bytes_per_sec: float
+    reads_per_sec: float
+    writes_per_sec: float
+
 class Process(BaseModel):
     pid: int
     name: str
     username: str
     cpu_percent: float
     memory_percent: float
+    io_bytes_per_sec: Optional[float] = None # Only when the agent can read it
+
+class MetricSummary(BaseModel):
+    min: float
+    max: float
+    mean: float
+    p95: float
+    last: float
+
+class HighFreqSummaries(BaseModel):
+    # Summaries of the agent's ~1s samples over the reporting interval
+    cpu_percent: Optional[MetricSummary] = None
+    ram_percent: Optional[MetricSummary] = None
 
 class HighFreqPayload(BaseModel):
     agent_id: UUID4
     cpu_percent_overall: float
-    cpu_percent_per_core: List[float] # We get this, but won't store it for now
+    cpu_percent_per_core: List[float]
     ram_percent_used: float
     swap_percent_used: float
     network_io: NetworkIO
     disk_io: DiskIO
+    # Per-device breakdowns (empty for older agents)
+    network_io_per_nic: List[NicIO] = Field(default_factory=list)
+    disk_io_per_device: List[DiskDeviceIO] = Field(default_factory=list)
     top_5_processes: List[Process] = Field(default_factory=list)
+    top_5_processes_by_memory: List[Process] = Field(default_factory=list)
+    top_5_processes_by_io: List[Process] = Field(default_factory=list)
+    summaries: Optional[HighFreqSummaries] = None # Older agents don't send these
 
 # --- Models for Low-Frequency Data ---
 
 class DiskUsage(BaseModel):
     mountpoint: str
-    percent_used: float
-    total_gb: float
-    used_gb: float
+    # False when statvfs timed out (e.g. a stale NFS mount); the
+    # usage figures are then missing
+    available: bool = True
+    percent_used: Optional[float] = None
+    total_gb: Optional[float] = None
+    used_gb: Optional[float] = None
 
 class LowFreqPayload(BaseModel):
     agent_id: UUID4
@@ -62,9 +100,76 @@ class StaticPayload(BaseModel):
     group_name: Optional[str] = None
     sub_group_name: Optional[str] = None
 
+# --- Models for Agent Health ---
+
+class CollectorCost(BaseModel):
+    name: str # The MetricsCollector method, e.g. "get_high_freq_data"
+    runs: int
+    wall_ms_mean: float
+    wall_ms_max: float
+    cpu_ms_total: float
+
+class AgentHealthPayload(BaseModel):
+    agent_id: UUID4
+    interval_seconds: float
+    process_cpu_percent: float
+    process_rss_mb: float
+    collectors: List[CollectorCost]
+
+    # Sender backlog (the agent's on-disk spool)
+    queue_depth: int
+    queue_oldest_age_seconds: Optional[float] = None
+    spool_bytes: int
+    spool_evicted_total: int
+
+    # Sends during the interval
+    send_requests: int
+    send_latency_ms_p50: Optional[float] = None
+    send_latency_ms_max: Optional[float] = None
+    items_sent: int
+    send_retries: int
+    items_dropped: int
+
 # --- Main Ingestion Model ---
 # This is the wrapper object our API will receive
 
-class IngestData(BaseModel):
-    type: str  # "static", "high_freq", or "low_freq"
-    payload: Any # We will validate this payload in the endpoint
\ No newline at end of file
+class IngestEnvelope(BaseModel):
+    type: str  # "static", "high_freq", "low_freq" or "agent_health"
+    payload: Any # May be a delta; checked against IngestData once rebuilt
+    timestamp: Optional[float] = None # When the agent collected it (epoch seconds)
+
+    # Delta encoding (see src/delta.py); absent for plain payloads
+    encoding: Optional[str] = None # "keyframe" or "delta"
+    seq: Optional[int] = None
+    base_seq: Optional[int] = None
+
+# One fully typed model per message type, told apart by "type".
+# The API validates every (rebuilt) item against IngestData exactly
+# once; the worker trusts what the API publishes (see src/rows.py).
+
+class StaticMessage(BaseModel):
+    type: Literal["static"]
+    payload: StaticPayload
+    timestamp: Optional[float] = None
+
+class HighFreqMessage(BaseModel):
+    type: Literal["high_freq"]
+    payload: HighFreqPayload
+    timestamp: Optional[float] = None
+
+class LowFreqMessage(BaseModel):
+    type: Literal["low_freq"]
+    payload: LowFreqPayload
+    timestamp: Optional[float] = None
+
+class AgentHealthMessage(BaseModel):
+    type: Literal["agent_health"]
+    payload: AgentHealthPayload
+    timestamp: Optional[float] = None
+
+IngestData = Annotated[
+    Union[StaticMessage, HighFreqMessage, LowFreqMessage, AgentHealthMessage],
+    Field(discriminator="type")
+]
+
+IngestDataAdapter = TypeAdapter(IngestData)
\ No newline at end of file
@@ -1,58 +1,179 @@
-import pika
-import json
+import asyncio
+import time
+import aio_pika
+from .codec import encode_message
 from .config import settings
+from .sharding import HashRing, shard_queue_names
 
-# This is the name of the queue our worker will listen to
-METRICS_QUEUE_NAME = "metrics_queue"
-
-def get_mq_connection():
-    """
-    Establishes a new connection to RabbitMQ.
+class MQPublisher:
     """
-    try:
-        credentials = pika.PlainCredentials(settings.MQ_USER, settings.MQ_PASSWORD)
-        params = pika.ConnectionParameters(
-            host=settings.MQ_HOST,
-            credentials=credentials
-        )
-        return pika.BlockingConnection(params)
-    except pika.exceptions.AMQPConnectionError as e:
-        print(f"Failed to connect to RabbitMQ: {e}")
-        return None
+    Long-lived, non-blocking RabbitMQ publisher for the API process.
 
-def publish_message(message_body: dict):
-    """
-    Publishes a single message to the metrics queue.
+    One robust connection and one channel are kept open across requests
+    (aio-pika reconnects them automatically). Requests hand their message
+    to a background task, which drains everything waiting, publishes it
+    with publisher confirms and awaits those confirms together.
+
+    Each message goes to the worker shard queue its agent hashes to
+    (see src/sharding.py).
+
+    It also keeps the numbers admission control watches: the depth of
+    every shard queue (polled every MQ_QUEUE_POLL_MS) and a moving
+    average of how long a publish takes to be confirmed.
     """
-    connection = None
-    try:
-        connection = get_mq_connection()
-        if not connection:
-            print("Cannot publish message: No RabbitMQ connection.")
+
+    def __init__(self, url: str, shards: int = 1):
+        self._url = url
+        self._ring = HashRing(shards)
+        self._queue_names = shard_queue_names(shards)
+        self._connection = None
+        self._channel = None
+        self._pending = None
+        self._task = None
+        self._watch_task = None
+        self.shard_stats = {}       # queue -> {"depth", "consumers"} (empty if unknown)
+        self.publish_latency = 0.0  # seconds from hand-off to confirm (moving average)
+
+    @property
+    def queue_depth(self):
+        """Depth of the busiest shard queue (None if unknown)."""
+        depths = [s["depth"] for s in self.shard_stats.values()]
+        return max(depths) if depths else None
+
+    async def start(self):
+        """Starts the background publishing task (call on app startup)."""
+        self._pending = asyncio.Queue()
+        self._channel_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        self._watch_task = asyncio.create_task(self._watch_queue())
+
+    async def close(self):
+        """Stops the publisher and closes the connection (call on app shutdown)."""
+        for task in (self._task, self._watch_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._connection and not self._connection.is_closed:
+            await self._connection.close()
+
+    async def publish(self, message_body: dict, key=None) -> bool:
+        """
+        Publishes a single message to the shard queue for 'key' (the
+        agent_id). Returns True once the broker has confirmed it.
+        """
+        message = encode_message(message_body) + (self._ring.queue_for(key),)
+        future = asyncio.get_running_loop().create_future()
+        started = time.monotonic()
+        await self._pending.put((message, future))
+        try:
+            return await asyncio.wait_for(future, timeout=settings.MQ_PUBLISH_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            print("Publish timed out waiting for broker confirm.")
             return False
-            
-        channel = connection.channel()
-        
-        # Declare the queue. This is idempotent, meaning it's safe
-        # to run every time. It will create it if it doesn't exist.
-        channel.queue_declare(queue=METRICS_QUEUE_NAME, durable=True)
-        
-        # Publish the message
-        channel.basic_publish(
-            exchange='',
-            routing_key=METRICS_QUEUE_NAME,
-            body=json.dumps(message_body),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Make message persistent
-            )
+        finally:
+            self._record_latency(time.monotonic() - started)
+
+    def _record_latency(self, seconds):
+        # Exponential moving average; reacts within a few dozen publishes
+        self.publish_latency += (seconds - self.publish_latency) * 0.1
+
+    async def _watch_queue(self):
+        """Keeps 'shard_stats' up to date for admission control and /v1/stats/shards."""
+        while True:
+            try:
+                channel = await self._ensure_channel()
+                stats = {}
+                for name in self._queue_names:
+                    # Not robust: a re-declare per poll mustn't pile up on reconnect
+                    queue = await channel.declare_queue(name, durable=True, robust=False)
+                    stats[name] = {
+                        "depth": queue.declaration_result.message_count,
+                        "consumers": queue.declaration_result.consumer_count,
+                    }
+                self.shard_stats = stats
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Unknown depth; the publish latency still reflects trouble
+                self.shard_stats = {}
+            await asyncio.sleep(settings.MQ_QUEUE_POLL_MS / 1000)
+
+    async def _ensure_channel(self):
+        """
+        Opens the connection and channel on first use. After that,
+        connect_robust takes care of reconnecting on its own.
+        """
+        if self._channel and not self._channel.is_closed:
+            return self._channel
+
+        # The publisher and the queue watcher may both get here first
+        async with self._channel_lock:
+            if self._channel and not self._channel.is_closed:
+                return self._channel
+
+            if not self._connection or self._connection.is_closed:
+                self._connection = await aio_pika.connect_robust(self._url)
+
+            self._channel = await self._connection.channel(publisher_confirms=True)
+
+            # Declare the queues once per channel instead of once per message
+            for name in self._queue_names:
+                await self._channel.declare_queue(name, durable=True)
+            return self._channel
+
+    async def _publish_one(self, channel, message: tuple):
+        body, content_type, queue_name = message
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body,
+                content_type=content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                # Lets the worker measure how far behind its shard is
+                headers={"published_at": time.time()}
+            ),
+            routing_key=queue_name
         )
-        print("Message published to queue.")
-        return True
-        
-    except Exception as e:
-        print(f"Error publishing message: {e}")
-        return False
-        
-    finally:
-        if connection and connection.is_open:
-            connection.close()
\ No newline at end of file
+
+    async def _run(self):
+        while True:
+            # Wait for at least one message, then take whatever else is queued
+            batch = [await self._pending.get()]
+            while len(batch) < settings.MQ_PUBLISH_BATCH and not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+
+            # A publish that timed out was already answered with a 503 and
+            # will be resent by the agent; publishing it now would store it twice
+            batch = [(message, future) for message, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                channel = await self._ensure_channel()
+            except Exception as e:
+                print(f"Failed to connect to RabbitMQ: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(False)
+                continue
+
+            # Publish the whole batch and await all confirms together
+            results = await asyncio.gather(
+                *(self._publish_one(channel, message) for message, _ in batch),
+                return_exceptions=True
+            )
+
+            failed = 0
+            for (_, future), result in zip(batch, results):
+                ok = not isinstance(result, BaseException)
+                failed += not ok
+                if not future.done():
+                    future.set_result(ok)
+
+            if failed:
+                print(f"Error publishing {failed} of {len(batch)} messages.")
+
+# Create a single, importable publisher for the API process
+publisher = MQPublisher(settings.RABBITMQ_URL, settings.WORKER_SHARDS)
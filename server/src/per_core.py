@@ -0,0 +1,134 @@
+import itertools
+from .rows import CORE_PERCENT_SCALE
+
+# numpy is listed in requirements.txt, but only these analysis helpers
+# need it; the API and the worker run without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- Per-Core CPU Analysis ---
+# Helpers for reading metrics_high_freq.cpu_percent_per_core back into
+# NumPy, e.g. to find hosts held back by one saturated core:
+#
+#   timestamps, agents, cores = fetch_per_core(conn, start, end)
+#   hot = hottest_core_per_host(timestamps, agents, cores, bucket_seconds=300)
+#
+# Everything after the fetch is vectorized; there are no Python loops
+# over samples or cores.
+
+# Rows fetched per round trip by the server-side cursor
+FETCH_SIZE = 10000
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The per-core helpers need numpy (pip install numpy)")
+
+def decode_cores(arrays):
+    """
+    Per-core arrays as psycopg2 returns them (lists of ints, or None)
+    -> a float32 matrix of percents, one row per sample and one column
+    per core. Hosts with fewer cores are padded with NaN.
+    """
+    _require_numpy()
+    lengths = np.fromiter((len(a) if a else 0 for a in arrays), dtype=np.int64, count=len(arrays))
+    width = int(lengths.max(initial=0))
+    flat = np.fromiter(
+        itertools.chain.from_iterable(a for a in arrays if a),
+        dtype=np.int16, count=int(lengths.sum())
+    )
+    matrix = np.full((len(arrays), width), np.nan, dtype=np.float32)
+    # Row-major order of the mask matches the order of 'flat'
+    matrix[np.arange(width) < lengths[:, None]] = flat / CORE_PERCENT_SCALE
+    return matrix
+
+def fetch_per_core(conn, start, end, agent_ids=None):
+    """
+    Per-core samples between 'start' and 'end' (datetimes), optionally
+    for some agents only. Returns (timestamps as epoch seconds, agent_ids,
+    core matrix from decode_cores), ordered by agent and time. Streams
+    through a server-side cursor, so long ranges don't need two copies
+    in memory at once.
+    """
+    _require_numpy()
+    query = """
+        SELECT extract(epoch FROM "timestamp"), agent_id::text, cpu_percent_per_core
+        FROM metrics_high_freq
+        WHERE "timestamp" >= %s AND "timestamp" < %s
+          AND cpu_percent_per_core IS NOT NULL
+    """
+    params = [start, end]
+    if agent_ids:
+        query += " AND agent_id = ANY(%s::uuid[])"
+        params.append([str(a) for a in agent_ids])
+    query += ' ORDER BY agent_id, "timestamp";'
+
+    timestamps, agents, arrays = [], [], []
+    with conn.cursor(name="per_core_fetch") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(query, params)
+        for timestamp, agent_id, cores in cur:
+            timestamps.append(timestamp)
+            agents.append(agent_id)
+            arrays.append(cores)
+    return np.array(timestamps, dtype=np.float64), np.array(agents), decode_cores(arrays)
+
+def hottest_core(matrix):
+    """
+    The busiest core of each sample: (core index, percent). Samples
+    without per-core data get index -1 and NaN.
+    """
+    _require_numpy()
+    if matrix.shape[1] == 0:
+        return np.full(len(matrix), -1), np.full(len(matrix), np.nan, dtype=np.float32)
+    filled = np.where(np.isnan(matrix), -np.inf, matrix)
+    index = filled.argmax(axis=1)
+    percent = filled[np.arange(len(matrix)), index]
+    empty = np.isneginf(percent)
+    index[empty] = -1
+    percent[empty] = np.nan
+    return index, percent.astype(np.float32)
+
+def single_core_bound(matrix, core_threshold=90.0, mean_threshold=50.0):
+    """
+    Samples where one core is saturated while the cores on average are
+    not - the signature of a single-threaded bottleneck.
+    """
+    _require_numpy()
+    _, hottest = hottest_core(matrix)
+    counts = (~np.isnan(matrix)).sum(axis=1)
+    mean = np.nansum(matrix, axis=1) / np.maximum(counts, 1)
+    return (counts > 0) & (hottest >= core_threshold) & (mean < mean_threshold)
+
+def hottest_core_per_host(timestamps, agent_ids, matrix, bucket_seconds=60):
+    """
+    For every host and time bucket, the single hottest core sample in it.
+    Returns a dict of equal-length arrays: agent_id, bucket (epoch
+    seconds of the bucket start), core, percent, and single_core_bound
+    (how many of the bucket's samples looked single-threaded).
+    """
+    _require_numpy()
+    core, percent = hottest_core(matrix)
+    bound = single_core_bound(matrix)
+    buckets = (timestamps // bucket_seconds).astype(np.int64)
+    _, agent_codes = np.unique(agent_ids, return_inverse=True)
+
+    # Sort by host, then bucket, then hottest first; the first row of
+    # each (host, bucket) run is the answer
+    order = np.lexsort((-np.nan_to_num(percent, nan=-np.inf), buckets, agent_codes))
+    groups = np.empty(len(order), dtype=bool)
+    groups[:1] = True
+    groups[1:] = ((agent_codes[order][1:] != agent_codes[order][:-1])
+                  | (buckets[order][1:] != buckets[order][:-1]))
+    starts = np.flatnonzero(groups)
+    firsts = order[starts]
+
+    return {
+        "agent_id": agent_ids[firsts],
+        "bucket": buckets[firsts] * bucket_seconds,
+        "core": core[firsts],
+        "percent": percent[firsts],
+        "single_core_bound": (np.add.reduceat(bound[order].astype(np.int64), starts)
+                              if len(order) else np.zeros(0, dtype=np.int64)),
+    }
\ No newline at end of file
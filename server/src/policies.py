@@ -0,0 +1,79 @@
+import psycopg2
+from .config import settings
+from .rollups import parse_interval
+
+# --- Storage Policies ---
+# Compression and retention are set from .env rather than in
+# db_init/01-init.sql, so changing them doesn't mean a new database.
+# The worker applies them once at startup; run
+#
+#   python -m src.policies
+#
+# to apply a changed .env without restarting it.
+
+RAW_HYPERTABLES = (
+    "metrics_high_freq", "metrics_net_per_nic", "metrics_disk_per_device",
+    "metrics_low_freq_disk", "metrics_process_samples", "metrics_agent_health",
+)
+ROLLUPS_1M = ("metrics_high_freq_1m", "metrics_low_freq_disk_1m")
+ROLLUPS_1H = ("metrics_high_freq_1h", "metrics_low_freq_disk_1h")
+
+# How far back the 1h rollups are refreshed (see db_init/01-init.sql).
+# Raw data must outlive it, or a refresh would empty rollup buckets
+# whose raw rows were already dropped.
+ROLLUP_REFRESH_WINDOW = "3 days"
+
+def set_policy(cur, kind, relation, interval):
+    """Replaces a 'compression' or 'retention' policy; no interval removes it."""
+    cur.execute(f"SELECT remove_{kind}_policy(%s, if_exists => true);", (relation,))
+    if interval:
+        argument = "compress_after" if kind == "compression" else "drop_after"
+        cur.execute(f"SELECT add_{kind}_policy(%s, {argument} => %s::interval);", (relation, interval))
+
+def check_policies():
+    """Raises ValueError for settings that can't be applied."""
+    for name in ("COMPRESS_AFTER", "RAW_RETENTION", "ROLLUP_1M_RETENTION", "ROLLUP_1H_RETENTION"):
+        parse_interval(getattr(settings, name))
+    raw = parse_interval(settings.RAW_RETENTION)
+    if raw is not None and raw <= parse_interval(ROLLUP_REFRESH_WINDOW):
+        raise ValueError(f"RAW_RETENTION must be longer than {ROLLUP_REFRESH_WINDOW}, "
+                         f"the window the 1h rollups are refreshed over")
+
+def apply_storage_policies():
+    """Sets every compression and retention policy. Returns True on success."""
+    try:
+        check_policies()
+    except ValueError as e:
+        print(f"Storage policies not applied: {e}")
+        return False
+
+    try:
+        conn = psycopg2.connect(settings.DATABASE_URL)
+    except psycopg2.Error as e:
+        print(f"Storage policies not applied, no database connection: {e}")
+        return False
+
+    try:
+        with conn.cursor() as cur:
+            for table in RAW_HYPERTABLES:
+                set_policy(cur, "compression", table, settings.COMPRESS_AFTER)
+                set_policy(cur, "retention", table, settings.RAW_RETENTION)
+            for view in ROLLUPS_1M:
+                set_policy(cur, "retention", view, settings.ROLLUP_1M_RETENTION)
+            for view in ROLLUPS_1H:
+                set_policy(cur, "retention", view, settings.ROLLUP_1H_RETENTION)
+        conn.commit()
+        print(f"Storage policies applied: compress after {settings.COMPRESS_AFTER or 'never'}, "
+              f"keep raw {settings.RAW_RETENTION or 'forever'}, "
+              f"1m rollups {settings.ROLLUP_1M_RETENTION or 'forever'}, "
+              f"1h rollups {settings.ROLLUP_1H_RETENTION or 'forever'}.")
+        return True
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error applying storage policies: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    apply_storage_policies()
\ No newline at end of file
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+
+# --- Process Identities ---
+# metrics_processes is a view: the samples live in
+# metrics_process_samples with a small process_id, and
+# process_identities maps each id to its (name, username). A few hundred
+# pairs repeat millions of times, so every writer keeps the ids it has
+# seen in a bounded cache and only asks the database about new pairs.
+#
+# New identities are committed right away, before the samples that use
+# them, so a cached id always exists even if the samples' transaction
+# is rolled back.
+
+# Adds the pairs that are new and returns the ids of all of them. The
+# SELECT doesn't see rows the INSERT adds in the same statement, hence
+# the UNION of both.
+RESOLVE_SQL = """
+    WITH wanted (name, username) AS (VALUES %s),
+    added AS (
+        INSERT INTO process_identities (name, username)
+        SELECT name, username FROM wanted
+        ON CONFLICT DO NOTHING
+        RETURNING process_id, name, username
+    )
+    SELECT process_id, name, username FROM added
+    UNION ALL
+    SELECT p.process_id, p.name, p.username
+    FROM process_identities p
+    JOIN wanted w ON p.name = w.name AND p.username IS NOT DISTINCT FROM w.username;
+"""
+
+class ProcessIdentities:
+
+    def __init__(self, max_size=50000):
+        self.max_size = max_size
+        self._ids = OrderedDict()  # (name, username) -> process_id, least recently used first
+
+    def resolve(self, conn, pairs):
+        """
+        Returns {(name, username): process_id} for 'pairs', adding the
+        identities the database doesn't have yet (and committing them).
+        """
+        pairs = set(pairs)
+        missing = [pair for pair in pairs if pair not in self._ids]
+
+        # A pair added by another worker after this statement's snapshot
+        # is neither inserted nor seen; the second round picks it up
+        for _ in range(2):
+            if not missing:
+                break
+            with conn.cursor() as cur:
+                found = execute_values(cur, RESOLVE_SQL, missing, page_size=len(missing), fetch=True)
+            conn.commit()
+            for process_id, name, username in found:
+                self._ids[(name, username)] = process_id
+            missing = [pair for pair in missing if pair not in self._ids]
+        if missing:
+            raise RuntimeError(f"Could not resolve {len(missing)} process identities")
+
+        ids = {}
+        for pair in pairs:
+            ids[pair] = self._ids[pair]
+            self._ids.move_to_end(pair)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return ids
+
+    def with_ids(self, conn, rows, index):
+        """
+        Replaces the name and username at rows[index] and rows[index + 1]
+        with the process_id.
+        """
+        if not rows:
+            return rows
+        ids = self.resolve(conn, ((row[index], row[index + 1]) for row in rows))
+        return [row[:index] + (ids[(row[index], row[index + 1])],) + row[index + 2:] for row in rows]
\ No newline at end of file
@@ -0,0 +1,170 @@
+import threading
+import time
+import psycopg2
+from .database import get_db_connection, release_db_connection
+from .downsample import lttb, fill_gaps
+from .rollups import SOURCES, STATS, plain_number, fetch_series
+
+# --- Read API ---
+# What the /v1/agents/... read endpoints run (in the API's thread pool,
+# on pooled connections). Ranges are read from the resolution
+# choose_resolution() picks and thinned to 'max_points' with LTTB.
+
+class DatabaseUnavailable(Exception):
+    """No database connection for a read; the API answers 503."""
+
+def downsample_series(series, fields, max_points):
+    """
+    Thins one series from fetch_series() to at most 'max_points' points.
+    The points are picked by LTTB on the first field's average and
+    shared by all fields, so they stay on one time axis; each kept
+    point's min and max cover every row it stands for, so peaks between
+    kept points still show.
+    """
+    timestamps = series["timestamps"]
+    columns = series["columns"]
+    kept = lttb(timestamps, fill_gaps(columns[f"{fields[0]}_avg"]), max_points)
+
+    values = {}
+    for field in fields:
+        stats = {stat: [] for stat in STATS}
+        for index, start, end in kept:
+            for stat in ("avg", "p95"):
+                stats[stat].append(columns[f"{field}_{stat}"][index])
+            lows = [v for v in columns[f"{field}_min"][start:end] if v is not None]
+            highs = [v for v in columns[f"{field}_max"][start:end] if v is not None]
+            stats["min"].append(min(lows) if lows else None)
+            stats["max"].append(max(highs) if highs else None)
+        values[field] = stats
+
+    return {
+        "timestamps": [timestamps[index] for index, _, _ in kept],
+        "rows": len(timestamps),
+        "downsampled": len(kept) < len(timestamps),
+        "fields": values,
+    }
+
+def read_agent_metrics(source, agent_id, start, end, fields, max_points):
+    """
+    One agent's 'fields' of 'source' between 'start' and 'end'. Returns
+    the resolution read and one downsampled series per value of the
+    source's keys (e.g. one per mountpoint for "disk").
+    Raises ValueError for unknown fields.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise DatabaseUnavailable("No database connection")
+    try:
+        resolution, series = fetch_series(conn, source, agent_id, start, end, fields, max_points)
+    except psycopg2.OperationalError as e:
+        raise DatabaseUnavailable(str(e))
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        release_db_connection(conn)
+
+    keys = SOURCES[source]["keys"]
+    result = []
+    for one in series:
+        downsampled = downsample_series(one, fields, max_points)
+        result.append({**dict(zip(keys, one["key"])), **downsampled})
+    return resolution, result
+
+# --- Fleet Status ---
+# /v1/fleet/status lists every agent with its newest values from
+# agent_latest (see src/latest.py). The whole fleet is read with one
+# join and kept for FLEET_CACHE_MS, so any number of open dashboards
+# cost one query per interval; filtering and sorting happen in memory.
+
+FLEET_QUERY = """
+    SELECT a.agent_id::text, a.hostname, a.group_name, a.sub_group_name, a.os,
+           l.disk_fullest_mountpoint,
+           extract(epoch FROM greatest(a.last_seen, l.high_freq_at)),
+           extract(epoch FROM l.high_freq_at), l.cpu_percent, l.ram_percent, l.swap_percent,
+           l.disk_read_bytes_per_sec, l.disk_write_bytes_per_sec,
+           l.net_bytes_sent_per_sec, l.net_bytes_recv_per_sec,
+           extract(epoch FROM l.low_freq_at), l.disk_percent_used_max,
+           l.disk_used_gb, l.disk_total_gb, l.disks_unavailable
+    FROM agents a
+    LEFT JOIN agent_latest l USING (agent_id);
+"""
+FLEET_TEXT_COLUMNS = (
+    "agent_id", "hostname", "group_name", "sub_group_name", "os", "disk_fullest_mountpoint",
+)
+FLEET_NUMBER_COLUMNS = (
+    "last_seen", "high_freq_at", "cpu_percent", "ram_percent", "swap_percent",
+    "disk_read_bytes_per_sec", "disk_write_bytes_per_sec",
+    "net_bytes_sent_per_sec", "net_bytes_recv_per_sec",
+    "low_freq_at", "disk_percent_used_max", "disk_used_gb", "disk_total_gb", "disks_unavailable",
+)
+# What /v1/fleet/status can sort by
+FLEET_SORT_KEYS = ("hostname", "group_name", "sub_group_name") + FLEET_NUMBER_COLUMNS
+
+def read_fleet():
+    """Every agent with its latest values, as dicts; times in epoch seconds."""
+    conn = get_db_connection()
+    if not conn:
+        raise DatabaseUnavailable("No database connection")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(FLEET_QUERY)
+            rows = cur.fetchall()
+    except psycopg2.OperationalError as e:
+        raise DatabaseUnavailable(str(e))
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        release_db_connection(conn)
+
+    text_count = len(FLEET_TEXT_COLUMNS)
+    agents = []
+    for row in rows:
+        agent = dict(zip(FLEET_TEXT_COLUMNS, row[:text_count]))
+        for name, value in zip(FLEET_NUMBER_COLUMNS, row[text_count:]):
+            agent[name] = plain_number(value)
+        agents.append(agent)
+    return agents
+
+class FleetCache:
+    """read_fleet(), reused for 'max_age' seconds. Concurrent misses share one read."""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._agents = None
+        self._read_at = 0.0   # monotonic
+        self.generated_at = None  # epoch seconds of the read
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._agents is None or time.monotonic() - self._read_at > self.max_age:
+                self._agents = read_fleet()
+                self._read_at = time.monotonic()
+                self.generated_at = time.time()
+            return self._agents, self.generated_at
+
+def fleet_status(agents, online_window, group_name=None, sub_group_name=None,
+                 online=None, sort="hostname", descending=False, limit=None, now=None):
+    """
+    Filters and sorts a fleet snapshot. Agents without a value for
+    'sort' come last either way. Returns (matching agents, of them
+    online, the first 'limit' agents with their 'online' flag).
+    """
+    now = now or time.time()
+    selected = []
+    online_count = 0
+    for agent in agents:
+        if group_name is not None and agent["group_name"] != group_name:
+            continue
+        if sub_group_name is not None and agent["sub_group_name"] != sub_group_name:
+            continue
+        is_online = agent["last_seen"] is not None and now - agent["last_seen"] <= online_window
+        if online is not None and is_online != online:
+            continue
+        online_count += is_online
+        selected.append({**agent, "online": is_online})
+
+    present = [a for a in selected if a[sort] is not None]
+    present.sort(key=lambda a: a[sort], reverse=descending)
+    ordered = present + [a for a in selected if a[sort] is None]
+    return len(selected), online_count, ordered[:limit]
\ No newline at end of file
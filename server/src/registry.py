@@ -0,0 +1,139 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+
+# --- Agent Registry ---
+# Each worker process keeps what it knows about the 'agents' table in
+# memory, so the hot path hardly touches that small, busy table:
+#
+#   - static data is only upserted when its content changed (agents
+#     re-send identical static data every time they restart)
+#   - last_seen is collected in memory and written for all agents at
+#     once, with one UPDATE every AGENT_LAST_SEEN_FLUSH_S seconds,
+#     instead of one UPDATE per high_freq message
+#   - metrics from agents that aren't registered are spotted before the
+#     insert, instead of failing the metrics tables' foreign keys
+#
+# With WORKER_SHARDS > 1 an agent always goes to the same worker
+# process, so the registries of different processes don't overlap.
+
+# How long (in seconds) an agent_id missing from the 'agents' table is
+# remembered as unknown before the table is asked again
+UNKNOWN_AGENT_TTL = 60
+
+def static_digest(values) -> str:
+    """A hash of an agent's static columns (see rows.static_values)."""
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+class AgentRegistry:
+
+    def __init__(self, max_agents=100000):
+        self.max_agents = max_agents
+        self._known = OrderedDict()  # agent_id -> static digest (None if not written by us), LRU first
+        self._unknown = {}           # agent_id -> monotonic time it was found missing
+        self._last_seen = {}         # agent_id -> newest epoch seconds, not written yet
+        self.static_skipped = 0
+
+    def _remember(self, agent_id, digest):
+        self._known[agent_id] = digest
+        self._known.move_to_end(agent_id)
+        self._unknown.pop(agent_id, None)
+        if len(self._known) > self.max_agents:
+            self._known.popitem(last=False)
+
+    # --- Static Data ---
+
+    def changed_static(self, values):
+        """
+        Returns the digest of an agent's static column values if they
+        must be written, or None if the 'agents' row already has them.
+        """
+        digest = static_digest(values)
+        if self._known.get(values[0]) == digest:
+            self._known.move_to_end(values[0])
+            self.static_skipped += 1
+            return None
+        return digest
+
+    def static_written(self, agent_id, digest):
+        """Call once the upsert of the agent's static data is committed."""
+        self._remember(agent_id, digest)
+
+    # --- Unknown Agents ---
+
+    def unknown_agents(self, cur, agent_ids):
+        """
+        The agent_ids that have no row in 'agents'. Only ids this
+        registry hasn't seen yet are looked up, all in one query.
+        """
+        now = time.monotonic()
+        unknown = set()
+        lookup = []
+        for agent_id in set(agent_ids):
+            if agent_id in self._known:
+                self._known.move_to_end(agent_id)
+            elif now - self._unknown.get(agent_id, -UNKNOWN_AGENT_TTL) < UNKNOWN_AGENT_TTL:
+                unknown.add(agent_id)
+            else:
+                lookup.append(agent_id)
+
+        if lookup:
+            cur.execute(
+                "SELECT agent_id::text FROM agents WHERE agent_id = ANY(%s::uuid[]);",
+                (lookup,)
+            )
+            found = {row[0] for row in cur.fetchall()}
+            if len(self._unknown) > self.max_agents:
+                self._unknown.clear()
+            for agent_id in lookup:
+                if agent_id in found:
+                    self._remember(agent_id, None)
+                else:
+                    self._unknown[agent_id] = now
+                    unknown.add(agent_id)
+        return unknown
+
+    # --- Last Seen ---
+
+    def touch(self, agent_id, seen):
+        """Records that an agent sent data sampled at 'seen' (epoch seconds)."""
+        if seen > self._last_seen.get(agent_id, 0):
+            self._last_seen[agent_id] = seen
+
+    @property
+    def pending_last_seen(self):
+        return len(self._last_seen)
+
+    def flush_last_seen(self, conn):
+        """
+        Writes every collected last_seen with one set-based UPDATE and
+        commits. Rows that are already as recent are left alone, so they
+        don't get a new row version. On failure the times are kept for
+        the next flush and the error is raised.
+        """
+        pending, self._last_seen = self._last_seen, {}
+        if not pending:
+            return 0
+        try:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE agents SET last_seen = to_timestamp(v.seen)
+                    FROM (VALUES %s) AS v(agent_id, seen)
+                    WHERE agents.agent_id = v.agent_id::uuid
+                      AND (agents.last_seen IS NULL OR agents.last_seen < to_timestamp(v.seen));
+                    """,
+                    list(pending.items()),
+                    page_size=1000
+                )
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            for agent_id, seen in pending.items():
+                self.touch(agent_id, seen)
+            raise
+        return len(pending)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import argparse
+import pika
+from .codec import decode_message
+from .config import settings
+from .retry import DEAD_LETTER_QUEUE, RETRY_COUNT_HEADER, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER
+from .sharding import HashRing, METRICS_QUEUE_NAME
+
+# --- Dead-Letter Replay ---
+# Moves messages that ran out of retries back to the worker queues,
+# once whatever made them fail is fixed:
+#
+#   python -m src.replay              # replay everything
+#   python -m src.replay --limit 100  # only the oldest 100
+#   python -m src.replay --list       # only show what is there
+#
+# Each message goes to the shard queue its agent hashes to now (the
+# number of shards may have changed) and starts over with no retries.
+
+def message_agent_id(body: bytes, content_type: str):
+    """The agent_id the API routed a message by, or None."""
+    try:
+        data = decode_message(body, content_type)
+        if data.get("type") == "batch":
+            data = data["items"][0]
+        return data["payload"]["agent_id"]
+    except Exception:
+        return None
+
+def replay(channel, limit=None, list_only=False):
+    ring = HashRing(settings.WORKER_SHARDS)
+    count = 0
+    while limit is None or count < limit:
+        method, properties, body = channel.basic_get(queue=DEAD_LETTER_QUEUE)
+        if method is None:
+            break
+        count += 1
+        headers = dict(properties.headers or {})
+
+        if list_only:
+            print(f"{count}: from '{headers.get(ORIGINAL_QUEUE_HEADER)}' after "
+                  f"{headers.get(RETRY_COUNT_HEADER, 0)} retries: {headers.get(LAST_ERROR_HEADER)}")
+            continue
+
+        agent_id = message_agent_id(body, properties.content_type)
+        if agent_id is not None:
+            queue = ring.queue_for(agent_id)
+        else:
+            queue = headers.get(ORIGINAL_QUEUE_HEADER) or METRICS_QUEUE_NAME
+        for name in (RETRY_COUNT_HEADER, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER, "failed_at"):
+            headers.pop(name, None)
+
+        channel.queue_declare(queue=queue, durable=True)
+        channel.basic_publish(
+            exchange="",
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.content_type,
+                delivery_mode=pika.DeliveryMode.Persistent,
+                headers=headers
+            )
+        )
+        # Confirmed by the broker by now, so the dead-lettered copy can go
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay messages from the dead-letter queue.")
+    parser.add_argument("--limit", type=int, default=None, help="Most messages to replay")
+    parser.add_argument("--list", action="store_true", help="Only list the messages, leave them queued")
+    args = parser.parse_args()
+
+    creds = pika.PlainCredentials(settings.MQ_USER, settings.MQ_PASSWORD)
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.MQ_HOST, credentials=creds))
+    channel = connection.channel()
+    channel.confirm_delivery()
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+    try:
+        count = replay(channel, args.limit, args.list)
+    finally:
+        # Listed messages weren't acknowledged and go back to the queue
+        connection.close()
+    print(f"{count} dead-lettered messages {'found' if args.list else 'replayed'}.")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
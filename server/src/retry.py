@@ -0,0 +1,138 @@
+import time
+import pika
+
+# --- Retry Topology ---
+# A message the worker can't write is not put straight back on its
+# queue (it would come back at once and spin the worker). It is
+# republished, with its retry count in the headers, to a delay tier:
+#
+#   metrics.retry.<n>s (fanout) -> metrics_retry.<n>s (TTL n seconds)
+#       -- expires, dead-lettered to the default exchange -->
+#   the queue it came from (its routing key is kept)
+#
+# Each retry uses the next tier (the last one repeats). After
+# WORKER_MAX_RETRIES retries the message is parked in the dead-letter
+# queue until someone replays it (python -m src.replay).
+#
+# None of this applies while the database is down: the circuit breaker
+# pauses consumption instead, and the messages wait in their queues.
+
+DEAD_LETTER_QUEUE = "metrics_dead_letter"
+
+# Headers set on retried and dead-lettered messages
+RETRY_COUNT_HEADER = "retry_count"
+LAST_ERROR_HEADER = "last_error"
+ORIGINAL_QUEUE_HEADER = "original_queue"
+
+def parse_delays(text: str):
+    """'5,30,300' -> [5, 30, 300]"""
+    delays = [int(part) for part in text.split(",") if part.strip()]
+    if not delays or min(delays) <= 0:
+        raise ValueError(f"Retry delays must be positive seconds, got '{text}'")
+    return delays
+
+def retry_exchange_name(delay: int) -> str:
+    return f"metrics.retry.{delay}s"
+
+def retry_queue_name(delay: int) -> str:
+    return f"metrics_retry.{delay}s"
+
+def declare_retry_topology(channel, delays):
+    """Declares the delay tiers and the dead-letter queue (idempotent)."""
+    for delay in delays:
+        exchange = retry_exchange_name(delay)
+        queue = retry_queue_name(delay)
+        channel.exchange_declare(exchange=exchange, exchange_type="fanout", durable=True)
+        channel.queue_declare(
+            queue=queue,
+            durable=True,
+            arguments={
+                "x-message-ttl": delay * 1000,
+                # Expired messages go back through the default exchange,
+                # keeping their routing key (the queue they came from)
+                "x-dead-letter-exchange": "",
+            }
+        )
+        channel.queue_bind(queue=queue, exchange=exchange)
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+
+def retry_count(properties) -> int:
+    return int((properties.headers or {}).get(RETRY_COUNT_HEADER, 0))
+
+class Retrier:
+    """Sends failed messages to their next delay tier or to the dead-letter queue."""
+
+    def __init__(self, channel, delays, max_retries):
+        # A channel of its own with publisher confirms: the original is
+        # only acknowledged once the broker has the copy
+        self.channel = channel
+        self.channel.confirm_delivery()
+        self.delays = delays
+        self.max_retries = max_retries
+
+    def retry_later(self, queue, properties, body, error) -> str:
+        """
+        Republishes a message that failed on 'queue'. Returns where it
+        went. Raises if the broker didn't take it (the caller must not
+        acknowledge the original then).
+        """
+        attempt = retry_count(properties) + 1
+        headers = dict(properties.headers or {})
+        headers[RETRY_COUNT_HEADER] = attempt
+        headers[LAST_ERROR_HEADER] = str(error)[:500]
+        headers[ORIGINAL_QUEUE_HEADER] = queue
+        republished = pika.BasicProperties(
+            content_type=properties.content_type,
+            delivery_mode=pika.DeliveryMode.Persistent,
+            headers=headers
+        )
+
+        if attempt > self.max_retries:
+            headers["failed_at"] = time.time()
+            self.channel.basic_publish(
+                exchange="", routing_key=DEAD_LETTER_QUEUE, body=body, properties=republished
+            )
+            return DEAD_LETTER_QUEUE
+
+        delay = self.delays[min(attempt, len(self.delays)) - 1]
+        self.channel.basic_publish(
+            exchange=retry_exchange_name(delay), routing_key=queue, body=body, properties=republished
+        )
+        return retry_queue_name(delay)
+
+# --- Database Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Opened when a write fails because the database is unreachable. While
+    it is open the worker stops consuming and only probes the database,
+    with the wait between probes doubling up to 'max_delay' seconds.
+    Once a probe succeeds it closes and consumption resumes at full speed.
+    """
+
+    def __init__(self, probe, initial_delay=1.0, max_delay=30.0):
+        self.probe = probe
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.is_open = False
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def trip(self):
+        if not self.is_open:
+            self.is_open = True
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            print("WORKER: Database unavailable. Pausing consumption until it is back.")
+
+    def wait_until_closed(self, sleep):
+        """Probes until the database answers. 'sleep' must keep the MQ connection alive."""
+        delay = self.initial_delay
+        while True:
+            sleep(delay)
+            if self.probe():
+                self.is_open = False
+                print(f"WORKER: Database is back after {time.monotonic() - self.opened_at:.0f}s. "
+                      f"Resuming consumption.")
+                return
+            delay = min(delay * 2, self.max_delay)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import re
+import time
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from .config import settings
+
+# --- Resolution-Aware Reads ---
+# A series can be read from the raw hypertable or from its 1-minute or
+# 1-hour continuous aggregate (see "ROLLUPS" in db_init/01-init.sql).
+# choose_resolution() picks the cheapest one that still has enough
+# points for the request; fetch_series() reads it.
+
+# Rows fetched per round trip by the server-side cursor
+FETCH_SIZE = 10000
+
+# How often agents send high_freq (and at most low_freq) samples, roughly,
+# to estimate how many raw points a range holds
+RAW_STEP_SECONDS = 5
+
+# Statistics each rollup keeps per field, as "<field>_<stat>" columns
+STATS = ("avg", "min", "max", "p95")
+
+# Readable series: the raw table, the rollups, the columns that key one
+# series (besides the time) and the fields that can be requested.
+SOURCES = {
+    "high_freq": {
+        "raw": "metrics_high_freq",
+        "rollups": {"1m": "metrics_high_freq_1m", "1h": "metrics_high_freq_1h"},
+        "keys": (),
+        "fields": (
+            "cpu_percent_overall", "ram_percent_used", "swap_percent_used",
+            "disk_read_bytes_per_sec", "disk_write_bytes_per_sec",
+            "net_bytes_sent_per_sec", "net_bytes_recv_per_sec",
+        ),
+    },
+    "disk": {
+        "raw": "metrics_low_freq_disk",
+        "rollups": {"1m": "metrics_low_freq_disk_1m", "1h": "metrics_low_freq_disk_1h"},
+        "keys": ("mountpoint",),
+        "fields": ("percent_used", "used_gb", "total_gb"),
+    },
+}
+
+# Raw rows that carry their own min/max/p95 (the agent's ~1s summaries)
+RAW_STAT_COLUMNS = {
+    ("cpu_percent_overall", "min"): "coalesce(cpu_percent_min, cpu_percent_overall)",
+    ("cpu_percent_overall", "max"): "coalesce(cpu_percent_max, cpu_percent_overall)",
+    ("cpu_percent_overall", "p95"): "coalesce(cpu_percent_p95, cpu_percent_overall)",
+    ("ram_percent_used", "min"): "coalesce(ram_percent_min, ram_percent_used)",
+    ("ram_percent_used", "max"): "coalesce(ram_percent_max, ram_percent_used)",
+    ("ram_percent_used", "p95"): "coalesce(ram_percent_p95, ram_percent_used)",
+}
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+
+def parse_interval(text: str):
+    """'30 days' -> timedelta; '' (no limit) -> None. Covers what .env uses."""
+    if not text or not text.strip():
+        return None
+    match = re.fullmatch(r"\s*(\d+)\s*(second|minute|hour|day|week)s?\s*", text.lower())
+    if not match:
+        raise ValueError(f"Unsupported interval '{text}' (use e.g. '30 days')")
+    return timedelta(seconds=int(match.group(1)) * _UNITS[match.group(2)])
+
+def resolutions():
+    """(name, step in seconds, how long it is kept or None), finest first."""
+    return [
+        ("raw", RAW_STEP_SECONDS, parse_interval(settings.RAW_RETENTION)),
+        ("1m", 60, parse_interval(settings.ROLLUP_1M_RETENTION)),
+        ("1h", 3600, parse_interval(settings.ROLLUP_1H_RETENTION)),
+    ]
+
+def choose_resolution(start, end, max_points, now=None):
+    """
+    The coarsest resolution that still gives at least 'max_points'
+    points between 'start' and 'end' (datetimes), among those that
+    still hold data from 'start'. The caller thins that down to the
+    budget. Short ranges get the finest resolution available.
+    """
+    now = now or datetime.now(timezone.utc)
+    span = (end - start).total_seconds()
+    available = [
+        (name, step) for name, step, kept in resolutions()
+        if kept is None or start >= now - kept
+    ] or [resolutions()[-1][:2]]
+
+    for name, step in reversed(available):
+        if span / step >= max_points:
+            return name
+    return available[0][0]
+
+def series_columns(source, fields, resolution):
+    """Output column names and the SQL for them, for the chosen resolution."""
+    names, sql = [], []
+    for field in fields:
+        for stat in STATS:
+            names.append(f"{field}_{stat}")
+            if resolution == "raw":
+                sql.append(RAW_STAT_COLUMNS.get((field, stat), field))
+            else:
+                sql.append(f"{field}_{stat}")
+    return names, sql
+
+def series_query(source, fields, resolution):
+    """
+    The SELECT for one agent's series. Parameters: agent_id, start, end.
+    'fields' must already be checked against SOURCES[source]["fields"].
+    """
+    spec = SOURCES[source]
+    if resolution == "raw":
+        relation, time_column = spec["raw"], '"timestamp"'
+    else:
+        relation, time_column = spec["rollups"][resolution], "bucket"
+    _, columns = series_columns(source, fields, resolution)
+    keys = list(spec["keys"])
+    select = [f"extract(epoch FROM {time_column})"] + keys + columns
+    return (
+        f"SELECT {', '.join(select)} FROM {relation} "
+        f"WHERE agent_id = %s AND {time_column} >= %s AND {time_column} < %s "
+        f"ORDER BY {', '.join(keys + [time_column])};"
+    )
+
+def plain_number(value):
+    # extract(epoch ...), NUMERIC columns and their averages come back as Decimal
+    return float(value) if isinstance(value, Decimal) else value
+
+def fetch_series(conn, source, agent_id, start, end, fields, max_points):
+    """
+    Reads one agent's series at the resolution choose_resolution()
+    picks. Returns (resolution, series): one series per value of the
+    source's keys (just one for high_freq), each a dict with "key",
+    "timestamps" (epoch seconds) and "columns" ({"<field>_<stat>":
+    values}), ordered by time. Rows are streamed through a server-side
+    cursor straight into those lists.
+    """
+    unknown = set(fields) - set(SOURCES[source]["fields"])
+    if unknown:
+        raise ValueError(f"Unknown {source} fields: {', '.join(sorted(unknown))}")
+
+    resolution = choose_resolution(start, end, max_points)
+    names, _ = series_columns(source, fields, resolution)
+    key_count = len(SOURCES[source]["keys"])
+
+    series = {}
+    with conn.cursor(name="series_fetch") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(series_query(source, fields, resolution), (str(agent_id), start, end))
+        for row in cur:
+            key = row[1:1 + key_count]
+            current = series.get(key)
+            if current is None:
+                current = series[key] = {"key": key, "timestamps": [], "columns": {n: [] for n in names}}
+            current["timestamps"].append(float(row[0]))
+            for name, value in zip(names, row[1 + key_count:]):
+                current["columns"][name].append(plain_number(value))
+    return resolution, list(series.values())
+
+# --- Refreshing Late Rows ---
+# The refresh policies in db_init/01-init.sql only look back
+# POLICY_WINDOWS. Rows written with an older timestamp (a backfill, an
+# agent's spool replayed after a long outage) would never reach the
+# rollups, so whoever writes them collects their time range here and
+# refreshes it. Raw data past RAW_RETENTION is gone, and refreshing
+# over it would empty the rollups there, so that part is left alone.
+
+ROLLUP_STEPS = {"1m": 60, "1h": 3600}
+POLICY_WINDOWS = {"1m": 3 * 3600, "1h": 3 * 86400}
+
+# Raw table -> {resolution: rollup}
+ROLLUPS_BY_TABLE = {spec["raw"]: spec["rollups"] for spec in SOURCES.values()}
+
+class LateRows:
+    """Time range (epoch seconds) of rows per raw table that the refresh policies won't cover."""
+
+    def __init__(self):
+        self.ranges = {}  # raw table -> [oldest, newest]
+
+    def add(self, table, timestamps, now=None):
+        if table not in ROLLUPS_BY_TABLE:
+            return
+        cutoff = (now or time.time()) - min(POLICY_WINDOWS.values())
+        late = [t for t in timestamps if t < cutoff]
+        if not late:
+            return
+        current = self.ranges.setdefault(table, [min(late), max(late)])
+        current[0] = min(current[0], min(late))
+        current[1] = max(current[1], max(late))
+
+    def windows(self, now=None, max_span=None):
+        """
+        (rollup, start, end) datetimes to refresh, aligned to the rollups'
+        buckets, and the ranges left after them. With 'max_span' (seconds),
+        only that much of each table's range, oldest first, is taken.
+        """
+        now = now or time.time()
+        kept = parse_interval(settings.RAW_RETENTION)
+        hour = ROLLUP_STEPS["1h"]
+        windows, remaining = [], {}
+        for table, (oldest, newest) in self.ranges.items():
+            if kept is not None:
+                oldest = max(oldest, now - kept.total_seconds())
+            if oldest > newest:
+                continue  # all past RAW_RETENTION
+            # Chunks end on an hour, so neither rollup's buckets are split
+            end = (newest // hour + 1) * hour
+            if max_span is not None:
+                end = min(end, oldest // hour * hour + max(1, max_span // hour) * hour)
+            if end <= newest:
+                remaining[table] = [end, newest]
+            for resolution, rollup in ROLLUPS_BY_TABLE[table].items():
+                if oldest >= now - POLICY_WINDOWS[resolution]:
+                    continue  # the policy refreshes it
+                step = ROLLUP_STEPS[resolution]
+                windows.append((
+                    rollup,
+                    datetime.fromtimestamp(oldest // step * step, timezone.utc),
+                    datetime.fromtimestamp(end, timezone.utc),
+                ))
+        return windows, remaining
+
+    def refresh(self, conn, max_span=None):
+        """
+        Refreshes the rollups over the collected ranges and forgets them
+        (if it fails, they are kept for the next try). With 'max_span',
+        at most that many seconds per table are refreshed and the rest
+        is kept for the next call.
+        refresh_continuous_aggregate can't run inside a transaction, so
+        'conn' is switched to autocommit for it. Returns the windows refreshed.
+        """
+        windows, remaining = self.windows(max_span=max_span)
+        if windows:
+            conn.rollback()
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    for rollup, start, end in windows:
+                        cur.execute("CALL refresh_continuous_aggregate(%s, %s, %s);", (rollup, start, end))
+            finally:
+                conn.autocommit = autocommit
+        self.ranges = remaining
+        return windows
@@ -0,0 +1,203 @@
+import json
+from pydantic import ValidationError
+from .models import IngestDataAdapter
+
+# --- Table Rows ---
+# Turns validated payloads into column values for the metrics tables.
+# Shared by the worker and the backfill endpoint, so it must not touch
+# the database itself.
+
+# --- Normalized Messages ---
+# The API validates each item against IngestData once and publishes it
+# normalized: the models' JSON dump, with every field present, marked
+# "validated". The worker trusts those and reads the rows straight out
+# of the decoded dicts - validating again would cost more than
+# everything else it does per message (see bench_pipeline.py).
+
+def normalize(data) -> dict:
+    """The message the API publishes for a validated IngestData item."""
+    message = IngestDataAdapter.dump_python(data, mode="json")
+    message["validated"] = True
+    return message
+
+def trusted_message(message: dict) -> dict:
+    """
+    Returns a normalized message. Messages the API validated are passed
+    through; anything else (e.g. queued before the API validated) is
+    validated here. Raises ValidationError for invalid messages.
+    """
+    if message.get("validated"):
+        return message
+    return normalize(IngestDataAdapter.validate_python(message))
+
+# Summary columns on metrics_high_freq, in insert order
+SUMMARY_METRICS = ("cpu_percent", "ram_percent")
+SUMMARY_STATS = ("min", "max", "mean", "p95", "last")
+SUMMARY_COLUMNS = ", ".join(f"{m}_{s}" for m in SUMMARY_METRICS for s in SUMMARY_STATS)
+
+def summary_values(payload: dict):
+    """The summary column values for a high_freq payload (NULLs if absent)."""
+    summaries = payload["summaries"] or {}
+    values = []
+    for metric in SUMMARY_METRICS:
+        summary = summaries.get(metric)
+        for stat in SUMMARY_STATS:
+            values.append(summary[stat] if summary else None)
+    return tuple(values)
+
+# Per-core CPU is stored as SMALLINT[] in hundredths of a percent
+CORE_PERCENT_SCALE = 100
+
+def quantize_cores(percents):
+    """Per-core percents -> the cpu_percent_per_core array (None if empty)."""
+    if not percents:
+        return None
+    return [min(100 * CORE_PERCENT_SCALE, max(0, round(p * CORE_PERCENT_SCALE))) for p in percents]
+
+def high_freq_values(payload: dict):
+    """
+    The metrics_high_freq column values (without the timestamp),
+    ending with the summaries and then cpu_percent_per_core.
+    """
+    return (
+        payload["agent_id"], payload["cpu_percent_overall"], payload["ram_percent_used"],
+        payload["swap_percent_used"], payload["disk_io"]["read_bytes_per_sec"],
+        payload["disk_io"]["write_bytes_per_sec"], payload["network_io"]["bytes_sent_per_sec"],
+        payload["network_io"]["bytes_recv_per_sec"]
+    ) + summary_values(payload) + (quantize_cores(payload["cpu_percent_per_core"]),)
+
+# metrics_agent_health columns after "timestamp", in insert order
+AGENT_HEALTH_COLUMNS = (
+    "agent_id, interval_seconds, process_cpu_percent, process_rss_mb, collectors, "
+    "queue_depth, queue_oldest_age_seconds, spool_bytes, spool_evicted_total, "
+    "send_requests, send_latency_ms_p50, send_latency_ms_max, items_sent, "
+    "send_retries, items_dropped"
+)
+
+def agent_health_values(payload: dict):
+    """The metrics_agent_health column values (without the timestamp)."""
+    return (
+        payload["agent_id"], payload["interval_seconds"], payload["process_cpu_percent"],
+        payload["process_rss_mb"], json.dumps(payload["collectors"]),
+        payload["queue_depth"], payload["queue_oldest_age_seconds"], payload["spool_bytes"],
+        payload["spool_evicted_total"], payload["send_requests"], payload["send_latency_ms_p50"],
+        payload["send_latency_ms_max"], payload["items_sent"], payload["send_retries"],
+        payload["items_dropped"]
+    )
+
+def static_values(payload: dict):
+    """The agents column values (without last_seen) for a static payload."""
+    return (
+        payload["agent_id"], payload["hostname"], payload["os"],
+        payload["cpu_cores_physical"], payload["cpu_cores_logical"], payload["ram_total_gb"],
+        json.dumps(payload["partitions"]), # Store partitions as JSON
+        payload["group_name"], payload["sub_group_name"]
+    )
+
+def nic_rows(payload: dict):
+    """metrics_net_per_nic rows (without the timestamp) for a high_freq payload."""
+    agent_id = payload["agent_id"]
+    return [
+        (agent_id, n["nic"], n["bytes_sent_per_sec"], n["bytes_recv_per_sec"],
+         n["packets_sent_per_sec"], n["packets_recv_per_sec"], n["errors_per_sec"], n["drops_per_sec"])
+        for n in payload["network_io_per_nic"]
+    ]
+
+def disk_device_rows(payload: dict):
+    """metrics_disk_per_device rows (without the timestamp) for a high_freq payload."""
+    agent_id = payload["agent_id"]
+    return [
+        (agent_id, d["device"], d["read_bytes_per_sec"],
+         d["write_bytes_per_sec"], d["reads_per_sec"], d["writes_per_sec"])
+        for d in payload["disk_io_per_device"]
+    ]
+
+def process_rows(payload: dict):
+    """
+    metrics_processes rows (without the timestamp) for the top processes
+    by CPU, memory and I/O. A process in more than one list is stored once.
+    """
+    agent_id = payload["agent_id"]
+    unique = {}
+    for proc in (payload["top_5_processes"] + payload["top_5_processes_by_memory"]
+                 + payload["top_5_processes_by_io"]):
+        unique.setdefault(proc["pid"], proc)
+    return [
+        (agent_id, p["pid"], p["name"], p["username"],
+         p["cpu_percent"], p["memory_percent"], p["io_bytes_per_sec"])
+        for p in unique.values()
+    ]
+
+def disk_usage_rows(payload: dict):
+    """metrics_low_freq_disk rows (without the timestamp) for a low_freq payload."""
+    agent_id = payload["agent_id"]
+    return [
+        (agent_id, d["mountpoint"], d["available"], d["percent_used"], d["total_gb"], d["used_gb"])
+        for d in payload["disk_usage"]
+    ]
+
+# --- Batch Rows ---
+
+def build_batch_rows(messages):
+    """
+    Groups a list of (received_at, data) messages into rows for each
+    table. Invalid messages are dropped here, exactly like the
+    per-message path does.
+
+    Rows are stamped with the time the agent collected the sample when
+    the message carries one, so a backlog sent in one batch after an
+    outage keeps its original spacing.
+    """
+    agents = {}       # agent_id -> row (last static message wins)
+    high_freq = []
+    nics = []
+    disk_devices = []
+    processes = []
+    disks = []
+    agent_health = []
+    last_seen = {}    # agent_id -> latest received_at
+
+    for received_at, data in messages:
+        msg_type = data.get("type")
+
+        if not msg_type or not data.get("payload"):
+            print("WORKER: Invalid message structure in batch. Discarding.")
+            continue
+
+        try:
+            message = trusted_message(data)
+        except ValidationError as e:
+            print(f"WORKER: Invalid {msg_type} message in batch: {e}")
+            continue
+
+        payload = message["payload"]
+        sampled_at = message["timestamp"] or received_at
+        stamp = (sampled_at,)
+
+        if msg_type == "static":
+            agents[payload["agent_id"]] = static_values(payload) + stamp
+
+        elif msg_type == "high_freq":
+            agent_id = payload["agent_id"]
+            high_freq.append(stamp + high_freq_values(payload))
+            nics.extend(stamp + row for row in nic_rows(payload))
+            disk_devices.extend(stamp + row for row in disk_device_rows(payload))
+            processes.extend(stamp + row for row in process_rows(payload))
+            last_seen[agent_id] = max(sampled_at, last_seen.get(agent_id, 0))
+
+        elif msg_type == "low_freq":
+            disks.extend(stamp + row for row in disk_usage_rows(payload))
+
+        elif msg_type == "agent_health":
+            agent_health.append(stamp + agent_health_values(payload))
+
+    return {
+        "agents": list(agents.values()),
+        "high_freq": high_freq,
+        "nics": nics,
+        "disk_devices": disk_devices,
+        "processes": processes,
+        "disks": disks,
+        "agent_health": agent_health,
+        "last_seen": list(last_seen.items()),
+    }
\ No newline at end of file
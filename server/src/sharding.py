@@ -0,0 +1,48 @@
+import bisect
+import hashlib
+
+# --- Worker Shards ---
+# Messages are spread over WORKER_SHARDS queues, one worker process
+# each. The queue is picked by hashing the agent_id onto a ring, so all
+# of an agent's messages land in the same queue and stay in order, while
+# different agents are written in parallel. Changing the number of
+# shards only moves about 1/N of the agents to another queue.
+
+# This is the name of the queue our worker will listen to
+# (with one shard; shards are "<name>.<n>")
+METRICS_QUEUE_NAME = "metrics_queue"
+
+def shard_queue_name(shard: int, shards: int) -> str:
+    if shards <= 1:
+        return METRICS_QUEUE_NAME
+    return f"{METRICS_QUEUE_NAME}.{shard}"
+
+def shard_queue_names(shards: int):
+    return [shard_queue_name(shard, shards) for shard in range(max(1, shards))]
+
+def _hash(key: str) -> int:
+    # Not hash(): that is salted per process, and the API and the
+    # workers must agree
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hashing of keys onto 'shards' shards."""
+
+    def __init__(self, shards: int, replicas: int = 64):
+        self.shards = max(1, shards)
+        points = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(self.shards)
+            for replica in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, key) -> int:
+        if self.shards == 1 or key is None:
+            return 0
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._shards[index]
+
+    def queue_for(self, key) -> str:
+        return shard_queue_name(self.shard_for(key), self.shards)
\ No newline at end of file
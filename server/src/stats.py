@@ -0,0 +1,32 @@
+import threading
+from collections import deque
+
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies in a fixed-size window
+    so percentiles can be reported without unbounded memory.
+    """
+
+    def __init__(self, window: int = 10000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        """Returns the given percentile (0-100) in milliseconds, or None if empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return round(samples[index] * 1000, 3)
+
+    def summary(self) -> dict:
+        return {
+            "count": len(self._samples),
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+        }
@@ -1,24 +1,114 @@
+import multiprocessing
+from abc import ABC, abstractmethod
 import pika
-import json
+import signal
 import sys
 import time
+from .codec import decode_message, MalformedBody, UnsupportedEncoding
 from .config import settings
-from .database import get_db_connection, release_db_connection
-from .models import StaticPayload, HighFreqPayload, LowFreqPayload
-from .mq_client import METRICS_QUEUE_NAME
+from .database import get_db_connection, release_db_connection, check_db_connection
+from .latest import LatestState
+from .policies import apply_storage_policies
+from .process_identities import ProcessIdentities
+from .registry import AgentRegistry
+from .rollups import LateRows
+from .retry import CircuitBreaker, Retrier, declare_retry_topology, parse_delays, retry_count
+from .sharding import METRICS_QUEUE_NAME, shard_queue_name
+from .rows import (
+    SUMMARY_COLUMNS, AGENT_HEALTH_COLUMNS, trusted_message, build_batch_rows,
+    static_values, high_freq_values, agent_health_values, nic_rows,
+    disk_device_rows, process_rows, disk_usage_rows
+)
 from pydantic import ValidationError
+from psycopg2.extras import execute_values
+
+# Rows sent per multi-row INSERT statement in batch mode
+BATCH_PAGE_SIZE = 1000
+
+# How often (in seconds) each worker prints how far behind its queue is
+LAG_REPORT_INTERVAL = 30
+
+# What this worker process knows about the 'agents' table (see src/registry.py)
+agent_registry = AgentRegistry(settings.AGENT_REGISTRY_SIZE)
+
+# Newest values per agent for agent_latest (see src/latest.py)
+latest_state = LatestState()
+
+# (name, username) -> process_id for metrics_process_samples (see src/process_identities.py)
+process_identities = ProcessIdentities(settings.PROCESS_IDENTITY_CACHE_SIZE)
+
+# Rows too old for the rollups' refresh policies (see src/rollups.py)
+late_rows = LateRows()
+
+# Pauses consumption while the database is unreachable (see src/retry.py)
+breaker = CircuitBreaker(check_db_connection, max_delay=settings.WORKER_DB_PROBE_MAX_S)
+
+# The error behind the last failed write, sent along with the retried message
+last_write_error = None
+
+# Metric row lists in build_batch_rows() output, whose rows all have the
+# agent_id right after the timestamp
+METRIC_ROWS = ("high_freq", "nics", "disk_devices", "processes", "disks", "agent_health")
 
 # --- Database Handler Functions ---
 
-def process_static_data(payload: dict):
+def write_failed(what: str, error: Exception) -> bool:
+    """Logs and remembers a failed write. Returns False (don't acknowledge)."""
+    global last_write_error
+    last_write_error = f"{type(error).__name__}: {error}"
+    print(f"WORKER: Error {what}: {error}")
+    return False
+
+def insert_device_rates(cur, nics, devices):
+    """
+    Writes per-NIC and per-disk rows with one multi-row INSERT each.
+    Rows start with an epoch timestamp.
+    """
+    if nics:
+        execute_values(
+            cur,
+            """
+            INSERT INTO metrics_net_per_nic (
+                "timestamp", agent_id, nic, bytes_sent_per_sec, bytes_recv_per_sec,
+                packets_sent_per_sec, packets_recv_per_sec, errors_per_sec, drops_per_sec
+            )
+            VALUES %s;
+            """,
+            nics,
+            template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s)",
+            page_size=BATCH_PAGE_SIZE
+        )
+    if devices:
+        execute_values(
+            cur,
+            """
+            INSERT INTO metrics_disk_per_device (
+                "timestamp", agent_id, device, read_bytes_per_sec,
+                write_bytes_per_sec, reads_per_sec, writes_per_sec
+            )
+            VALUES %s;
+            """,
+            devices,
+            template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s)",
+            page_size=BATCH_PAGE_SIZE
+        )
+
+def process_static_data(payload: dict, sampled_at: float):
     """
-    Validates and 'upserts' static agent data into the 'agents' table.
+    'Upserts' static agent data into the 'agents' table, unless the
+    agent's row already holds exactly this data.
     """
+    values = static_values(payload)
+    digest = agent_registry.changed_static(values)
+    if digest is None:
+        # Same data as last time (e.g. an agent restart); only last_seen moves
+        agent_registry.touch(payload["agent_id"], sampled_at)
+        print(f"Static data for agent {payload['agent_id']} unchanged. Skipping upsert.")
+        return True
+
+    conn = None
     try:
-        # 1. Validate the payload
-        data = StaticPayload(**payload)
-        
-        # 2. Get DB connection and write
+        # 1. Get DB connection and write
         conn = get_db_connection()
         if not conn:
             print("Worker: No DB connection. Retrying...")
@@ -34,7 +124,7 @@ def process_static_data(payload: dict):
                     agent_id, hostname, os, cpu_cores_physical, cpu_cores_logical,
                     ram_total_gb, partitions, group_name, sub_group_name, last_seen
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s))
                 ON CONFLICT (agent_id) DO UPDATE SET
                     hostname = EXCLUDED.hostname,
                     os = EXCLUDED.os,
@@ -44,218 +134,720 @@ def process_static_data(payload: dict):
                     partitions = EXCLUDED.partitions,
                     group_name = EXCLUDED.group_name,
                     sub_group_name = EXCLUDED.sub_group_name,
-                    last_seen = NOW();
+                    last_seen = EXCLUDED.last_seen;
                 """,
-                (
-                    str(data.agent_id), data.hostname, data.os, data.cpu_cores_physical,
-                    data.cpu_cores_logical, data.ram_total_gb, 
-                    json.dumps([p.model_dump() for p in data.partitions]), # Store partitions as JSON
-                    data.group_name, data.sub_group_name
-                )
+                values + (sampled_at,)
             )
         conn.commit()
-        print(f"Successfully processed static data for agent {data.agent_id}")
+        agent_registry.static_written(payload["agent_id"], digest)
+        print(f"Successfully processed static data for agent {payload['agent_id']}")
         return True
         
-    except ValidationError as e:
-        print(f"WORKER: Invalid static data format: {e}")
-        return True # Acknowledge message, don't retry bad data
     except Exception as e:
-        print(f"WORKER: Error processing static data: {e}")
-        return False # Do not acknowledge, retry
+        return write_failed("processing static data", e) # Do not acknowledge, retry
     finally:
         release_db_connection(conn)
 
-def process_high_freq_data(payload: dict):
+def is_unknown_agent(cur, payload: dict, msg_type: str) -> bool:
+    """
+    True (and logged) if the payload's agent isn't registered. Its rows
+    would only fail the foreign keys, so the message is discarded.
+    """
+    if agent_registry.unknown_agents(cur, [payload["agent_id"]]):
+        print(f"WORKER: {msg_type} data from unknown agent {payload['agent_id']}. Discarding.")
+        return True
+    return False
+
+def process_high_freq_data(payload: dict, sampled_at: float):
     """
-    Validates and inserts high-frequency metrics into the database.
-    Also updates the 'last_seen' status for the agent.
+    Inserts high-frequency metrics into the database.
+    The agent's 'last_seen' and latest values are recorded in memory
+    and written with the next flush.
     """
     conn = None
     try:
-        # 1. Validate payload
-        data = HighFreqPayload(**payload)
-        
-        # 2. Get DB connection
+        # 1. Get DB connection
         conn = get_db_connection()
         if not conn:
             print("Worker: No DB connection. Retrying...")
             return False
         
         with conn.cursor() as cur:
-            # 3. Insert into the main metrics hypertable
+            if is_unknown_agent(cur, payload, "high_freq"):
+                return True
+
+            # New process identities are committed here, ahead of the
+            # message's rows, so those stay in one transaction
+            processes = process_identities.with_ids(conn, process_rows(payload), 2)
+
+            # 2. Insert into the main metrics hypertable
+            values = (sampled_at,) + high_freq_values(payload)
             cur.execute(
-                """
+                f"""
                 INSERT INTO metrics_high_freq (
                     "timestamp", agent_id, cpu_percent_overall, ram_percent_used,
                     swap_percent_used, disk_read_bytes_per_sec, disk_write_bytes_per_sec,
-                    net_bytes_sent_per_sec, net_bytes_recv_per_sec
+                    net_bytes_sent_per_sec, net_bytes_recv_per_sec, {SUMMARY_COLUMNS},
+                    cpu_percent_per_core
                 )
-                VALUES (NOW(), %s, %s, %s, %s, %s, %s, %s, %s);
+                VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s,
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::smallint[]);
                 """,
-                (
-                    str(data.agent_id), data.cpu_percent_overall, data.ram_percent_used,
-                    data.swap_percent_used, data.disk_io.read_bytes_per_sec,
-                    data.disk_io.write_bytes_per_sec, data.network_io.bytes_sent_per_sec,
-                    data.network_io.bytes_recv_per_sec
-                )
+                values
             )
             
-            # 4. Insert process data IF it exists (sent on threshold breach)
-            if data.top_5_processes:
-                for proc in data.top_5_processes:
-                    cur.execute(
-                        """
-                        INSERT INTO metrics_processes (
-                            "timestamp", agent_id, pid, name, username, 
-                            cpu_percent, memory_percent
-                        )
-                        VALUES (NOW(), %s, %s, %s, %s, %s, %s);
-                        """,
-                        (str(data.agent_id), proc.pid, proc.name, proc.username,
-                         proc.cpu_percent, proc.memory_percent)
-                    )
-            
-            # 5. Update the agent's 'last_seen' timestamp
-            cur.execute(
-                "UPDATE agents SET last_seen = NOW() WHERE agent_id = %s;",
-                (str(data.agent_id),)
+            # Per-NIC and per-disk rates
+            stamp = (sampled_at,)
+            insert_device_rates(
+                cur,
+                [stamp + row for row in nic_rows(payload)],
+                [stamp + row for row in disk_device_rows(payload)]
             )
-            
+
+            # 3. Insert process data IF it exists (sent on threshold breach),
+            # with the (name, username) stored as its process_id
+            for row in processes:
+                cur.execute(
+                    """
+                    INSERT INTO metrics_process_samples (
+                        "timestamp", agent_id, pid, process_id,
+                        cpu_percent, memory_percent, io_bytes_per_sec
+                    )
+                    VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s);
+                    """,
+                    stamp + row
+                )
+
         conn.commit()
-        print(f"Processed high_freq data for agent {data.agent_id}")
+        # 4. The agent's 'last_seen' and latest values are written with the next flush
+        agent_registry.touch(payload["agent_id"], sampled_at)
+        latest_state.record_high_freq(values)
+        late_rows.add("metrics_high_freq", (sampled_at,))
+        print(f"Processed high_freq data for agent {payload['agent_id']}")
         return True
 
-    except ValidationError as e:
-        print(f"WORKER: Invalid high_freq data format: {e}")
-        return True # Acknowledge, don't retry bad data
     except Exception as e:
-        print(f"WORKER: Error processing high_freq data: {e}")
-        return False # Do not acknowledge, retry
+        return write_failed("processing high_freq data", e) # Do not acknowledge, retry
     finally:
         release_db_connection(conn)
 
-def process_low_freq_data(payload: dict):
+def process_low_freq_data(payload: dict, sampled_at: float):
     """
-    Validates and inserts low-frequency (disk) metrics.
+    Inserts low-frequency (disk) metrics.
     """
     conn = None
     try:
-        # 1. Validate payload
-        data = LowFreqPayload(**payload)
-        
-        # 2. Get DB connection
+        # 1. Get DB connection
         conn = get_db_connection()
         if not conn:
             print("Worker: No DB connection. Retrying...")
             return False
 
         with conn.cursor() as cur:
-            # 3. Loop and insert each disk partition
-            for disk in data.disk_usage:
+            if is_unknown_agent(cur, payload, "low_freq"):
+                return True
+
+            # 2. Loop and insert each disk partition
+            rows = [(sampled_at,) + row for row in disk_usage_rows(payload)]
+            for row in rows:
                 cur.execute(
                     """
                     INSERT INTO metrics_low_freq_disk (
-                        "timestamp", agent_id, mountpoint, percent_used,
+                        "timestamp", agent_id, mountpoint, available, percent_used,
                         total_gb, used_gb
                     )
-                    VALUES (NOW(), %s, %s, %s, %s, %s);
+                    VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (agent_id, mountpoint, "timestamp") DO NOTHING;
                     """,
-                    (str(data.agent_id), disk.mountpoint, disk.percent_used,
-                     disk.total_gb, disk.used_gb)
+                    row
                 )
         
         conn.commit()
-        print(f"Processed low_freq (disk) data for agent {data.agent_id}")
+        latest_state.record_disks(rows)
+        if rows:
+            late_rows.add("metrics_low_freq_disk", (sampled_at,))
+        print(f"Processed low_freq (disk) data for agent {payload['agent_id']}")
         return True
 
-    except ValidationError as e:
-        print(f"WORKER: Invalid low_freq data format: {e}")
-        return True # Acknowledge, don't retry
     except Exception as e:
-        print(f"WORKER: Error processing low_freq data: {e}")
-        return False # Do not acknowledge, retry
+        return write_failed("processing low_freq data", e) # Do not acknowledge, retry
     finally:
         release_db_connection(conn)
 
-# --- Main Worker Loop ---
+def process_agent_health_data(payload: dict, sampled_at: float):
+    """
+    Inserts the agent's report on its own overhead and backlog.
+    """
+    conn = None
+    try:
+        # 1. Get DB connection
+        conn = get_db_connection()
+        if not conn:
+            print("Worker: No DB connection. Retrying...")
+            return False
+
+        with conn.cursor() as cur:
+            if is_unknown_agent(cur, payload, "agent_health"):
+                return True
 
-def mq_callback(ch, method, properties, body):
+            # 2. One row per report
+            cur.execute(
+                f"""
+                INSERT INTO metrics_agent_health ("timestamp", {AGENT_HEALTH_COLUMNS})
+                VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                """,
+                (sampled_at,) + agent_health_values(payload)
+            )
+
+        conn.commit()
+        print(f"Processed agent_health data for agent {payload['agent_id']}")
+        return True
+
+    except Exception as e:
+        return write_failed("processing agent_health data", e) # Do not acknowledge, retry
+    finally:
+        release_db_connection(conn)
+
+# --- Message Routing ---
+
+def route_message(data: dict):
     """
-    This function is called for every message received from the queue.
+    Sends a single decoded message to the correct processor.
+    Returns True if the message can be acknowledged.
     """
-    print("\nWORKER: Received new message. Processing...")
-    
+    msg_type = data.get("type")
+    payload = data.get("payload")
+
+    if msg_type == "batch":
+        # Many items from one agent; write them together in one transaction
+        items = data.get("items") or []
+        now = time.time()
+        return write_batch([(now, item) for item in items if isinstance(item, dict)])
+
+    if not msg_type or not payload:
+        print("WORKER: Invalid message structure. Discarding.")
+        return True
+
+    # Messages from the API were validated there; only anything else is checked here
     try:
-        data = json.loads(body)
-        msg_type = data.get("type")
-        payload = data.get("payload")
+        message = trusted_message(data)
+    except ValidationError as e:
+        print(f"WORKER: Invalid {msg_type} message: {e}. Discarding.")
+        return True # Acknowledge, don't retry bad data
 
-        if not msg_type or not payload:
-            print("WORKER: Invalid message structure. Discarding.")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            return
+    # Stamped with the time the agent collected it, like in batch mode,
+    # so data replayed from the agent's spool keeps its original time
+    payload = message["payload"]
+    sampled_at = message["timestamp"] or time.time()
 
-        # Route the message to the correct processor
-        if msg_type == "static":
-            success = process_static_data(payload)
-        elif msg_type == "high_freq":
-            success = process_high_freq_data(payload)
-        elif msg_type == "low_freq":
-            success = process_low_freq_data(payload)
-        else:
-            print(f"WORKER: Unknown message type '{msg_type}'. Discarding.")
-            success = True # Acknowledge and discard
+    if msg_type == "static":
+        return process_static_data(payload, sampled_at)
+    elif msg_type == "high_freq":
+        return process_high_freq_data(payload, sampled_at)
+    elif msg_type == "low_freq":
+        return process_low_freq_data(payload, sampled_at)
+    elif msg_type == "agent_health":
+        return process_agent_health_data(payload, sampled_at)
+
+    print(f"WORKER: Unknown message type '{msg_type}'. Discarding.")
+    return True # Acknowledge and discard
 
-        # Acknowledge or reject the message
-        if success:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            print("WORKER: Message processed and acknowledged.")
+# --- Batch Processing ---
+
+def write_batch(messages):
+    """
+    Writes a whole batch of messages in a single transaction using
+    multi-row INSERTs. Returns True if the batch was committed.
+
+    Rows carry the agent's timestamp, so a message delivered twice (a
+    broker redelivery, an agent resending a batch it got no answer for)
+    repeats its rows exactly. Disk usage rows skip those on their key;
+    the other metric tables have none and store such a repeat twice.
+    """
+    rows = build_batch_rows(messages)
+    if not any(rows.values()):
+        return True # Nothing valid to write, acknowledge the batch
+
+    # Only static data that changed is upserted
+    static = []
+    for row in rows["agents"]:
+        digest = agent_registry.changed_static(row[:-1])
+        if digest is None:
+            agent_registry.touch(row[0], row[-1])
         else:
-            # Re-queue the message to be retried
+            static.append((row, digest))
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            print("Worker: No DB connection. Retrying...")
+            return False
+
+        with conn.cursor() as cur:
+            # Rows of agents that aren't registered would fail the foreign keys
+            registered = {row[0] for row in rows["agents"]}
+            referenced = {row[1] for name in METRIC_ROWS for row in rows[name]}
+            unknown = agent_registry.unknown_agents(cur, referenced - registered)
+            if unknown:
+                print(f"WORKER: Discarding batch data from {len(unknown)} unknown agent(s).")
+                for name in METRIC_ROWS:
+                    rows[name] = [row for row in rows[name] if row[1] not in unknown]
+
+            # New process identities are committed here, ahead of the batch
+            rows["processes"] = process_identities.with_ids(conn, rows["processes"], 3)
+
+            # 1. Agents first, so metrics in the same batch satisfy the foreign keys
+            if static:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO agents (
+                        agent_id, hostname, os, cpu_cores_physical, cpu_cores_logical,
+                        ram_total_gb, partitions, group_name, sub_group_name, last_seen
+                    )
+                    VALUES %s
+                    ON CONFLICT (agent_id) DO UPDATE SET
+                        hostname = EXCLUDED.hostname,
+                        os = EXCLUDED.os,
+                        cpu_cores_physical = EXCLUDED.cpu_cores_physical,
+                        cpu_cores_logical = EXCLUDED.cpu_cores_logical,
+                        ram_total_gb = EXCLUDED.ram_total_gb,
+                        partitions = EXCLUDED.partitions,
+                        group_name = EXCLUDED.group_name,
+                        sub_group_name = EXCLUDED.sub_group_name,
+                        last_seen = EXCLUDED.last_seen;
+                    """,
+                    [row for row, _ in static],
+                    template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s))",
+                    page_size=BATCH_PAGE_SIZE
+                )
+
+            # 2. Main metrics hypertable
+            if rows["high_freq"]:
+                execute_values(
+                    cur,
+                    f"""
+                    INSERT INTO metrics_high_freq (
+                        "timestamp", agent_id, cpu_percent_overall, ram_percent_used,
+                        swap_percent_used, disk_read_bytes_per_sec, disk_write_bytes_per_sec,
+                        net_bytes_sent_per_sec, net_bytes_recv_per_sec, {SUMMARY_COLUMNS},
+                        cpu_percent_per_core
+                    )
+                    VALUES %s;
+                    """,
+                    rows["high_freq"],
+                    template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, "
+                             "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::smallint[])",
+                    page_size=BATCH_PAGE_SIZE
+                )
+
+            # Per-NIC and per-disk rates
+            insert_device_rates(cur, rows["nics"], rows["disk_devices"])
+
+            # 3. Top processes
+            if rows["processes"]:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO metrics_process_samples (
+                        "timestamp", agent_id, pid, process_id,
+                        cpu_percent, memory_percent, io_bytes_per_sec
+                    )
+                    VALUES %s;
+                    """,
+                    rows["processes"],
+                    template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s)",
+                    page_size=BATCH_PAGE_SIZE
+                )
+
+            # 4. Disk usage
+            if rows["disks"]:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO metrics_low_freq_disk (
+                        "timestamp", agent_id, mountpoint, available, percent_used,
+                        total_gb, used_gb
+                    )
+                    VALUES %s
+                    ON CONFLICT (agent_id, mountpoint, "timestamp") DO NOTHING;
+                    """,
+                    rows["disks"],
+                    template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s)",
+                    page_size=BATCH_PAGE_SIZE
+                )
+
+            # 5. Agent self-telemetry
+            if rows["agent_health"]:
+                execute_values(
+                    cur,
+                    f"""
+                    INSERT INTO metrics_agent_health ("timestamp", {AGENT_HEALTH_COLUMNS})
+                    VALUES %s;
+                    """,
+                    rows["agent_health"],
+                    template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, "
+                             "%s, %s, %s, %s, %s, %s, %s)",
+                    page_size=BATCH_PAGE_SIZE
+                )
+
+        conn.commit()
+        for row, digest in static:
+            agent_registry.static_written(row[0], digest)
+        # 6. 'last_seen' and latest values are written for all agents at once with the next flush
+        for agent_id, seen in rows["last_seen"]:
+            if agent_id not in unknown:
+                agent_registry.touch(agent_id, seen)
+        for row in rows["high_freq"]:
+            latest_state.record_high_freq(row)
+        latest_state.record_disks(rows["disks"])
+        late_rows.add("metrics_high_freq", (row[0] for row in rows["high_freq"]))
+        late_rows.add("metrics_low_freq_disk", (row[0] for row in rows["disks"]))
+        return True
+
+    except Exception as e:
+        if conn and not conn.closed:
+            conn.rollback()
+        return write_failed("writing batch", e)
+    finally:
+        release_db_connection(conn)
+
+def flush_last_seen():
+    """
+    Writes the 'last_seen' times the registry collected since the last
+    flush with one UPDATE. Runs every AGENT_LAST_SEEN_FLUSH_S seconds
+    and on shutdown; if it fails, the times wait for the next one.
+    """
+    if not agent_registry.pending_last_seen or breaker.is_open:
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        count = agent_registry.flush_last_seen(conn)
+        print(f"WORKER: last_seen updated for {count} agents "
+              f"({agent_registry.static_skipped} unchanged static upserts skipped so far).")
+    except Exception as e:
+        print(f"WORKER: Error updating last_seen: {e}")
+    finally:
+        release_db_connection(conn)
+
+def flush_latest_state():
+    """
+    Writes the newest values per agent into agent_latest, with the
+    last_seen flush. If it fails they are dropped; newer ones follow.
+    """
+    if not latest_state.pending or breaker.is_open:
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        latest_state.flush(conn)
+    except Exception as e:
+        print(f"WORKER: Error updating agent_latest: {e}")
+    finally:
+        release_db_connection(conn)
+
+def refresh_late_rollups():
+    """
+    Refreshes the rollups over rows written that are older than their
+    refresh policies look back (e.g. an agent's spool replayed after a
+    long outage). It runs on the consumer's thread, so each call only
+    takes WORKER_ROLLUP_REFRESH_HOURS of them and leaves the rest for the
+    next flush; a long refresh would stall the AMQP heartbeats. If it
+    fails, the range is kept and tried again.
+    """
+    if not late_rows.ranges or breaker.is_open:
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        max_span = settings.WORKER_ROLLUP_REFRESH_HOURS * 3600
+        for rollup, start, end in late_rows.refresh(conn, max_span=max_span):
+            print(f"WORKER: refreshed {rollup} from {start.isoformat()} to {end.isoformat()} for late rows.")
+    except Exception as e:
+        print(f"WORKER: Error refreshing rollups for late rows: {e}")
+    finally:
+        release_db_connection(conn)
+
+def schedule_flushes(connection):
+    """
+    Runs flush_last_seen(), flush_latest_state() and refresh_late_rollups()
+    periodically on the consumer's connection.
+    """
+    def tick():
+        flush_last_seen()
+        flush_latest_state()
+        refresh_late_rollups()
+        connection.call_later(settings.AGENT_LAST_SEEN_FLUSH_S, tick)
+    connection.call_later(settings.AGENT_LAST_SEEN_FLUSH_S, tick)
+
+class QueueConsumer(ABC):
+    """
+    Consumes the worker's queues on one channel. While the database
+    circuit breaker is open, consumption is paused: the consumers are
+    cancelled (undelivered prefetched messages go back to their queue)
+    and only resumed once the database answers again.
+    """
+
+    def __init__(self, connection, channel, queue_names, lag, retrier):
+        self.connection = connection
+        self.channel = channel
+        self.queue_names = queue_names
+        self.lag = lag
+        self.retrier = retrier
+        self.consumer_tags = []
+
+    def start(self):
+        self.consumer_tags = [
+            self.channel.basic_consume(queue=name, on_message_callback=self.on_message)
+            for name in self.queue_names
+        ]
+
+    def pause(self):
+        for tag in self.consumer_tags:
+            self.channel.basic_cancel(tag)
+        self.consumer_tags = []
+
+    @abstractmethod
+    def on_message(self, ch, method, properties, body):
+        """Handles one delivery (pika's on_message_callback)."""
+
+    def wait_time(self):
+        """How long to wait for messages before idle() is called."""
+        return 1.0
+
+    def idle(self):
+        pass
+
+    def run(self):
+        self.start()
+        while True:
+            self.connection.process_data_events(time_limit=self.wait_time())
+            self.idle()
+            self.lag.maybe_report()
+
+            if breaker.is_open:
+                self.pause()
+                breaker.wait_until_closed(self.connection.sleep)
+                self.start()
+
+class MessageConsumer(QueueConsumer):
+    """Processes one message at a time."""
+
+    def on_message(self, ch, method, properties, body):
+        self.lag.record(properties)
+        print("\nWORKER: Received new message. Processing...")
+        handle_message(ch, method, properties, body, self.retrier)
+
+class BatchConsumer(QueueConsumer):
+    """
+    Buffers deliveries from RabbitMQ and writes them in batches.
+    A batch is flushed when it is full or when its oldest message
+    has waited longer than the linger time. The whole batch is then
+    acknowledged at once with multiple=True.
+    """
+
+    def __init__(self, connection, channel, queue_names, lag, retrier, batch_size, linger_seconds):
+        super().__init__(connection, channel, queue_names, lag, retrier)
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.pending = []          # (method, properties, received_at, body)
+        self.first_pending_at = 0  # monotonic time of the oldest buffered message
+
+    def on_message(self, ch, method, properties, body):
+        if breaker.is_open:
+            # Delivered before consumption was paused
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-            print("WORKET: Message processing failed. Re-queuing.")
+            return
+        self.lag.record(properties)
+        if not self.pending:
+            self.first_pending_at = time.monotonic()
+        self.pending.append((method, properties, time.time(), body))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
 
-    except json.JSONDecodeError:
-        print("WORKER: Failed to decode JSON. Discarding message.")
-        ch.basic_ack(delivery_tag=method.delivery_tag) # Discard bad JSON
+    def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+
+        messages = []
+        for _, properties, received_at, body in batch:
+            try:
+                data = decode_message(body, properties.content_type)
+            except (MalformedBody, UnsupportedEncoding) as e:
+                print(f"WORKER: Failed to decode message in batch: {e}. Discarding.")
+                continue
+            if not isinstance(data, dict):
+                continue
+
+            if data.get("type") == "batch":
+                # Agent-side batches are flattened into the worker batch
+                messages.extend(
+                    (received_at, item) for item in data.get("items") or []
+                    if isinstance(item, dict)
+                )
+            else:
+                messages.append((received_at, data))
+
+        last_tag = batch[-1][0].delivery_tag
+        if write_batch(messages):
+            self.channel.basic_ack(delivery_tag=last_tag, multiple=True)
+            print(f"WORKER: Batch of {len(batch)} messages written and acknowledged.")
+            return
+
+        if not check_db_connection():
+            # Nothing wrong with the messages; they wait in the queue
+            breaker.trip()
+            self.channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+            return
+
+        # The batch failed as a whole (e.g. one row breaks a constraint).
+        # Fall back to one message at a time so a single bad message can't
+        # hold back everything else in the batch.
+        print(f"WORKER: Batch of {len(batch)} failed. Falling back to per-message processing.")
+        for method, properties, _, body in batch:
+            handle_message(self.channel, method, properties, body, self.retrier)
+
+    def wait_time(self):
+        if not self.pending:
+            return self.linger_seconds
+        waited = time.monotonic() - self.first_pending_at
+        return max(0, self.linger_seconds - waited)
+
+    def idle(self):
+        if self.pending and time.monotonic() - self.first_pending_at >= self.linger_seconds:
+            self.flush()
+
+# --- Queue Lag ---
+
+class LagTracker:
+    """
+    Measures how long messages waited in the queue before this worker
+    got them (the API stamps each one with 'published_at') and prints
+    a summary every LAG_REPORT_INTERVAL seconds. A lag that keeps
+    growing means this shard can't keep up.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reported_at = time.monotonic()
+
+    def record(self, properties):
+        published_at = (properties.headers or {}).get("published_at")
+        if published_at is None or retry_count(properties):
+            # Retried messages waited on purpose
+            return
+        lag = max(0.0, time.time() - published_at)
+        self.count += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+
+    def maybe_report(self):
+        now = time.monotonic()
+        if now - self.reported_at < LAG_REPORT_INTERVAL:
+            return
+        if self.count:
+            print(f"WORKER [{self.label}]: {self.count} messages in {now - self.reported_at:.0f}s, "
+                  f"queue lag avg {self.total / self.count:.2f}s, max {self.max:.2f}s")
+        self.count, self.total, self.max = 0, 0.0, 0.0
+        self.reported_at = now
+
+# --- Main Worker Loop ---
+
+def handle_message(ch, method, properties, body, retrier):
+    """
+    Processes one raw message and acknowledges it, sends it to be
+    retried later, or - if the database is down - puts it back on its
+    queue and opens the circuit breaker.
+    """
+    if breaker.is_open:
+        # Delivered before consumption was paused; it keeps its place in the queue
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        return
+
+    try:
+        data = decode_message(body, properties.content_type)
+        success = route_message(data)
+    except (MalformedBody, UnsupportedEncoding) as e:
+        print(f"WORKER: Failed to decode message: {e}. Discarding.")
+        ch.basic_ack(delivery_tag=method.delivery_tag) # Discard undecodable messages
+        return
     except Exception as e:
         print(f"WORKER: Unhandled error in callback: {e}. Discarding.")
         ch.basic_ack(delivery_tag=method.delivery_tag) # Discard
+        return
 
+    if success:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        print("WORKER: Message processed and acknowledged.")
+    elif not check_db_connection():
+        breaker.trip()
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+    else:
+        # The database is fine, so it's this message; try it again later
+        destination = retrier.retry_later(method.routing_key, properties, body, last_write_error)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        print(f"WORKER: Message processing failed. Moved to '{destination}'.")
 
-def main():
+def consume(queue_names, label):
     """
-Main function to start the worker.
-    Connects to RabbitMQ and starts consuming messages.
+    Connects to RabbitMQ and consumes the given queues, reconnecting
+    whenever the connection is lost.
     """
-    print("--- Starting Database Worker ---")
+    lag = LagTracker(label)
+    delays = parse_delays(settings.WORKER_RETRY_DELAYS)
     while True:
         try:
-            print("Connecting to RabbitMQ...")
+            print(f"Connecting to RabbitMQ ({label})...")
             creds = pika.PlainCredentials(settings.MQ_USER, settings.MQ_PASSWORD)
             params = pika.ConnectionParameters(host=settings.MQ_HOST, credentials=creds)
             connection = pika.BlockingConnection(params)
             channel = connection.channel()
 
-            channel.queue_declare(queue=METRICS_QUEUE_NAME, durable=True)
-            
-            # Only fetch one message at a time
-            channel.basic_qos(prefetch_count=1) 
-            
-            channel.basic_consume(
-                queue=METRICS_QUEUE_NAME,
-                on_message_callback=mq_callback
-            )
+            for name in queue_names:
+                channel.queue_declare(queue=name, durable=True)
+            declare_retry_topology(channel, delays)
+            retrier = Retrier(connection.channel(), delays, settings.WORKER_MAX_RETRIES)
+
+            schedule_flushes(connection)
 
-            print("Worker is now waiting for messages. To exit press CTRL+C")
-            channel.start_consuming()
+            if settings.WORKER_BATCH_SIZE > 1:
+                # Prefetch a full batch so the broker keeps us busy
+                channel.basic_qos(prefetch_count=settings.WORKER_BATCH_SIZE)
+                consumer = BatchConsumer(
+                    connection, channel, queue_names, lag, retrier,
+                    batch_size=settings.WORKER_BATCH_SIZE,
+                    linger_seconds=settings.WORKER_BATCH_LINGER_MS / 1000
+                )
+                print(f"Worker [{label}] is now waiting for messages on {', '.join(queue_names)} "
+                      f"(batch size {settings.WORKER_BATCH_SIZE}, "
+                      f"linger {settings.WORKER_BATCH_LINGER_MS}ms). To exit press CTRL+C")
+            else:
+                # Only fetch one message at a time
+                channel.basic_qos(prefetch_count=1)
+                consumer = MessageConsumer(connection, channel, queue_names, lag, retrier)
+                print(f"Worker [{label}] is now waiting for messages on {', '.join(queue_names)}. "
+                      f"To exit press CTRL+C")
+            consumer.run()
 
         except pika.exceptions.AMQPConnectionError as e:
             print(f"Failed to connect to RabbitMQ: {e}. Retrying in 5s...")
             time.sleep(5)
         except KeyboardInterrupt:
-            print("Worker shutting down.")
+            print(f"Worker [{label}] shutting down.")
+            flush_last_seen()
+            flush_latest_state()
+            refresh_late_rollups()
             if 'connection' in locals() and connection.is_open:
                 connection.close()
             sys.exit(0)
@@ -263,5 +855,79 @@ Main function to start the worker.
             print(f"An unexpected error occurred: {e}. Restarting in 10s...")
             time.sleep(10)
 
+# --- Worker Pool ---
+
+def shard_queues(shard, shards):
+    """The queues one shard's worker consumes."""
+    queues = [shard_queue_name(shard, shards)]
+    if shard == 0 and shards > 1:
+        # Also drain anything published before the pool was enabled
+        queues.append(METRICS_QUEUE_NAME)
+    return queues
+
+def interrupt_on_sigterm():
+    """
+    Handles SIGTERM ('docker stop', or the pool stopping its shards) like
+    CTRL+C, so consume() flushes last_seen and agent_latest before exiting.
+    """
+    def interrupt(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
+def run_shard(shard, shards):
+    """Entry point of one worker process."""
+    interrupt_on_sigterm()
+    consume(shard_queues(shard, shards), f"shard {shard}")
+
+def run_pool(shards):
+    """
+    Runs one worker process per shard, each with its own RabbitMQ
+    connection and database pool, and restarts any that dies.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+
+    # 'docker stop' sends SIGTERM; exit cleanly so the shards are stopped too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            for shard in range(shards):
+                process = processes.get(shard)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    print(f"Worker for shard {shard} exited with code {process.exitcode}. Restarting...")
+                process = context.Process(
+                    target=run_shard, args=(shard, shards),
+                    name=f"worker-shard-{shard}", daemon=True
+                )
+                process.start()
+                processes[shard] = process
+            time.sleep(5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Worker pool shutting down.")
+        # Each shard flushes its pending last_seen and latest values on SIGTERM
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
+
+def main():
+    """
+Main function to start the worker.
+    Connects to RabbitMQ and starts consuming messages, in this process
+    or, with WORKER_SHARDS > 1, in one process per shard.
+    """
+    print("--- Starting Database Worker ---")
+    apply_storage_policies()
+    if settings.WORKER_SHARDS > 1:
+        print(f"Starting {settings.WORKER_SHARDS} worker processes...")
+        run_pool(settings.WORKER_SHARDS)
+    else:
+        interrupt_on_sigterm()
+        consume([METRICS_QUEUE_NAME], "worker")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file